@@ -1,6 +1,64 @@
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Dict, Tuple
+
 import alpaca_trade_api as tradeapi
 import pandas as pd
 from creds import AlpakaCreds
+from structured_logger import get_logger
+
+logger = get_logger("alpaka")
+
+FINAL_ORDER_STATUSES = {"filled", "canceled", "expired", "rejected", "replaced", "done_for_day"}
+
+
+class OrderIndex:
+    """
+    Local order book keyed by (symbol, side) holding the filled quantity of every filled order seen so far.
+    Each order is indexed once by id, a later version of the same order replaces its previous contribution
+    """
+
+    def __init__(self):
+        self.orders: Dict[str, object] = {}
+        self.filled_qty: Dict[Tuple[str, str], int] = defaultdict(int)
+        self.pending_ids = set()
+        self.lock = Lock()
+
+    def update(self, order):
+        """Index a new or changed order (alpaka Order object)"""
+        with self.lock:
+            previous = self.orders.get(order.id)
+            if previous is not None and previous.status == 'filled':
+                self.filled_qty[(previous.symbol, previous.side)] -= int(previous.qty)
+            self.orders[order.id] = order
+            if order.status == 'filled':
+                self.filled_qty[(order.symbol, order.side)] += int(order.qty)
+            if order.status in FINAL_ORDER_STATUSES:
+                self.pending_ids.discard(order.id)
+            else:
+                self.pending_ids.add(order.id)
+
+    def seed(self, orders):
+        for order in orders:
+            self.update(order)
+
+    def get_filled_qty(self, symbol: str, side: str) -> int:
+        with self.lock:
+            return self.filled_qty.get((symbol, side), 0)
+
+    def has_filled(self, symbol: str, side: str) -> bool:
+        return self.get_filled_qty(symbol, side) > 0
+
+    def get_pending_ids(self):
+        with self.lock:
+            return list(self.pending_ids)
+
+    def get_pending_orders(self):
+        """Last seen version of the orders which were still open"""
+        with self.lock:
+            return [self.orders[order_id] for order_id in self.pending_ids]
 
 
 class AlpakaTrader:
@@ -9,10 +67,19 @@ class AlpakaTrader:
     COMPANY_FETCH_ERROR = "NOT FOUND"
     SHORTABLE_FETCH_ERROR = "NOT FOUND"
 
-    def __init__(self, alpaka_creds: AlpakaCreds):
+    def __init__(self, alpaka_creds: AlpakaCreds, quote_ttl_sec=2, max_parallel_requests=8):
+        """
+        :param quote_ttl_sec: live prices younger than this are reused by the pending order table
+        :param max_parallel_requests: upper bound of concurrent live price requests
+        """
         self.authorized_alpaka_api = self.authorize_alpaka_api(alpaka_creds)
         self.alpaka_account_info = self.get_alpaka_account()
         self.symbol_asset = None
+        self.quote_ttl_sec = quote_ttl_sec
+        self.max_parallel_requests = max_parallel_requests
+        self.quote_cache: Dict[str, tuple] = {}
+        self.quote_cache_lock = Lock()
+        self.order_index = None
 
     def authorize_alpaka_api(self, alpaka_creds: AlpakaCreds):
         """
@@ -29,53 +96,69 @@ class AlpakaTrader:
 
     def fetch_client_info_data(self):
         list_order = self.authorized_alpaka_api.list_orders(status='all')
-        df = pd.DataFrame()
-        ticker = []
-        action = []
-        share = []
-        fill_price = []
-        live_price = []
-        status = []
-        pending = []
-        click_to_close = []
-        click_to_close_market = []
-
-        # Adding columns manually
-        ticker.append("Ticker")
-        action.append("Action")
-        share.append("Share")
-        fill_price.append("Fill Price")
-        live_price.append("Live Price")
-        status.append("Status")
-        pending.append("Pending")
-        click_to_close.append("Click to close")
-        click_to_close_market.append("Click to close market")
-
-        print("Fetching pending order table")
-        for i in range(0, len(list_order)):
-            ticker.append(list_order[i].symbol)
-            action.append(list_order[i].side)
-            share.append(str(list_order[i].qty))
-            fill_price.append(str(list_order[i].filled_avg_price))
-            live_price.append(str(self.authorized_alpaka_api.get_last_trade(list_order[i].symbol).price))
-            status.append(list_order[i].status)
-            pending.append("pending")
-            click_to_close.append("close")
-            click_to_close_market.append("close market")
-
-        # Another column are added. Two sets of column is added, just for the help
-        df["Ticker"] = ticker
-        df["Action"] = action
-        df["Share"] = share
-        df["Fill Price"] = fill_price
-        df["Live Price"] = live_price
-        df["Status"] = status
-        df["Pending"] = pending
-        df["Click to close"] = click_to_close
-        df["Click to close market"] = click_to_close_market
-        print("Pending order table fetched")
+        logger.debug("pending_order_table_fetching", orders=len(list_order))
+        live_prices = self.get_live_prices({order.symbol for order in list_order})
+        # First row repeats the column names, the client table reads its header from it
+        columns = {
+            "Ticker": [order.symbol for order in list_order],
+            "Action": [order.side for order in list_order],
+            "Share": [str(order.qty) for order in list_order],
+            "Fill Price": [str(order.filled_avg_price) for order in list_order],
+            "Live Price": [str(live_prices.get(order.symbol)) for order in list_order],
+            "Status": [order.status for order in list_order],
+            "Pending": ["pending"] * len(list_order),
+            "Click to close": ["close"] * len(list_order),
+            "Click to close market": ["close market"] * len(list_order),
+        }
+        df = pd.DataFrame({name: [name] + values for name, values in columns.items()})
+        logger.debug("pending_order_table_fetched", orders=len(list_order))
         return df
 
+    def get_live_prices(self, symbols) -> Dict[str, float]:
+        """
+        Latest trade price of every symbol. Prices younger than quote_ttl_sec are served from the quote cache,
+        the rest are fetched in one multi symbol request when the api supports it, otherwise concurrently
+        :param symbols: iterable of symbols, duplicates are fetched once
+        :return: {symbol: price}. Symbols which could not be fetched are missing
+        """
+        now = time.monotonic()
+        prices = {}
+        missing = []
+        with self.quote_cache_lock:
+            for symbol in set(symbols):
+                cached = self.quote_cache.get(symbol)
+                if cached is not None and now - cached[1] < self.quote_ttl_sec:
+                    prices[symbol] = cached[0]
+                else:
+                    missing.append(symbol)
+        if len(missing) == 0:
+            return prices
+
+        fetched = {}
+        if hasattr(self.authorized_alpaka_api, "get_latest_trades"):
+            try:
+                trades = self.authorized_alpaka_api.get_latest_trades(missing)
+                fetched = {symbol: trade.price for symbol, trade in trades.items()}
+            except Exception as e:
+                logger.warning("latest_trades_failed", symbols=len(missing), error=str(e))
+        if len(fetched) == 0:
+            def fetch(symbol):
+                try:
+                    return symbol, self.authorized_alpaka_api.get_last_trade(symbol).price
+                except Exception:
+                    return symbol, None
+
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_requests, len(missing))) as executor:
+                fetched = {symbol: price for symbol, price in executor.map(fetch, missing) if price is not None}
+
+        # The cache is only filled here on the calling thread, the fetch workers just return prices
+        fetched_at = time.monotonic()
+        with self.quote_cache_lock:
+            for symbol, price in fetched.items():
+                self.quote_cache[symbol] = (price, fetched_at)
+        prices.update(fetched)
+        return prices
+
     def get_alpaka_account(self):
         """
         considering that self.authorized_alpaka_api object is created and valid
@@ -125,6 +208,13 @@ class AlpakaTrader:
         """
         return self.symbol_asset.symbol
 
+    def _submit_order(self, **order_params):
+        """Submit order and add it to the order index if already seeded"""
+        order = self.authorized_alpaka_api.submit_order(**order_params)
+        if self.order_index is not None:
+            self.order_index.update(order)
+        return order
+
     def buy_order(self, order_type, symbol, quantity, **kwargs):
         """
         Buy some given quantity of given symbol based on given order_type
@@ -138,7 +228,7 @@ class AlpakaTrader:
         :return: Order Object
         """
         if order_type == 'market':
-            return self.authorized_alpaka_api.submit_order(
+            return self._submit_order(
                 symbol=symbol,
                 qty=quantity,
                 side='buy',
@@ -147,7 +237,7 @@ class AlpakaTrader:
             )
         elif order_type == 'limit':
             limit_price = str(float(kwargs["limit_price"]))
-            return self.authorized_alpaka_api.submit_order(
+            return self._submit_order(
                 symbol=symbol,
                 qty=quantity,
                 side='buy',
@@ -158,7 +248,7 @@ class AlpakaTrader:
         elif order_type == "stop_limit":
             limit_price = str(float(kwargs["limit_price"]))
             stop_price = str(float(kwargs["stop_price"]))
-            return self.authorized_alpaka_api.submit_order(
+            return self._submit_order(
                 symbol=symbol,
                 qty=quantity,
                 side='buy',
@@ -182,7 +272,7 @@ class AlpakaTrader:
         """
 
         if order_type == 'market':
-            return self.authorized_alpaka_api.submit_order(
+            return self._submit_order(
                 symbol=symbol,
                 qty=quantity,
                 side='sell',
@@ -191,7 +281,7 @@ class AlpakaTrader:
             )
         elif order_type == 'limit':
             limit_price = str(float(kwargs["limit_price"]))
-            return self.authorized_alpaka_api.submit_order(
+            return self._submit_order(
                 symbol=symbol,
                 qty=quantity,
                 side='sell',
@@ -202,7 +292,7 @@ class AlpakaTrader:
         elif order_type == "stop_limit":
             limit_price = str(float(kwargs["limit_price"]))
             stop_price = str(float(kwargs["stop_price"]))
-            return self.authorized_alpaka_api.submit_order(
+            return self._submit_order(
                 symbol=symbol,
                 qty=quantity,
                 side='sell',
@@ -212,39 +302,84 @@ class AlpakaTrader:
                 stop_price=stop_price
             )
 
-    def double_buy_sell_checker(self, symbol):
-        order_list_all = self.authorized_alpaka_api.list_orders(status='all')
-        for i in range(0, len(order_list_all)):
-            if order_list_all[i].status == ('partially_filled' and 'filled'):
-                if (order_list_all[i].symbol == symbol) and (order_list_all[i].side == 'sell'):
-                    return True, order_list_all
+    def get_order_index(self) -> OrderIndex:
+        """Order index seeded once from the order history, then kept up to date from placed orders and fills"""
+        if self.order_index is None:
+            order_index = OrderIndex()
+            order_index.seed(self.authorized_alpaka_api.list_orders(status='all'))
+            self.order_index = order_index
+        return self.order_index
+
+    def refresh_pending_orders(self, max_orders=500):
+        """
+        Refresh the orders which were still open when last seen, with one request for the open orders and one for
+        the orders closed since the oldest of them was submitted. Only the ones missing from both are fetched by id
+        :param max_orders: page size of the list requests (the alpaka maximum is 500)
+        """
+        order_index = self.get_order_index()
+        pending_orders = order_index.get_pending_orders()
+        if not pending_orders:
+            return
+        pending_ids = {order.id for order in pending_orders}
+        try:
+            open_orders = self.authorized_alpaka_api.list_orders(status='open', limit=max_orders)
+        except Exception as e:
+            logger.warning("open_orders_refresh_failed", pending=len(pending_ids), error=str(e))
+            return
+        for order in open_orders:
+            order_index.update(order)
+            pending_ids.discard(order.id)
+        if pending_ids:
+            submitted = [pd.Timestamp(order.submitted_at) for order in pending_orders if order.id in pending_ids]
+            after = (min(submitted) - pd.Timedelta(seconds=1)).isoformat()
+            try:
+                closed_orders = self.authorized_alpaka_api.list_orders(status='closed', after=after,
+                                                                       direction='asc', limit=max_orders)
+            except Exception:
+                closed_orders = []
+            for order in closed_orders:
+                order_index.update(order)
+                pending_ids.discard(order.id)
+        for order_id in pending_ids:
+            try:
+                order_index.update(self.authorized_alpaka_api.get_order(order_id))
+            except Exception as e:
+                logger.warning("order_refresh_failed", order_id=order_id, error=str(e))
+
+    def on_trade_update(self, order):
+        """Feed order updates (e.g. from the alpaka trade_updates stream) to the order index"""
+        self.get_order_index().update(order)
 
+    def double_buy_sell_checker(self, symbol):
+        self.refresh_pending_orders()
+        if self.order_index.has_filled(symbol, 'sell'):
+            return True, self.order_index
         return False
 
-    def double_buy(self, order_list_all, order_type, symbol, **kwargs):
+    def double_buy(self, order_list_all=None, order_type=None, symbol=None, **kwargs):
+        """
+        :param order_list_all: optional orders to index before buying. The order index is used otherwise
+        """
         print(order_type, symbol, kwargs)
-        amount_of_stock = 0
-        # measuring amount of stock here
-        for i in range(0, len(order_list_all)):
-            if (order_list_all[i].status == 'filled') and (order_list_all[i].side == 'sell') and (
-                    order_list_all[i].symbol == symbol):
-                amount_of_stock = amount_of_stock + int(order_list_all[i].qty)
+        if isinstance(order_list_all, OrderIndex) or order_list_all is None:
+            self.refresh_pending_orders()
+        else:
+            self.get_order_index().seed(order_list_all)
+        amount_of_stock = self.order_index.get_filled_qty(symbol, 'sell')
         print("Clicking Buy order")
         self.buy_order(order_type, symbol, (amount_of_stock * 2), **kwargs)
         print("Bought")
 
-    def double_sell(self, order_list_all, order_type, symbol, **kwargs):
-        sold_stock = 0
-        bought_stock = 0
-        # measuring amount of stock here
-        for i in range(0, len(order_list_all)):
-            if (order_list_all[i].status == 'filled') and (order_list_all[i].side == 'sell') and (
-                    order_list_all[i].symbol == symbol):
-                sold_stock = sold_stock + int(order_list_all[i].qty)
-            if (order_list_all[i].status == 'filled') and (order_list_all[i].side == 'buy') and (
-                    order_list_all[i].symbol == symbol):
-                bought_stock = bought_stock + int(order_list_all[i].qty)
-
+    def double_sell(self, order_list_all=None, order_type=None, symbol=None, **kwargs):
+        """
+        :param order_list_all: optional orders to index before selling. The order index is used otherwise
+        """
+        if isinstance(order_list_all, OrderIndex) or order_list_all is None:
+            self.refresh_pending_orders()
+        else:
+            self.get_order_index().seed(order_list_all)
+        sold_stock = self.order_index.get_filled_qty(symbol, 'sell')
+        bought_stock = self.order_index.get_filled_qty(symbol, 'buy')
         self.sell_order(order_type, symbol, (bought_stock - sold_stock), **kwargs)
 
     def get_symbol_order_history(self, status="FILL"):
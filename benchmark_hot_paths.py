@@ -0,0 +1,321 @@
+"""
+Micro benchmarks of the strategy hot paths, driven by synthetic (seeded) or recorded minute bars.
+Every benchmark reports the best mean time per call over the repeats. Results can be saved and compared with a
+previous run to catch regressions.
+Run: python benchmark_hot_paths.py --save benchmark_results/baseline.json
+     python benchmark_hot_paths.py --compare benchmark_results/baseline.json --threshold 10
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from datetime import datetime
+from typing import Callable, Dict, List
+
+from custom_time import CustomTimeZone
+from data_processor import TimePipe, TimeRangeCreator
+from indicators import INDICATOR_FIELDS, MinuteBarEnricher
+from strategy import Formula1, Formula3, Formula4, WebSocketAggProvider
+from structured_logger import configure_logging, shutdown_logging
+from trader import SimulatedTrader
+
+# 09:30 New York of a trading day, in ms
+SESSION_START_MS = 1628775000000
+FORMULAS = (("formula1", Formula1), ("formula3", Formula3), ("formula4", Formula4))
+RESULTS_VERSION = 1
+
+
+def make_minute_bars(symbol: str, count: int, rng: random.Random, start_ms=SESSION_START_MS):
+    """Random walk AM bars. Prices move enough for is_worthy and the intersections to be exercised"""
+    bars = []
+    price = round(rng.uniform(2, 40), 2)
+    av = 0
+    for i in range(count):
+        o = price
+        c = max(round(o * (1 + rng.gauss(0, 0.01)), 2), 0.05)
+        h = round(max(o, c) + rng.uniform(0.01, 0.1), 2)
+        l = max(round(min(o, c) - rng.uniform(0.01, 0.1), 2), 0.01)
+        v = rng.randint(1000, 50000)
+        av += v
+        start = start_ms + i * 60000
+        bars.append({"ev": "AM", "sym": symbol, "v": v, "av": av, "op": bars[0]['o'] if bars else o,
+                     "vw": round((o + c) / 2, 4), "o": o, "c": c, "h": h, "l": l, "a": c, "z": 100,
+                     "s": start, "e": start + 60000})
+        price = c
+    return bars
+
+
+def make_second_data(bar: dict, second: int):
+    start = bar['s'] + second * 1000
+    return {"ev": "A", "sym": bar['sym'], "v": bar['v'] // 60, "av": bar['av'], "op": bar['op'], "vw": bar['vw'],
+            "o": bar['o'], "c": bar['c'], "h": bar['h'], "l": bar['l'], "a": bar['a'], "z": 100, "s": start,
+            "e": start + 1000}
+
+
+def load_recorded_bars(path: str, symbols: List[str]):
+    """
+    Minute bars of a json list (e.g. a buy_sell_data file). Indicators computed by a formula or the feed server
+    are dropped, and every benchmark symbol replays the same bars
+    """
+    with open(path) as file:
+        recorded = json.load(file)
+    recorded = sorted(recorded, key=lambda bar: bar['s'])
+    return {symbol: [dict({key: value for key, value in bar.items() if key not in INDICATOR_FIELDS}, sym=symbol)
+                     for bar in recorded] for symbol in symbols}
+
+
+def measure_ns(prepare: Callable[[int], Callable[[], object]], number: int, repeat: int):
+    """
+    Best mean ns per call of the repeats. timeit turns the garbage collector off while timing
+    :param prepare: builds fresh state for number calls and returns the callable doing one call
+    """
+    best = None
+    for _ in range(repeat):
+        call = prepare(number)
+        per_call = timeit.Timer(call).timeit(number) / number * 1e9
+        if best is None or per_call < best:
+            best = per_call
+    return best
+
+
+class HotPathBenchmarks:
+    def __init__(self, series: Dict[str, List[dict]]):
+        """:param series: minute bars of every symbol"""
+        self.series = series
+        self.symbols = list(series)
+        self.enriched = {}
+        enricher = MinuteBarEnricher()
+        enricher.enrich([{"ev": "status", "message": f"subscribed to: AM.{symbol}"} for symbol in self.symbols])
+        for symbol, bars in series.items():
+            self.enriched[symbol] = [dict(bar) for bar in bars]
+            enricher.enrich(self.enriched[symbol])
+
+    def new_formula(self, formula_class):
+        formula = formula_class(SimulatedTrader(), socket_key="1111", socket_uri="ws://127.0.0.1:8000/api/ws/",
+                                ban_mode=False, max_positions=len(self.symbols))
+        for symbol in self.symbols:
+            formula.new_subscribed(symbol, "AM")
+        return formula
+
+    def bar_stream(self, number: int, enriched=False):
+        """number (bar copy, symbol) pairs in time order, cycling through the symbols"""
+        series = self.enriched if enriched else self.series
+        length = min(len(bars) for bars in series.values())
+        return [(dict(series[self.symbols[i % len(self.symbols)]][(i // len(self.symbols)) % length]),
+                 self.symbols[i % len(self.symbols)]) for i in range(number)]
+
+    def on_minute_data_received(self, formula_class, enriched=False):
+        def prepare(number):
+            formula = self.new_formula(formula_class)
+            stream = iter(self.bar_stream(number, enriched))
+            on_minute = formula.on_minute_data_received
+            return lambda: on_minute(*next(stream))
+
+        return prepare
+
+    def warmed_formula(self, formula_class, bars_per_symbol=30):
+        formula = self.new_formula(formula_class)
+        for minute_data, symbol in self.bar_stream(bars_per_symbol * len(self.symbols)):
+            formula.on_minute_data_received(minute_data, symbol)
+        return formula
+
+    def on_second_data_received(self, formula_class, trying_buy: bool):
+        """Symbol not followed, or trying to buy at a price the seconds do not reach"""
+
+        def prepare(number):
+            formula = self.warmed_formula(formula_class)
+            events = formula.buy_sell_events
+            for symbol in self.symbols:
+                # Drop the buys the warm up bars started
+                events.discard_position(symbol)
+                if trying_buy:
+                    events.try_to_buy(symbol, 1000000.0, current_timestamp=0)
+            seconds = []
+            for i in range(number):
+                symbol = self.symbols[i % len(self.symbols)]
+                bar = formula.processed_minute_data[symbol][-1]
+                seconds.append((make_second_data(bar, (i // len(self.symbols)) % 60), symbol))
+            stream = iter(seconds)
+            on_second = formula.on_second_data_received
+            return lambda: on_second(*next(stream))
+
+        return prepare
+
+    def formula_method(self, formula_class, method: str, *args):
+        def prepare(number):
+            formula = self.warmed_formula(formula_class)
+            symbol = self.symbols[0]
+            func = getattr(formula, method)
+            if method == "is_worthy":
+                return lambda: func(symbol)
+            bars = formula.processed_minute_data[symbol]
+            return lambda: func(symbol, bars, *args)
+
+        return prepare
+
+    def tz_time_date(self):
+        def prepare(number):
+            custom_time = CustomTimeZone(CustomTimeZone.CLIENT_LOCATION)
+            stamps = iter([SESSION_START_MS + i * 1000 for i in range(number)])
+            return lambda: custom_time.get_tz_time_date_from_timestamp(next(stamps))
+
+        return prepare
+
+    @staticmethod
+    def time_range_get_dict(start_time: str, end_time: str, interval_sec: int):
+        def prepare(number):
+            creator = TimeRangeCreator(start_time=start_time, end_time=end_time, interval_sec=interval_sec)
+            return creator.get_dict
+
+        return prepare
+
+    def time_pipe_push(self):
+        def prepare(number):
+            pipe = TimePipe(keep_minutes=19, min_keys=('l',), sum_keys=('v',))
+            bars = self.series[self.symbols[0]]
+            seconds = iter([(make_second_data(bars[(i // 60) % len(bars)], i % 60), SESSION_START_MS + i * 1000)
+                            for i in range(number)])
+            return lambda: pipe.push(*next(seconds))
+
+        return prepare
+
+    def provider_on_data_received(self, events_per_frame=20):
+        def prepare(number):
+            provider = WebSocketAggProvider(key="1111", uri="ws://127.0.0.1:8000/api/ws/")
+            provider.attach_on_second_data_received_listener(lambda second_data, symbol: None)
+            bars = [bars[0] for bars in self.series.values()]
+            frame = json.dumps([make_second_data(bars[i % len(bars)], 0) for i in range(events_per_frame)])
+            return lambda: provider.on_data_received(frame)
+
+        return prepare
+
+    def all(self):
+        """name: (prepare, calls per repeat)"""
+        benchmarks = {}
+        for name, formula_class in FORMULAS:
+            benchmarks[f"{name}.on_minute_data_received"] = (self.on_minute_data_received(formula_class), 2000)
+            benchmarks[f"{name}.on_minute_data_received (enriched bars)"] = (
+                self.on_minute_data_received(formula_class, enriched=True), 2000)
+            benchmarks[f"{name}.on_second_data_received (not followed)"] = (
+                self.on_second_data_received(formula_class, trying_buy=False), 20000)
+            benchmarks[f"{name}.on_second_data_received (trying buy)"] = (
+                self.on_second_data_received(formula_class, trying_buy=True), 20000)
+            benchmarks[f"{name}.set_sma"] = (self.formula_method(formula_class, "set_sma", 'c'), 20000)
+            benchmarks[f"{name}.set_ema"] = (self.formula_method(formula_class, "set_ema", 'c', 'sma'), 20000)
+            benchmarks[f"{name}.is_worthy"] = (self.formula_method(formula_class, "is_worthy"), 20000)
+        benchmarks["CustomTimeZone.get_tz_time_date_from_timestamp"] = (self.tz_time_date(), 20000)
+        benchmarks["TimeRangeCreator.get_dict (minutes)"] = (
+            self.time_range_get_dict("06:03:00", "14:55:00", 60), 200)
+        benchmarks["TimeRangeCreator.get_dict (seconds)"] = (
+            self.time_range_get_dict("16:59:00", "23:59:59", 1), 20)
+        benchmarks["TimePipe.push"] = (self.time_pipe_push(), 20000)
+        benchmarks["WebSocketAggProvider.on_data_received (20 events)"] = (self.provider_on_data_received(), 5000)
+        return benchmarks
+
+
+def git_commit():
+    try:
+        res = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                             cwd=os.path.dirname(os.path.abspath(__file__)))
+        return res.stdout.strip() or None
+    except:
+        return None
+
+
+def run(benchmarks: dict, only: str = None, repeat=5, scale=1.0):
+    results = {}
+    for name, (prepare, number) in benchmarks.items():
+        if only is not None and only not in name:
+            continue
+        number = max(int(number * scale), 1)
+        results[name] = {"ns_per_call": round(measure_ns(prepare, number, repeat), 1), "calls": number,
+                         "repeat": repeat}
+    return results
+
+
+def compare(results: dict, baseline: dict, threshold_percent: float):
+    """:return: names slower than the baseline by more than threshold_percent"""
+    regressions = []
+    print(f"{'benchmark':<58}{'ns/call':>12}{'baseline':>12}{'change':>10}")
+    for name, result in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            print(f"{name:<58}{result['ns_per_call']:>12.1f}{'-':>12}{'new':>10}")
+            continue
+        change = (result['ns_per_call'] / previous['ns_per_call'] - 1) * 100
+        regressed = change > threshold_percent
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<58}{result['ns_per_call']:>12.1f}{previous['ns_per_call']:>12.1f}{change:>+9.1f}%"
+              + ("  REGRESSION" if regressed else ""))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--bars", default=None, help="json list of recorded minute bars instead of synthetic ones")
+    parser.add_argument("--symbols", type=int, default=10)
+    parser.add_argument("--bars-per-symbol", type=int, default=390)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies the calls of every benchmark")
+    parser.add_argument("--only", default=None, help="run the benchmarks whose name contains this text")
+    parser.add_argument("--save", default=None, help="write the results to this json file")
+    parser.add_argument("--compare", default=None, help="results file of a previous run")
+    parser.add_argument("--threshold", type=float, default=10.0, help="slowdown percent reported as a regression")
+    args = parser.parse_args()
+
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    if args.bars is not None:
+        series = load_recorded_bars(args.bars, symbols)
+    else:
+        rng = random.Random(args.seed)
+        series = {symbol: make_minute_bars(symbol, args.bars_per_symbol, rng) for symbol in symbols}
+    save_path = os.path.abspath(args.save) if args.save is not None else None
+    baseline_path = os.path.abspath(args.compare) if args.compare is not None else None
+
+    # Formulas write their buy_sell_data folders to the working directory. Intersection logs are below the level
+    cwd = os.getcwd()
+    configure_logging(level=logging.WARNING)
+    with tempfile.TemporaryDirectory() as temp_dir:
+        os.chdir(temp_dir)
+        try:
+            st = time.perf_counter()
+            results = run(HotPathBenchmarks(series).all(), only=args.only, repeat=args.repeat, scale=args.scale)
+            elapsed_sec = time.perf_counter() - st
+        finally:
+            os.chdir(cwd)
+    shutdown_logging()
+
+    report = {"version": RESULTS_VERSION, "created_at": datetime.now().isoformat(timespec="seconds"),
+              "commit": git_commit(), "python": platform.python_version(), "machine": platform.machine(),
+              "bars": args.bars or f"synthetic seed {args.seed}", "results": results}
+    regressions = []
+    if baseline_path is not None:
+        with open(baseline_path) as file:
+            baseline = json.load(file)
+        print(f"Compared with {baseline_path} (commit {baseline.get('commit')})")
+        regressions = compare(results, baseline["results"], args.threshold)
+    else:
+        print(f"{'benchmark':<58}{'ns/call':>12}")
+        for name, result in results.items():
+            print(f"{name:<58}{result['ns_per_call']:>12.1f}")
+    print(f"Finished in {elapsed_sec:.1f} s")
+    if save_path is not None:
+        os.makedirs(os.path.dirname(save_path), exist_ok=True)
+        with open(save_path, "w") as file:
+            json.dump(report, file, indent=2)
+    if regressions:
+        print(f"{len(regressions)} regression(s) above {args.threshold} %")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+"""
+Measures the frame hot path throughput (json decode + client storage) with different logging setups.
+Every setup writes to the same temporary file; printing to a terminal is slower than the numbers shown here.
+Run: python benchmark_logging.py
+"""
+import contextlib
+import json
+import logging
+import os
+import tempfile
+import time
+
+from stock_data import RealTimeDataStorageForWebSocketClients
+from structured_logger import configure_logging, dropped_log_records, get_logger, shutdown_logging
+
+
+def make_frame(n_events=20):
+    now = int(time.time() * 1000)
+    return json.dumps([{"ev": "A", "sym": f"SYM{i}", "v": 100, "av": 1000, "op": 1.0, "vw": 1.01, "o": 1.0,
+                        "c": 1.02, "h": 1.03, "l": 0.99, "a": 1.01, "z": 10, "s": now, "e": now + 1000}
+                       for i in range(n_events)])
+
+
+def run_hot_path(frames: int, frame: str, log_frame, repeat=3):
+    """Best frames per second of the repeats"""
+    storage = RealTimeDataStorageForWebSocketClients()
+    storage.register_new_client(1)
+    best = 0
+    for _ in range(repeat):
+        st = time.perf_counter()
+        for i in range(frames):
+            data = json.loads(frame)
+            log_frame(i, data)
+            storage.store_records(data)
+            if i % 100 == 0:
+                storage.client_data[1] = []
+        best = max(best, frames / (time.perf_counter() - st))
+    return best
+
+
+def main(frames=20000):
+    frame = make_frame()
+    logger = get_logger("benchmark")
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        log_path = os.path.join(temp_dir, "bench.log")
+        configure_logging(file_path=log_path)
+        results["no logging"] = run_hot_path(frames, frame, lambda i, data: None)
+
+        # Same destination file for every setup so only the logging cost differs
+        with open(log_path, "w") as file, contextlib.redirect_stdout(file):
+            results["print per frame"] = run_hot_path(
+                frames, frame, lambda i, data: print(f"Frame {i} : {len(data)} events"))
+
+        results["structured info per frame (queued)"] = run_hot_path(
+            frames, frame, lambda i, data: logger.info("frame_received", frame=i, events=len(data)))
+        results["structured sampled 1/1000 (queued)"] = run_hot_path(
+            frames, frame, lambda i, data: logger.sampled(logging.INFO, "frame_received", every=1000, events=len(data)))
+        configure_logging(level=logging.WARNING, file_path=log_path)
+        results["structured info below level"] = run_hot_path(
+            frames, frame, lambda i, data: logger.info("frame_received", frame=i, events=len(data)))
+        shutdown_logging()
+
+    for name, rate in results.items():
+        print(f"{name:<40}{rate:>12.0f} frames/s{rate / results['no logging'] * 100:>8.1f} %")
+    print(f"Dropped log records: {dropped_log_records()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,55 @@
+"""
+Measures symbol universe loading and server module import time.
+Run: python benchmark_startup.py
+"""
+import statistics
+import subprocess
+import sys
+import time
+
+from symbol_table import SYMBOLS_CSV_PATH, SymbolRegistry, load_symbol_universe, read_symbols_csv
+
+
+def measure_ms(func, repeat=20):
+    timings = []
+    for _ in range(repeat):
+        st = time.perf_counter()
+        func()
+        timings.append((time.perf_counter() - st) * 1000)
+    return statistics.median(timings)
+
+
+def measure_import_ms(module: str, repeat=5):
+    """Median wall time of a fresh interpreter importing the module, minus a bare interpreter start"""
+    code = f"import time; st = time.perf_counter(); import {module}; print((time.perf_counter() - st) * 1000)"
+    timings = []
+    for _ in range(repeat):
+        res = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True)
+        if res.returncode != 0:
+            return None
+        timings.append(float(res.stdout.strip().splitlines()[-1]))
+    return statistics.median(timings)
+
+
+def main():
+    results = {
+        "csv module parse": measure_ms(lambda: read_symbols_csv(SYMBOLS_CSV_PATH)),
+        "pickle cache load": measure_ms(lambda: load_symbol_universe(SYMBOLS_CSV_PATH)),
+        "registry build (cached)": measure_ms(lambda: SymbolRegistry(load_symbol_universe(SYMBOLS_CSV_PATH))),
+    }
+    try:
+        import pandas as pd
+        results["pandas read_csv (previous loader)"] = measure_ms(
+            lambda: set(pd.read_csv(SYMBOLS_CSV_PATH, keep_default_na=False)["symbol"]))
+        results["import pandas"] = measure_import_ms("pandas")
+    except ImportError:
+        print("pandas is not installed. Skipping previous loader")
+    for module in ["symbol_table", "stock_data", "stock_websocket_api"]:
+        results[f"import {module}"] = measure_import_ms(module)
+
+    for name, ms in results.items():
+        print(f"{name:<40}" + ("failed (missing dependency)" if ms is None else f"{ms:>10.2f} ms"))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,22 @@
 import copy
 import dataclasses
 import datetime
+import functools
+import heapq
 import json
+import logging
 import time
+from bisect import bisect_left, bisect_right
+from collections import deque
 from pathlib import Path
-from threading import Thread
-from typing import Dict, List
+from threading import Condition, Lock, Thread
+from types import MappingProxyType
+from typing import Callable, Dict, List
+
+from structured_logger import get_logger
+
+logger = get_logger("data_processor")
 
-from trader import OrderData
 
 class InvalidAggregateScale(BaseException):
     """Raised when Invalid Aggerage Scale is provided"""
@@ -15,109 +24,487 @@ class InvalidAggregateScale(BaseException):
 
 
 class AggregateMaker:
-    """Receives second data and converts it into aggregate data"""
+    """
+    Receives second data and converts it into aggregate data.
+
+    Bars are built per symbol from polygon 'A' events. A bar is emitted once the symbol's event time
+    (or the wall clock, see close_due_bars) passes the bar end plus allowed_lateness_ms. Events of an already
+    emitted bar are dropped and counted in dropped_late. Bars are emitted in the order they close, whichever
+    thread (the stream or the closing timer) closes them.
+    """
 
-    def __init__(self, scale="minute"):
+    def __init__(self, scale="minute", allowed_lateness_ms=0, wall_clock_grace_ms=3000):
+        """
+        :param wall_clock_grace_ms: the wall clock closes a bar only this long after its end. The last second of a
+                                    bar ends with the bar, so it always arrives after the end (plus clock skew)
+        """
         allowed_scales = {"minute": 60, "second": 1, "hour": 3600}
         scale = scale.lower()
         if scale not in allowed_scales:
             raise InvalidAggregateScale(f"Scale must be from {list(allowed_scales.keys())}")
         self.scale_second = allowed_scales[scale]
+        self.scale_ms = self.scale_second * 1000
+        self.event_name = {"minute": "AM", "second": "A", "hour": "AH"}[scale]
+        self.allowed_lateness_ms = allowed_lateness_ms
+        self.wall_clock_grace_ms = wall_clock_grace_ms
+        self.open_bars: Dict[str, Dict[int, dict]] = {}  # symbol -> bar start -> bar
+        self.closed_until: Dict[str, int] = {}  # symbol -> end of the last emitted bar
+        self.watermarks: Dict[str, int] = {}  # symbol -> latest event end
+        self.dropped_late = 0
+        self.lock = Lock()
+        # Taken while self.lock is held and kept until the popped bars are emitted, so they reach on_bar in the
+        # order they were popped, without running the listeners under self.lock
+        self.emit_lock = Lock()
+        self.carry_on = True
+        self.on_bar = self.on_bar_default_call
+
+    def add_second_data(self, data: dict):
+        """Add one polygon 'A' event. Completed bars are passed to the on_bar listener"""
+        symbol = data['sym']
+        start = data['s'] - data['s'] % self.scale_ms
+        with self.lock:
+            if start < self.closed_until.get(symbol, 0):
+                self.dropped_late += 1
+                return
+            bars = self.open_bars.get(symbol)
+            if bars is None:
+                bars = self.open_bars[symbol] = {}
+            bar = bars.get(start)
+            if bar is None:
+                bars[start] = self.__new_bar(symbol, start, data)
+            else:
+                self.__update_bar(bar, data)
+            if data['e'] > self.watermarks.get(symbol, 0):
+                self.watermarks[symbol] = data['e']
+            completed = self.__pop_completed(symbol, self.watermarks[symbol])
+            if not completed:
+                return
+            self.emit_lock.acquire()
+        self.__emit(completed)
+
+    def __new_bar(self, symbol: str, start: int, data: dict):
+        return {"ev": self.event_name, "sym": symbol, "v": data['v'], "av": data.get('av'), "op": data.get('op'),
+                "vw": data.get('vw', data['c']), "o": data['o'], "c": data['c'], "h": data['h'], "l": data['l'],
+                "a": data.get('a'), "s": start, "e": start + self.scale_ms,
+                "first_s": data['s'], "last_s": data['s']}
+
+    def __update_bar(self, bar: dict, data: dict):
+        volume = bar['v'] + data['v']
+        if volume > 0:
+            bar['vw'] = (bar['vw'] * bar['v'] + data.get('vw', data['c']) * data['v']) / volume
+        bar['v'] = volume
+        if data['h'] > bar['h']:
+            bar['h'] = data['h']
+        if data['l'] < bar['l']:
+            bar['l'] = data['l']
+        if data['s'] < bar['first_s']:
+            bar['first_s'] = data['s']
+            bar['o'] = data['o']
+        if data['s'] >= bar['last_s']:
+            bar['last_s'] = data['s']
+            bar['c'] = data['c']
+            bar['av'] = data.get('av', bar['av'])
+            bar['a'] = data.get('a', bar['a'])
+            bar['op'] = data.get('op', bar['op'])
+
+    def __pop_completed(self, symbol: str, until_ms: int):
+        """Pop the bars of the symbol ended before until_ms - allowed lateness. Must be called with self.lock"""
+        bars = self.open_bars.get(symbol)
+        if not bars:
+            return []
+        due = sorted(start for start in bars if start + self.scale_ms + self.allowed_lateness_ms <= until_ms)
+        completed = []
+        for start in due:
+            bar = bars.pop(start)
+            del bar['first_s'], bar['last_s']
+            bar['vw'] = round(bar['vw'], 4)
+            self.closed_until[symbol] = bar['e']
+            completed.append(bar)
+        return completed
+
+    def close_due_bars(self, now_ms: int = None):
+        """Emit bars of symbols which stopped trading once the wall clock passes their end plus the grace period"""
+        if now_ms is None:
+            now_ms = int(time.time() * 1000)
+        until_ms = now_ms - self.wall_clock_grace_ms
+        with self.lock:
+            completed = []
+            for symbol in list(self.open_bars):
+                completed.extend(self.__pop_completed(symbol, until_ms))
+            if not completed:
+                return
+            self.emit_lock.acquire()
+        self.__emit(completed)
+
+    def __emit(self, completed: list):
+        """Pass popped bars to the on_bar listener. Must be called with self.emit_lock, which it releases"""
+        try:
+            for bar in completed:
+                self.on_bar(bar)
+        finally:
+            self.emit_lock.release()
+
+    def discard_symbol(self, symbol: str):
+        """Forget the open bars of an unsubscribed symbol"""
+        with self.lock:
+            self.open_bars.pop(symbol, None)
+            self.closed_until.pop(symbol, None)
+            self.watermarks.pop(symbol, None)
+
+    def keep_closing_due_bars(self, interval_sec=0.2):
+        while self.carry_on:
+            time.sleep(interval_sec)
+            self.close_due_bars()
+
+    def start_closing_timer(self, interval_sec=0.2):
+        t1 = Thread(target=self.keep_closing_due_bars, args=[interval_sec], name="aggregate_closing_timer")
+        t1.start()
+
+    def stop_closing_timer(self):
+        self.carry_on = False
+
+    def on_bar_default_call(self, bar: dict):
+        pass
+
+    def attach_on_bar_listener(self, on_bar_callable: Callable[[dict], None]):
+        """
+        Completed bars in polygon aggregate format are passed to the given function
+        :param on_bar_callable: params(bar)
+        :return:
+        """
+        self.on_bar = on_bar_callable
 
 
 class TimePipe:
-    """Keeps only specified timestamp data"""
+    """
+    Keeps only specified timestamp data.
 
-    def __init__(self, keep_minutes: 19):
+    Entries are kept in timestamp order in lists read from a moving head offset, so old data is evicted by moving
+    the head and the lists are compacted once most of them is evicted. Lowest values of min_keys are tracked by
+    monotonic queues and totals of sum_keys by prefix sums, so neither scans the pipe.
+    Pushing in timestamp order is O(1) amortized, an out of order push rebuilds the pipe in O(n).
+    """
+
+    def __init__(self, keep_minutes: 19, min_keys=('l',), sum_keys=('v',)):
         self.h_total_min_ms = keep_minutes * 60 * 1000
-        self.minute_data = []
+        self.min_keys = tuple(min_keys)
+        self.sum_keys = tuple(sum_keys)
+        self.clear()
+
+    def clear(self):
+        self.minute_data = []  # (data, timestamp). Entries before head are evicted
+        self.timestamps = []
+        self.head = 0
+        self.first_seq = 0  # sequence number of minute_data[head]
+        self.next_seq = 0
+        # Increasing values of (value, seq, data). Front is the earliest lowest value
+        self.min_queues = {key: deque() for key in self.min_keys}
+        # Running total including the entry at the same index. The total of the evicted entries is in evicted_sums
+        self.prefix_sums = {key: [] for key in self.sum_keys}
+        self.evicted_sums = {key: 0 for key in self.sum_keys}
+        self.untracked_keys = set()
+
+    def __len__(self):
+        return len(self.timestamps) - self.head
 
     def clear_before_timestamp_data(self, timestamp):
-        new_data = []
-        for data, stamp in self.minute_data:
-            if stamp > timestamp:
-                new_data.append((data, stamp))
-            else:
-                pass
-                # print(f"Cleared: {data, stamp}")
-        self.minute_data = new_data
+        while self.head < len(self.timestamps) and self.timestamps[self.head] <= timestamp:
+            self.__pop_left()
+        if self.head > 64 and self.head * 2 > len(self.timestamps):
+            self.__compact()
+
+    def __pop_left(self):
+        for key, queue in self.min_queues.items():
+            if len(queue) > 0 and queue[0][1] == self.first_seq:
+                queue.popleft()
+        for key, sums in self.prefix_sums.items():
+            if key not in self.untracked_keys:
+                self.evicted_sums[key] = sums[self.head]
+        self.head += 1
+        self.first_seq += 1
+
+    def __compact(self):
+        """Drop the evicted entries from the lists"""
+        head = self.head
+        del self.minute_data[:head]
+        del self.timestamps[:head]
+        for key, sums in self.prefix_sums.items():
+            if key not in self.untracked_keys:
+                del sums[:head]
+        self.head = 0
 
     def push(self, data, timestamp_ms):
-        # print(f"Pushing {data}")
         self.clear_before_timestamp_data(timestamp_ms - self.h_total_min_ms)
+        if len(self) > 0 and timestamp_ms < self.timestamps[-1]:
+            # Out of order data. Rare, rebuild in timestamp order
+            entries = self.minute_data[self.head:]
+            entries.insert(bisect_right(self.timestamps, timestamp_ms, lo=self.head) - self.head,
+                           (data, timestamp_ms))
+            self.clear()
+            for entry in entries:
+                self.__append(*entry)
+            return
+        self.__append(data, timestamp_ms)
+
+    def __append(self, data, timestamp_ms):
+        seq = self.next_seq
+        self.next_seq += 1
         self.minute_data.append((data, timestamp_ms))
-
-    def clear(self):
-        self.minute_data.clear()
+        self.timestamps.append(timestamp_ms)
+        for key, queue in self.min_queues.items():
+            if key in self.untracked_keys:
+                continue
+            try:
+                value = data[key]
+            except (KeyError, TypeError):
+                self.untracked_keys.add(key)
+                continue
+            while len(queue) > 0 and queue[-1][0] > value:
+                queue.pop()
+            queue.append((value, seq, data))
+        for key, sums in self.prefix_sums.items():
+            if key in self.untracked_keys:
+                continue
+            try:
+                value = data[key]
+            except (KeyError, TypeError):
+                self.untracked_keys.add(key)
+                continue
+            sums.append((sums[-1] if len(sums) > self.head else self.evicted_sums[key]) + value)
 
     def get_all_data(self, include_timestamp=False):
+        """Read only view of the data. Dict data is wrapped in a MappingProxyType instead of being copied"""
         if not include_timestamp:
-            res = [data for data, stamp in self.minute_data]
-            return copy.deepcopy(res)
-        return copy.deepcopy(self.minute_data)
+            return tuple(MappingProxyType(data) if isinstance(data, dict) else data
+                         for data, stamp in self.minute_data[self.head:])
+        return tuple((MappingProxyType(data) if isinstance(data, dict) else data, stamp)
+                     for data, stamp in self.minute_data[self.head:])
 
     def get_lowest_data_if_dict(self, key='l'):
+        if key in self.min_queues and key not in self.untracked_keys:
+            queue = self.min_queues[key]
+            if len(queue) > 0 and queue[0][0] < 100000000000:
+                return queue[0][2]
+            return None
         lowest = 100000000000
         temp_data = None
-        for data, stamp in self.minute_data:
+        for data, stamp in self.minute_data[self.head:]:
             if data[key] < lowest:
                 lowest = data[key]
                 temp_data = data
         return temp_data
 
     def get_total_addition_if_dict(self, min_timestamp, max_timestamp, key='v'):
+        if key in self.prefix_sums and key not in self.untracked_keys:
+            sums = self.prefix_sums[key]
+            lo = bisect_left(self.timestamps, min_timestamp, lo=self.head)
+            hi = bisect_right(self.timestamps, max_timestamp, lo=self.head) - 1
+            if hi < lo:
+                return 0
+            return sums[hi] - (sums[lo - 1] if lo > self.head else self.evicted_sums[key])
         total = 0
-        for data, stamp in self.minute_data:
+        for data, stamp in self.minute_data[self.head:]:
             if min_timestamp <= stamp <= max_timestamp:
                 total += data[key]
         return total
 
 
 class TimedStorage:
-    """Deletes the stored data after a specified minute"""
+    """
+    Deletes the stored data after a specified minute.
+
+    Entries live in a dict keyed by id (O(1) membership) and their deadlines in a min-heap, so the
+    countdown thread sleeps exactly until the next expiry instead of polling every minute.
+    Additions and expirations are published to the attached listeners as they happen.
+    """
 
     def __init__(self):
-        self.data = []
+        self.data: Dict[str, dict] = {}
         self.deleted = []
+        self.expiry_heap = []  # (deadline, seq, id). Stale items are skipped when popped
+        self.push_seq = 0
         self.carry_on = True
-        t1 = Thread(target=self.__start_countdown)
+        self.condition = Condition()
+        self.on_added = self.on_added_default_call
+        self.on_expired = self.on_expired_default_call
+        t1 = Thread(target=self.__start_countdown, name="timed_storage_countdown")
         t1.start()
 
     def __start_countdown(self):
-        while self.carry_on:
-            time.sleep(60)
-            for i in range(len(self.data) - 1, -1, -1):
-                self.data[i]['elapsed'] += 1
-                if self.data[i]['elapsed'] == self.data[i]['delete_after_min']:
-                    print(f"Deleting {self.data[i]}")
-                    self.deleted.append(self.data[i])
-                    del self.data[i]
+        while True:
+            with self.condition:
+                while self.carry_on:
+                    if len(self.expiry_heap) == 0:
+                        self.condition.wait()
+                        continue
+                    wait_sec = self.expiry_heap[0][0] - time.monotonic()
+                    if wait_sec > 0:
+                        self.condition.wait(wait_sec)
+                        continue
+                    break
+                if not self.carry_on:
+                    return
+                expired = self.__pop_expired(time.monotonic())
+            for entry in expired:
+                logger.sampled(logging.DEBUG, "timed_storage_expired", every=100, id=entry['id'])
+                self.on_expired(entry['id'], entry['data'])
+
+    def __pop_expired(self, now: float):
+        """Pop every entry whose deadline passed. Must be called with self.condition held"""
+        expired = []
+        while len(self.expiry_heap) > 0 and self.expiry_heap[0][0] <= now:
+            deadline, seq, id = heapq.heappop(self.expiry_heap)
+            entry = self.data.get(id)
+            if entry is None or entry['seq'] != seq:
+                # Entry was re-pushed with a new deadline
+                continue
+            del self.data[id]
+            self.deleted.append(entry)
+            expired.append(entry)
+        return expired
 
     def pause_countdown(self):
-        self.carry_on = False
+        with self.condition:
+            self.carry_on = False
+            self.condition.notify_all()
 
     def push(self, id, data, delete_after_min=1):
-        print(f"Pushing {id}")
-        self.data.append({"id": id, "data": data, "elapsed": 0, "delete_after_min": delete_after_min})
+        """
+        Store data for delete_after_min minutes. Pushing an id which is already stored refreshes its data
+        and deadline without publishing a new addition
+        """
+        logger.sampled(logging.DEBUG, "timed_storage_pushed", every=100, id=id)
+        with self.condition:
+            is_new = id not in self.data
+            self.push_seq += 1
+            deadline = time.monotonic() + delete_after_min * 60
+            self.data[id] = {"id": id, "data": data, "delete_after_min": delete_after_min, "deadline": deadline,
+                             "seq": self.push_seq}
+            heapq.heappush(self.expiry_heap, (deadline, self.push_seq, id))
+            if self.expiry_heap[0][2] == id:
+                # New earliest deadline. Wake up the countdown to reschedule
+                self.condition.notify_all()
+        if is_new:
+            self.on_added(id, data)
+
+    def __contains__(self, id):
+        return id in self.data
+
+    def __len__(self):
+        return len(self.data)
 
     def get_data(self):
-        return [d['data'] for d in copy.deepcopy(self.data)]
+        return [copy.deepcopy(d['data']) for d in list(self.data.values())]
 
     def get_ids(self):
-        return [d['id'] for d in self.data]
+        return list(self.data)
 
     def get_id_and_data(self):
-        return [{"id": d['id'], "data": d['data']} for d in self.data]
+        return [{"id": d['id'], "data": d['data']} for d in list(self.data.values())]
 
     def get_id_and_data_and_deleted(self):
         """
         Return Valid and recently Deleted data and clears deleted data
         """
-        res = {"valid": [{"id": d['id'], "data": d['data']} for d in self.data],
-               "expired": [{"id": d['id'], "data": d['data']} for d in self.deleted]}
-        self.deleted = []
+        with self.condition:
+            res = {"valid": [{"id": d['id'], "data": d['data']} for d in self.data.values()],
+                   "expired": [{"id": d['id'], "data": d['data']} for d in self.deleted]}
+            self.deleted = []
         return res
 
+    def on_added_default_call(self, id, data):
+        pass
+
+    def on_expired_default_call(self, id, data):
+        pass
+
+    def attach_on_added_listener(self, on_added_callable: Callable[[str, object], None]):
+        """
+        Notified right after a new id is stored
+        :param on_added_callable: params(id, data)
+        :return:
+        """
+        self.on_added = on_added_callable
+
+    def attach_on_expired_listener(self, on_expired_callable: Callable[[str, object], None]):
+        """
+        Notified right after an id is expired and deleted
+        :param on_expired_callable: params(id, data)
+        :return:
+        """
+        self.on_expired = on_expired_callable
+
+
+SECONDS_IN_DAY = 24 * 3600
+
+
+def time_str_to_seconds(time_str: str):
+    """Seconds of the day of a "HH:MM:SS" string or None if the string is not a valid time"""
+    if len(time_str) != 8 or time_str[2] != ":" or time_str[5] != ":":
+        return None
+    try:
+        hr, minute, sec = int(time_str[0:2]), int(time_str[3:5]), int(time_str[6:8])
+    except ValueError:
+        return None
+    if hr > 23 or minute > 59 or sec > 59 or hr < 0 or minute < 0 or sec < 0:
+        return None
+    return hr * 3600 + minute * 60 + sec
+
+
+def seconds_to_time_str(time_sec: int):
+    return f"{time_sec // 3600:02d}:{(time_sec % 3600) // 60:02d}:{time_sec % 60:02d}"
+
+
+class TimeRange:
+    """
+    Times of a range checked arithmetically instead of being materialized.
+    Supports "HH:MM:SS" strings and seconds of the day with `in`. Ranges crossing midnight wrap around.
+    """
+
+    def __init__(self, start_stamp: int, end_stamp: int, interval_sec: int):
+        self.start_stamp = start_stamp
+        self.end_stamp = end_stamp
+        self.interval_sec = interval_sec
+        self.span = (end_stamp - start_stamp) % SECONDS_IN_DAY
+
+    def __contains__(self, item):
+        if isinstance(item, str):
+            time_sec = time_str_to_seconds(item)
+            if time_sec is None:
+                return False
+        elif isinstance(item, int) and 0 <= item < SECONDS_IN_DAY:
+            time_sec = item
+        else:
+            return False
+        offset = (time_sec - self.start_stamp) % SECONDS_IN_DAY
+        return offset <= self.span and offset % self.interval_sec == 0
+
+    def __iter__(self):
+        for offset in range(0, self.span + 1, self.interval_sec):
+            yield seconds_to_time_str((self.start_stamp + offset) % SECONDS_IN_DAY)
+
+    def __len__(self):
+        return self.span // self.interval_sec + 1
+
+
+class TimeRangeUnion:
+    """Membership in any of the given time ranges"""
+
+    def __init__(self, *time_ranges: TimeRange):
+        self.time_ranges = time_ranges
+
+    def __contains__(self, item):
+        for time_range in self.time_ranges:
+            if item in time_range:
+                return True
+        return False
+
+
+@functools.lru_cache(maxsize=32)
+def materialize_time_range(start_stamp: int, end_stamp: int, interval_sec: int):
+    """Shared tuple of the range's time strings for callers which need every element"""
+    return tuple(TimeRange(start_stamp, end_stamp, interval_sec))
+
 
 class TimeRangeCreator:
     """Create list of time in 24 hr format in the given time range"""
@@ -129,67 +516,63 @@ class TimeRangeCreator:
         self.end_stamp = (int(self.end_hr) * 60 * 60) + (int(self.end_min) * 60) + int(self.end_sec)
         self.interval_sec = int(interval_sec)
 
+    def get_range(self) -> TimeRange:
+        """Range supporting `in` checks without creating the time strings"""
+        return TimeRange(self.start_stamp, self.end_stamp, self.interval_sec)
+
     def get_list(self):
         """List of times in the range created using interval seconds"""
-
-        times = []
-        if self.start_stamp <= self.end_stamp:
-            for time_sec in range(self.start_stamp, self.end_stamp + 1, self.interval_sec):
-                hr = int(time_sec / 3600)
-                minute = int((time_sec % 3600) / 60)
-                sec = time_sec % 60
-                times.append(f"{hr:02d}:{minute:02d}:{sec:02d}")
-        else:
-            start_again_from = 0
-            pause_before = 24 * 3600
-
-            # For pm to am switching
-            for time_sec in range(self.start_stamp, pause_before, self.interval_sec):
-                hr = int(time_sec / 3600)
-                minute = int((time_sec % 3600) / 60)
-                sec = time_sec % 60
-                times.append(f"{hr:02d}:{minute:02d}:{sec:02d}")
-                if (time_sec + self.interval_sec) >= pause_before:
-                    start_again_from = (time_sec + self.interval_sec) - pause_before
-
-            # pm to am switched
-            for time_sec in range(start_again_from, self.end_stamp + 1, self.interval_sec):
-                hr = int(time_sec / 3600)
-                minute = int((time_sec % 3600) / 60)
-                sec = time_sec % 60
-                times.append(f"{hr:02d}:{minute:02d}:{sec:02d}")
-        return times
+        return list(materialize_time_range(self.start_stamp, self.end_stamp, self.interval_sec))
 
     def get_dict(self):
         """Dict of times in the range created using interval seconds"""
+        return dict.fromkeys(materialize_time_range(self.start_stamp, self.end_stamp, self.interval_sec), True)
 
-        times = {}
-        if self.start_stamp <= self.end_stamp:
-            for time_sec in range(self.start_stamp, self.end_stamp + 1, self.interval_sec):
-                hr = int(time_sec / 3600)
-                minute = int((time_sec % 3600) / 60)
-                sec = time_sec % 60
-                times[f"{hr:02d}:{minute:02d}:{sec:02d}"] = True
-        else:
-            start_again_from = 0
-            pause_before = 24 * 3600
-
-            # For pm to am switching
-            for time_sec in range(self.start_stamp, pause_before, self.interval_sec):
-                hr = int(time_sec / 3600)
-                minute = int((time_sec % 3600) / 60)
-                sec = time_sec % 60
-                times[f"{hr:02d}:{minute:02d}:{sec:02d}"] = True
-                if (time_sec + self.interval_sec) >= pause_before:
-                    start_again_from = (time_sec + self.interval_sec) - pause_before
-
-            # pm to am switched
-            for time_sec in range(start_again_from, self.end_stamp + 1, self.interval_sec):
-                hr = int(time_sec / 3600)
-                minute = int((time_sec % 3600) / 60)
-                sec = time_sec % 60
-                times[f"{hr:02d}:{minute:02d}:{sec:02d}"] = True
-        return times
+
+NORMAL_MARKET = "NORMAL_MARKET"
+PRE_MARKET = "PRE_MARKET"
+AFTER_MARKET = "AFTER_MARKET"
+
+
+class MarketHoursCalifornia:
+    def __init__(self):
+        pass
+
+    def get_pre_market_time_range_dict(self):
+        return TimeRangeCreator(start_time="01:00:00", end_time="06:29:59", interval_sec=1).get_dict()
+
+    def get_normal_hour_time_range_dict(self):
+        return TimeRangeCreator(start_time="06:30:00", end_time="12:59:59", interval_sec=1).get_dict()
+
+    def get_after_market_time_range_dict(self):
+        return TimeRangeCreator(start_time="13:00:00", end_time="16:59:59", interval_sec=1).get_dict()
+
+    def get_pre_market_hours_range(self):
+        return TimeRangeCreator(start_time="01:00:00", end_time="06:29:59", interval_sec=1).get_range()
+
+    def get_normal_market_hours_range(self):
+        return TimeRangeCreator(start_time="06:30:00", end_time="12:59:59", interval_sec=1).get_range()
+
+    def get_after_market_hours_range(self):
+        return TimeRangeCreator(start_time="13:00:00", end_time="16:59:59", interval_sec=1).get_range()
+
+    def get_pre_market_time_range(self):
+        # Total 5:30 hr
+        return {"start": {"h": 1, "m": 0, "s": 0}, "end": {"h": 6, "m": 29, "s": 0}}
+
+    def get_normal_hour_time_range(self):
+        # Total 6:30 hr
+        return {"start": {"h": 6, "m": 30, "s": 0}, "end": {"h": 12, "m": 59, "s": 0}}
+
+    def get_after_hour_time_range(self):
+        # Total 4 hr
+        return {"start": {"h": 13, "m": 0, "s": 0}, "end": {"h": 16, "m": 59, "s": 0}}
+
+    def get_market_start_end_time_range(self):
+        return {"start": {"h": 1, "m": 0, "s": 0}, "end": {"h": 16, "m": 59, "s": 0}}
+
+    def get_market_start_end_time_range_str(self):
+        return {"start": "01:00:00", "end": "16:59:00"}
 
 
 def create_required_folder(path_dir):
@@ -1,8 +1,12 @@
 from creds import AlpakaCreds2
 from strategy import Formula1
-from trader import AlpakaTrader
+from order_scheduler import ALPACA_REQUESTS_PER_MINUTE, OrderScheduler
+from trader import SchedulingTrader
 
-alpaka_trader = AlpakaTrader().set_credentials(AlpakaCreds2())
+# Two formulas trade on this account
+alpaka_trader = SchedulingTrader(scheduler=OrderScheduler(requests_per_minute=ALPACA_REQUESTS_PER_MINUTE // 2)) \
+    .set_credentials(AlpakaCreds2())
 formula1_ban_no = Formula1(trader=alpaka_trader, socket_key='1111', socket_uri="ws://localhost:8000/api/ws/",
                            ban_mode=False, with_cancel=True)
+formula1_ban_no.enable_snapshots()
 formula1_ban_no.start()
@@ -1,8 +1,12 @@
 from creds import AlpakaCreds
 from strategy import Formula1
-from trader import AlpakaTrader
+from order_scheduler import ALPACA_REQUESTS_PER_MINUTE, OrderScheduler
+from trader import SchedulingTrader
 
-alpaka_trader = AlpakaTrader().set_credentials(AlpakaCreds())
+# Two formulas trade on this account
+alpaka_trader = SchedulingTrader(scheduler=OrderScheduler(requests_per_minute=ALPACA_REQUESTS_PER_MINUTE // 2)) \
+    .set_credentials(AlpakaCreds())
 formula1_ban_yes = Formula1(trader=alpaka_trader, socket_key='1111', socket_uri="ws://localhost:8000/api/ws/",
                             ban_mode=True)
+formula1_ban_yes.enable_snapshots()
 formula1_ban_yes.start()
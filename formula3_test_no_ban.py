@@ -1,8 +1,12 @@
 from strategy import Formula3
 from creds import AlpakaCreds2
-from trader import AlpakaTrader
+from order_scheduler import ALPACA_REQUESTS_PER_MINUTE, OrderScheduler
+from trader import SchedulingTrader
 
-alpaka_trader = AlpakaTrader().set_credentials(AlpakaCreds2())
+# Two formulas trade on this account
+alpaka_trader = SchedulingTrader(scheduler=OrderScheduler(requests_per_minute=ALPACA_REQUESTS_PER_MINUTE // 2)) \
+    .set_credentials(AlpakaCreds2())
 formula3_ban_no = Formula3(trader=alpaka_trader, socket_key='4444', socket_uri="ws://localhost:8000/api/ws/",
                            ban_mode=False)
+formula3_ban_no.enable_snapshots()
 formula3_ban_no.start()
@@ -0,0 +1,93 @@
+from collections import deque
+from typing import Dict
+
+from custom_time import CustomTimeZone
+from data_processor import AFTER_MARKET, NORMAL_MARKET, PRE_MARKET, MarketHoursCalifornia
+
+# Same definitions as Formula.set_sma / Formula.set_ema
+SMA_WINDOW_MS = 240000  # current minute and the previous 4 minutes
+EMA_SMOOTHING = 3
+INDICATOR_FIELDS = ('sma', 'ema', 'v_sma', 'v_ema', 'cal_t', 'cal_d', 'session')
+
+
+def has_indicators(minute_data: dict):
+    """True if the bar was enriched by a MinuteBarEnricher on the feed server"""
+    return 'v_ema' in minute_data
+
+
+class SymbolIndicators:
+    """Running indicator state of one symbol's minute bars"""
+    __slots__ = ("window", "ema", "v_ema")
+
+    def __init__(self):
+        self.window = deque()  # (s, c, v) of the bars inside SMA_WINDOW_MS
+        self.ema = None
+        self.v_ema = None
+
+
+class MinuteBarEnricher:
+    """
+    Computes the indicators every formula needs on AM bars once on the feed server and adds them to the bar:
+    sma, ema, v_sma, v_ema, the client side cal_t / cal_d and the market session.
+    Like the formulas' processed minute data, a symbol's series starts at its AM subscription status and is
+    dropped on unsubscription, so enriched values equal the ones a formula computes itself
+    """
+
+    def __init__(self, time_zone=CustomTimeZone.CLIENT_LOCATION):
+        self.custom_time = CustomTimeZone(time_zone)
+        self.symbols: Dict[str, SymbolIndicators] = {}
+        market_hours = MarketHoursCalifornia()
+        self.sessions = ((PRE_MARKET, market_hours.get_pre_market_hours_range()),
+                         (NORMAL_MARKET, market_hours.get_normal_market_hours_range()),
+                         (AFTER_MARKET, market_hours.get_after_market_hours_range()))
+
+    def enrich(self, records: list):
+        """Enrich the AM bars of a batch of decoded polygon messages in place"""
+        for data in records:
+            ev = data['ev']
+            if ev == 'AM':
+                self.enrich_bar(data)
+            elif ev == 'status':
+                self.on_status(data)
+
+    def on_status(self, data: dict):
+        message = str(data.get('message', ""))
+        if message.startswith("subscribed to: AM."):
+            # Resubscriptions after a reconnect keep the series, as formulas ignore duplicate subscriptions
+            self.symbols.setdefault(message[len("subscribed to: AM."):], SymbolIndicators())
+        elif message.startswith("unsubscribed to: AM."):
+            self.symbols.pop(message[len("unsubscribed to: AM."):], None)
+
+    def which_market(self, cal_t: str):
+        for market_name, market_hours in self.sessions:
+            if cal_t in market_hours:
+                return market_name
+        return None
+
+    def enrich_bar(self, bar: dict):
+        state = self.symbols.get(bar['sym'])
+        if state is None:
+            # No subscription status seen (e.g. server started mid session). Clients compute it themselves
+            return
+        start = bar['s']
+        window = state.window
+        window.append((start, bar['c'], bar['v']))
+        while window[0][0] < start - SMA_WINDOW_MS:
+            window.popleft()
+        # At most 5 bars. Summed in the formulas' order so rounding matches exactly
+        sma = round(sum(close for _, close, _ in reversed(window)) / len(window), 2)
+        v_sma = round(sum(volume for _, _, volume in reversed(window)) / len(window), 2)
+        if state.ema is None:
+            state.ema = sma
+            state.v_ema = v_sma
+        else:
+            state.ema = round(((bar['c'] - state.ema) / EMA_SMOOTHING) + state.ema, 2)
+            state.v_ema = round(((bar['v'] - state.v_ema) / EMA_SMOOTHING) + state.v_ema, 2)
+        cal_t, cal_d = self.custom_time.get_tz_time_date_from_timestamp(start)
+        bar['sma'] = sma
+        bar['ema'] = state.ema
+        bar['v_sma'] = v_sma
+        bar['v_ema'] = state.v_ema
+        bar['cal_t'] = cal_t
+        bar['cal_d'] = cal_d
+        bar['session'] = self.which_market(cal_t)
@@ -0,0 +1,142 @@
+import time
+from array import array
+from threading import Lock, Thread, local
+from typing import Dict
+
+
+class LatencyHistogram:
+    """
+    HDR style histogram of nanosecond values. Values below 2^sub_bucket_bits are counted exactly, larger values
+    fall in log2 magnitude buckets split into linear sub buckets (precision 1 / 2^(sub_bucket_bits - 1))
+    """
+
+    def __init__(self, sub_bucket_bits=7, max_magnitude=40):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.counts = array('Q', bytes(8 * (self.sub_bucket_count + max_magnitude * self.half_count)))
+        self.total_count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def __highest_value(self, index: int):
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index - self.sub_bucket_count) // self.half_count + 1
+        sub = (index - self.sub_bucket_count) % self.half_count + self.half_count
+        return ((sub + 1) << shift) - 1
+
+    def record(self, value_ns: int):
+        if value_ns < self.sub_bucket_count:
+            index = value_ns if value_ns > 0 else 0
+        else:
+            shift = value_ns.bit_length() - self.sub_bucket_bits
+            index = self.sub_bucket_count + (shift - 1) * self.half_count + (value_ns >> shift) - self.half_count
+            if index >= len(self.counts):
+                index = len(self.counts) - 1
+        if value_ns > self.max_ns:
+            self.max_ns = value_ns
+        self.counts[index] += 1
+        self.total_count += 1
+        self.total_ns += value_ns
+
+    def value_at_percentile(self, percentile: float):
+        """Upper bound of the bucket holding the percentile, capped at the recorded max"""
+        if self.total_count == 0:
+            return 0
+        target = max(1, int(round(self.total_count * percentile / 100)))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self.__highest_value(index), self.max_ns)
+        return self.max_ns
+
+    def mean(self):
+        return self.total_ns / self.total_count if self.total_count > 0 else 0
+
+    def reset(self):
+        self.counts = array('Q', bytes(8 * len(self.counts)))
+        self.total_count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+
+    def summary_us(self):
+        """Count and percentiles in microseconds"""
+        return {"count": self.total_count,
+                "mean": round(self.mean() / 1000, 1),
+                "p50": round(self.value_at_percentile(50) / 1000, 1),
+                "p90": round(self.value_at_percentile(90) / 1000, 1),
+                "p99": round(self.value_at_percentile(99) / 1000, 1),
+                "p99.9": round(self.value_at_percentile(99.9) / 1000, 1),
+                "max": round(self.max_ns / 1000, 1)}
+
+
+class LatencyTracer:
+    """
+    Measures the hot path of a received frame. begin() stores a monotonic nanosecond timestamp for the current
+    thread and every mark(stage) records the time elapsed since then in the stage's histogram
+    """
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.histograms: Dict[str, LatencyHistogram] = {}
+        self.stage_order = []
+        self.thread_data = local()
+        self.lock = Lock()
+        self.carry_on = False
+
+    def begin(self):
+        if self.enabled:
+            self.thread_data.start_ns = time.perf_counter_ns()
+
+    def mark(self, stage: str):
+        if not self.enabled:
+            return
+        start_ns = getattr(self.thread_data, "start_ns", None)
+        if start_ns is None:
+            return
+        elapsed = time.perf_counter_ns() - start_ns
+        histogram = self.histograms.get(stage)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.get(stage)
+                if histogram is None:
+                    histogram = self.histograms[stage] = LatencyHistogram()
+                    self.stage_order.append(stage)
+        histogram.record(elapsed)
+
+    def summary(self):
+        """Stage percentiles (microseconds since frame receipt) in the order stages were first seen"""
+        return {stage: self.histograms[stage].summary_us() for stage in list(self.stage_order)}
+
+    def dump_summary(self, reset=False):
+        summary = self.summary()
+        print("Hot path latency since frame receipt (us)".center(100, "_"))
+        print(f"{'stage':<32}{'count':>10}{'mean':>10}{'p50':>10}{'p90':>10}{'p99':>10}{'p99.9':>10}{'max':>10}")
+        for stage, s in summary.items():
+            print(f"{stage:<32}{s['count']:>10}{s['mean']:>10}{s['p50']:>10}{s['p90']:>10}{s['p99']:>10}"
+                  f"{s['p99.9']:>10}{s['max']:>10}")
+        if reset:
+            for histogram in list(self.histograms.values()):
+                histogram.reset()
+
+    def keep_dumping_summary(self, interval_sec: float, reset: bool):
+        while self.carry_on:
+            time.sleep(interval_sec)
+            if any(h.total_count > 0 for h in list(self.histograms.values())):
+                self.dump_summary(reset=reset)
+
+    def start_periodic_dump(self, interval_sec=60, reset=True):
+        if self.carry_on or not self.enabled:
+            return
+        self.carry_on = True
+        t1 = Thread(target=self.keep_dumping_summary, args=[interval_sec, reset], name="latency_summary",
+                    daemon=True)
+        t1.start()
+
+    def stop_periodic_dump(self):
+        self.carry_on = False
+
+
+hot_path_tracer = LatencyTracer()
@@ -0,0 +1,243 @@
+"""
+End to end load test of the feed chain on one host:
+synthetic polygon feed -> PolygonDataStreamMultipleClient -> feed server -> WebSocketAggProvider clients.
+The feed and the feed server run in their own processes. Reports the message rate received by the clients,
+end to end latency (synthetic feed send to client dispatch) and the memory of every process.
+Run: python load_test.py --symbols 200 --clients 3 --duration 60 --rate 5000 --profile burst
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import time
+import urllib.request
+from threading import Lock
+
+from indicators import has_indicators
+from latency_tracer import LatencyHistogram
+from structured_logger import get_logger
+from synthetic_polygon_feed import build_arg_parser, feed_from_args
+
+logger = get_logger("load_test")
+
+
+def run_synthetic_feed(args):
+    feed_from_args(args).run()
+
+
+def run_feed_server(feed_url: str, port: int, symbols: list, enrich_bars=True):
+    """Feed server of stock_websocket_api.main reading the synthetic feed, without a detector"""
+    from fastapi import FastAPI
+
+    from creds import PolygonCreds
+    from indicators import MinuteBarEnricher
+    from server_metrics import FeedMetricsCollector
+    from stock_data import PolygonDataStreamMultipleClient, RealTimeDataStorageForWebSocketClients
+    from stock_websocket_api import WebSocketMultipleClientServer
+
+    stream_data = PolygonDataStreamMultipleClient(PolygonCreds(), channel=["A"], local_minute_bars=True,
+                                                  feed_url=feed_url, backfill=False)
+    storage = RealTimeDataStorageForWebSocketClients()
+    if enrich_bars:
+        storage.attach_records_enricher_callable(MinuteBarEnricher().enrich)
+    stream_data.attach_client_storage(storage)
+    stream_data.start_internal_stream()
+    app = WebSocketMultipleClientServer(app=FastAPI())
+    app.attach_on_websocket_con_callable(storage.register_new_client)
+    app.attach_on_websocket_discon_callable(storage.client_disconnected)
+    app.attach_client_data_provider_callable(storage.get_data)
+    app.attach_client_records_provider_callable(storage.get_records)
+    app.attach_metrics_provider_callable(FeedMetricsCollector(storage, stream=stream_data, server=app).render)
+    app.start(port=port)
+    for symbol in symbols:
+        stream_data.request_subscribe(symbol)
+
+
+def rss_mb(pid="self"):
+    """Resident and peak resident memory of a process in MB, from /proc"""
+    memory = {"rss_mb": None, "peak_rss_mb": None}
+    try:
+        with open(f"/proc/{pid}/status") as file:
+            for line in file:
+                if line.startswith("VmRSS:"):
+                    memory["rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+                elif line.startswith("VmHWM:"):
+                    memory["peak_rss_mb"] = round(int(line.split()[1]) / 1024, 1)
+    except:
+        # No /proc (e.g. macOS). Only the peak of this process is known
+        if pid == "self":
+            memory["peak_rss_mb"] = round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+    return memory
+
+
+def scrape_metrics(port: int, names=("feed_messages_in_total", "feed_messages_out_total",
+                                     "feed_event_loop_lag_seconds")):
+    """Unlabelled samples of the feed server's /metrics"""
+    samples = {}
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=2) as response:
+            text = response.read().decode()
+    except:
+        return samples
+    for line in text.splitlines():
+        name, _, value = line.partition(" ")
+        if name in names:
+            samples[name] = float(value)
+    return samples
+
+
+class ClientProbe:
+    """Counts the messages a WebSocketAggProvider dispatches and the latency since the synthetic feed sent them"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.latency = LatencyHistogram()
+        self.second_messages = 0
+        self.minute_bars = 0
+        self.enriched_bars = 0
+
+    def on_second_data_received(self, second_data: dict, symbol: str):
+        latency_ns = time.time_ns() - second_data.get('sent_ns', 0)
+        with self.lock:
+            self.second_messages += 1
+            self.latency.record(latency_ns)
+
+    def on_minute_data_received(self, minute_data: dict, symbol: str):
+        with self.lock:
+            self.minute_bars += 1
+            if has_indicators(minute_data):
+                self.enriched_bars += 1
+
+    def take(self):
+        """Counters and latency histogram since the previous take"""
+        with self.lock:
+            taken = (self.second_messages, self.minute_bars, self.enriched_bars, self.latency)
+            self.second_messages = self.minute_bars = self.enriched_bars = 0
+            self.latency = LatencyHistogram()
+        return taken
+
+
+def merge(histograms):
+    merged = LatencyHistogram()
+    for histogram in histograms:
+        for index, count in enumerate(histogram.counts):
+            merged.counts[index] += count
+        merged.total_count += histogram.total_count
+        merged.total_ns += histogram.total_ns
+        merged.max_ns = max(merged.max_ns, histogram.max_ns)
+    return merged
+
+
+def run_load_test(args):
+    from stock_websocket_api import WebSocketUsers
+    from strategy import WebSocketAggProvider
+    from symbol_table import load_symbol_universe
+
+    if not 1 <= args.clients <= len(WebSocketUsers.users):
+        raise ValueError(f"The feed server accepts 1 to {len(WebSocketUsers.users)} clients")
+    symbols = load_symbol_universe()[:args.symbols]
+    feed_process = multiprocessing.Process(target=run_synthetic_feed, args=(args,), name="synthetic_feed",
+                                           daemon=True)
+    feed_process.start()
+    feed_url = f"ws://127.0.0.1:{args.feed_port}/stocks"
+    server_process = multiprocessing.Process(target=run_feed_server, name="feed_server", daemon=True,
+                                             args=(feed_url, args.server_port, symbols, not args.no_enrich_bars))
+    server_process.start()
+    time.sleep(args.startup_sec)
+
+    probes = []
+    for user in WebSocketUsers.users[:args.clients]:
+        probe = ClientProbe()
+        provider = WebSocketAggProvider(key=str(user), uri=f"ws://127.0.0.1:{args.server_port}/api/ws/",
+                                        wire_encoding="json")
+        provider.attach_on_second_data_received_listener(probe.on_second_data_received)
+        provider.attach_on_minute_data_received_listener(probe.on_minute_data_received)
+        provider.attach_new_subscribed_listener(lambda symbol, channel: None)
+        provider.start_fetching(latency_dump_sec=args.duration + args.warmup_sec + 3600)
+        probes.append(probe)
+    logger.info("load_test_started", symbols=len(symbols), clients=args.clients, rate=args.rate,
+                profile=args.profile, duration_sec=args.duration)
+
+    time.sleep(args.warmup_sec)
+    for probe in probes:
+        probe.take()
+    server_start = scrape_metrics(args.server_port)
+    totals = {"second_messages": 0, "minute_bars": 0, "enriched_bars": 0}
+    histograms = []
+    started = time.monotonic()
+    while time.monotonic() - started < args.duration:
+        interval_started = time.monotonic()
+        time.sleep(min(args.report_sec, max(args.duration - (interval_started - started), 0)))
+        taken = [probe.take() for probe in probes]
+        interval_sec = time.monotonic() - interval_started
+        second_messages = sum(t[0] for t in taken)
+        totals["second_messages"] += second_messages
+        totals["minute_bars"] += sum(t[1] for t in taken)
+        totals["enriched_bars"] += sum(t[2] for t in taken)
+        interval_latency = merge(t[3] for t in taken)
+        histograms.append(interval_latency)
+        logger.info("load_test_interval", msgs_per_sec=round(second_messages / interval_sec, 1),
+                    latency_us=interval_latency.summary_us(), server_memory=rss_mb(server_process.pid))
+    elapsed_sec = time.monotonic() - started
+    server_end = scrape_metrics(args.server_port)
+
+    report = {
+        "config": {"symbols": len(symbols), "clients": args.clients, "rate": args.rate, "profile": args.profile,
+                   "duration_sec": round(elapsed_sec, 1), "enrich_bars": not args.no_enrich_bars},
+        "throughput": {
+            "client_msgs_per_sec": round(totals["second_messages"] / elapsed_sec, 1),
+            "client_msgs_per_sec_per_client": round(totals["second_messages"] / elapsed_sec / args.clients, 1),
+            "minute_bars": totals["minute_bars"],
+            "enriched_bars": totals["enriched_bars"],
+            "server_msgs_in_per_sec": None,
+            "server_msgs_out_per_sec": None,
+        },
+        "latency_us": merge(histograms).summary_us(),
+        "memory": {"synthetic_feed": rss_mb(feed_process.pid), "feed_server": rss_mb(server_process.pid),
+                   "harness": rss_mb()},
+        "server_event_loop_lag_sec": server_end.get("feed_event_loop_lag_seconds"),
+    }
+    for name, key in (("feed_messages_in_total", "server_msgs_in_per_sec"),
+                      ("feed_messages_out_total", "server_msgs_out_per_sec")):
+        if name in server_start and name in server_end:
+            report["throughput"][key] = round((server_end[name] - server_start[name]) / elapsed_sec, 1)
+    server_process.terminate()
+    feed_process.terminate()
+    return report
+
+
+def print_report(report: dict):
+    print("Load test".center(100, "_"))
+    for section, values in report.items():
+        if isinstance(values, dict):
+            print(f"{section}:")
+            for key, value in values.items():
+                print(f"    {key:<34}{value}")
+        else:
+            print(f"{section:<38}{'-' if values is None else values}")
+
+
+def build_load_test_parser():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--symbols", type=int, default=100, help="symbols subscribed by the feed server")
+    parser.add_argument("--clients", type=int, default=1, help="WebSocketAggProvider clients (feed server users)")
+    parser.add_argument("--duration", type=float, default=30, help="measured seconds, after the warmup")
+    parser.add_argument("--warmup-sec", type=float, default=5)
+    parser.add_argument("--startup-sec", type=float, default=3, help="wait for the feed server to listen")
+    parser.add_argument("--report-sec", type=float, default=5)
+    parser.add_argument("--server-port", type=int, default=8000)
+    parser.add_argument("--no-enrich-bars", action="store_true")
+    parser.add_argument("--json", default=None, help="also write the report to this file")
+    return build_arg_parser(parser)
+
+
+if __name__ == "__main__":
+    load_test_args = build_load_test_parser().parse_args()
+    load_test_report = run_load_test(load_test_args)
+    print_report(load_test_report)
+    if load_test_args.json is not None:
+        with open(load_test_args.json, "w") as report_file:
+            json.dump(load_test_report, report_file, indent=2)
+    # The websocket client threads of the providers have no stop
+    os._exit(0)
@@ -0,0 +1,144 @@
+import struct
+import zlib
+from typing import Dict, Optional
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# Fixed size binary form of the polygon aggregate messages sent to the strategies.
+# ev, channel code (status records only), padding, symbol, 7 prices, 5 integers
+RECORD = struct.Struct("<BB2x12s7d5q")
+RECORD_SIZE = RECORD.size
+SYMBOL_SIZE = 12
+
+EV_SECOND = 1
+EV_MINUTE = 2
+EV_SUBSCRIBED = 3
+EV_UNSUBSCRIBED = 4
+
+EV_CODES = {"A": EV_SECOND, "AM": EV_MINUTE}
+EV_NAMES = {EV_SECOND: "A", EV_MINUTE: "AM"}
+STATUS_PREFIXES = {EV_SUBSCRIBED: "subscribed to", EV_UNSUBSCRIBED: "unsubscribed to"}
+
+
+class RecordEncodeError(ValueError):
+    """The message has no binary form (unknown event or symbol longer than SYMBOL_SIZE)"""
+
+
+def encode_record(data: dict) -> bytes:
+    buffer = bytearray(RECORD_SIZE)
+    encode_record_into(buffer, 0, data)
+    return bytes(buffer)
+
+
+def encode_record_into(buffer, offset: int, data: dict):
+    """
+    Pack one polygon message (A, AM or a subscribed/unsubscribed status) into buffer at offset
+    :raises RecordEncodeError: message can not be represented
+    """
+    ev = data['ev']
+    ev_code = EV_CODES.get(ev)
+    if ev_code is not None:
+        symbol = data['sym'].encode()
+        if len(symbol) > SYMBOL_SIZE:
+            raise RecordEncodeError(f"Symbol too long: {data['sym']}")
+        RECORD.pack_into(buffer, offset, ev_code, 0, symbol,
+                         data.get('op', 0.0) or 0.0, data.get('vw', 0.0) or 0.0, data['o'], data['c'], data['h'],
+                         data['l'], data.get('a', 0.0) or 0.0,
+                         int(data['v']), int(data.get('av', 0) or 0), int(data.get('z', 0) or 0),
+                         data['s'], data['e'])
+        return
+    if ev == "status":
+        message = str(data.get('message', ""))
+        for status_code, prefix in STATUS_PREFIXES.items():
+            if message.startswith(prefix):
+                # "subscribed to: AM.AAPL"
+                channel, symbol = message.split(":", 1)[1].strip().split(".", 1)
+                channel_code = EV_CODES.get(channel)
+                symbol = symbol.encode()
+                if channel_code is None or len(symbol) > SYMBOL_SIZE:
+                    break
+                RECORD.pack_into(buffer, offset, status_code, channel_code, symbol, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0, 0)
+                return
+    raise RecordEncodeError(f"No binary form for: {data}")
+
+
+def decode_record(buffer, offset=0, symbol_cache: Optional[Dict[bytes, str]] = None) -> dict:
+    """
+    Polygon shaped message of the record at offset
+    :param symbol_cache: raw symbol bytes to str, so repeated symbols share one str object
+    """
+    (ev_code, channel_code, raw_symbol, op, vw, o, c, h, l, a, v, av, z, s, e) = RECORD.unpack_from(buffer, offset)
+    symbol = None if symbol_cache is None else symbol_cache.get(raw_symbol)
+    if symbol is None:
+        symbol = raw_symbol.rstrip(b"\0").decode()
+        if symbol_cache is not None:
+            symbol_cache[raw_symbol] = symbol
+    if ev_code == EV_SECOND or ev_code == EV_MINUTE:
+        return {'ev': EV_NAMES[ev_code], 'sym': symbol, 'v': v, 'av': av, 'op': op, 'vw': vw, 'o': o, 'c': c,
+                'h': h, 'l': l, 'a': a, 'z': z, 's': s, 'e': e}
+    return {'ev': "status", 'status': "success",
+            'message': f"{STATUS_PREFIXES[ev_code]}: {EV_NAMES[channel_code]}.{symbol}"}
+
+
+# Binary websocket frames: format code, flags, payload. An empty batch is the bare 2 byte header
+WIRE_JSON = "json"
+WIRE_STRUCT = "struct"
+WIRE_MSGPACK = "msgpack"
+WIRE_FORMAT_CODES = {WIRE_STRUCT: 1, WIRE_MSGPACK: 2}
+WIRE_FORMAT_NAMES = {code: name for name, code in WIRE_FORMAT_CODES.items()}
+FLAG_DEFLATE = 1
+FRAME_HEADER_SIZE = 2
+
+
+def supported_wire_encodings():
+    encodings = [WIRE_JSON, WIRE_STRUCT]
+    if msgpack is not None:
+        encodings.append(WIRE_MSGPACK)
+    return encodings
+
+
+def negotiate_wire_encoding(requested: Optional[str]) -> str:
+    """Encoding the server will use for a client asking for requested. Unknown or unavailable ones fall back to json"""
+    return requested if requested in supported_wire_encodings() else WIRE_JSON
+
+
+def encode_frame(records: list, encoding: str, deflate=False) -> bytes:
+    """
+    Binary frame of decoded polygon messages. Messages without a struct form are left out of struct frames
+    :param deflate: compress the payload with zlib
+    """
+    if encoding == WIRE_STRUCT:
+        buffer = bytearray(RECORD_SIZE * len(records))
+        offset = 0
+        for data in records:
+            try:
+                encode_record_into(buffer, offset, data)
+            except (RecordEncodeError, KeyError, TypeError, ValueError):
+                continue
+            offset += RECORD_SIZE
+        payload = bytes(memoryview(buffer)[:offset])
+    elif encoding == WIRE_MSGPACK:
+        payload = msgpack.packb(records, use_bin_type=True) if records else b""
+    else:
+        raise ValueError(f"Not a binary wire encoding: {encoding}")
+    flags = 0
+    if deflate and payload:
+        payload = zlib.compress(payload, 1)
+        flags |= FLAG_DEFLATE
+    return bytes((WIRE_FORMAT_CODES[encoding], flags)) + payload
+
+
+def decode_frame(frame: bytes, symbol_cache: Optional[Dict[bytes, str]] = None) -> list:
+    """Decoded polygon messages of a binary frame"""
+    if len(frame) <= FRAME_HEADER_SIZE:
+        return []
+    encoding = WIRE_FORMAT_NAMES[frame[0]]
+    payload = frame[FRAME_HEADER_SIZE:]
+    if frame[1] & FLAG_DEFLATE:
+        payload = zlib.decompress(payload)
+    if encoding == WIRE_STRUCT:
+        return [decode_record(payload, offset, symbol_cache) for offset in range(0, len(payload), RECORD_SIZE)]
+    return msgpack.unpackb(payload, raw=False)
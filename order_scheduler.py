@@ -0,0 +1,250 @@
+import time
+from collections import deque
+from concurrent.futures import Future
+from threading import Condition, Lock, Thread
+from typing import Callable, Dict, Hashable, Optional
+
+from latency_tracer import LatencyHistogram
+from structured_logger import get_logger
+
+logger = get_logger("order_scheduler")
+
+# Lanes in priority order. Cancels and sells protect open positions, so they go before everything else
+LANE_CANCEL = 0
+LANE_SELL = 1
+LANE_QUERY = 2
+LANE_BUY = 3
+LANE_NAMES = ("cancel", "sell", "query", "buy")
+
+# Alpaca allows 200 REST requests per minute per account
+ALPACA_REQUESTS_PER_MINUTE = 200
+
+
+class OrderSchedulerStopped(RuntimeError):
+    """The request was still queued when the scheduler stopped"""
+
+
+def is_rate_limited(error: Exception):
+    """True for a 429 response (alpaca APIError or requests HTTPError)"""
+    status_code = getattr(error, "status_code", None)
+    if status_code is None:
+        status_code = getattr(getattr(error, "response", None), "status_code", None)
+    return status_code == 429
+
+
+class TokenBucket:
+    """rate tokens per second, at most capacity of them saved for bursts. Thread safe"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.lock = Lock()
+
+    def __refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def take(self):
+        """
+        Take a token if there is one
+        :return: 0 when taken, else seconds until the next token
+        """
+        with self.lock:
+            self.__refill(time.monotonic())
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+    def drain(self, pause_sec=0.0):
+        """Empty the bucket and delay the refill by pause_sec, e.g. after the server answered 429"""
+        with self.lock:
+            self.__refill(time.monotonic())
+            self.tokens = min(self.tokens, 0.0) - pause_sec * self.rate
+
+
+class ScheduledRequest:
+    __slots__ = ("lane", "key", "call", "future", "enqueued_ns", "attempts")
+
+    def __init__(self, lane: int, key: Optional[Hashable], call: Callable):
+        self.lane = lane
+        self.key = key
+        self.call = call
+        self.future = Future()
+        self.enqueued_ns = time.perf_counter_ns()
+        self.attempts = 0
+
+
+class OrderScheduler:
+    """
+    Sends broker REST calls within the account's rate limit. Calls wait in priority lanes
+    (cancel > sell > query > buy) and worker threads send the highest priority one whenever the token bucket
+    has a token. A request with the same key as a queued one is coalesced with it: both callers get the result
+    of a single call. Only give keys to idempotent calls (cancels, order status or account reads), or to orders
+    carrying the same client_order_id.
+    429 answers drain the bucket and put the request back at the front of its lane
+    """
+
+    def __init__(self, requests_per_minute=ALPACA_REQUESTS_PER_MINUTE, burst=10, workers=4, max_retries=3,
+                 retry_pause_sec=3.0):
+        """
+        :param requests_per_minute: share of the account limit. Processes trading on one account split it
+        :param burst: requests sent back to back before the rate applies
+        :param workers: requests in flight at the same time
+        :param max_retries: retries of a request answered 429
+        :param retry_pause_sec: pause of every request after a 429
+        """
+        self.bucket = TokenBucket(requests_per_minute / 60, burst)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_pause_sec = retry_pause_sec
+        self.lanes = [deque() for _ in LANE_NAMES]
+        self.queued: Dict[Hashable, ScheduledRequest] = {}
+        self.condition = Condition()
+        self.carry_on = False
+        self.threads = []
+        self.metrics_lock = Lock()
+        self.queue_time = [LatencyHistogram() for _ in LANE_NAMES]
+        self.call_time = [LatencyHistogram() for _ in LANE_NAMES]
+        self.requests = [0] * len(LANE_NAMES)
+        self.coalesced = [0] * len(LANE_NAMES)
+        self.failed = [0] * len(LANE_NAMES)
+        self.rate_limited = 0
+        self.throttled = 0
+        self.logging_stats = False
+
+    def start(self):
+        if self.carry_on:
+            return
+        self.carry_on = True
+        for i in range(self.workers):
+            t1 = Thread(target=self.keep_dispatching, name=f"order_scheduler_{i}", daemon=True)
+            t1.start()
+            self.threads.append(t1)
+
+    def stop(self):
+        """Stop the workers. Requests still queued fail with OrderSchedulerStopped"""
+        with self.condition:
+            self.carry_on = False
+            self.condition.notify_all()
+            remaining = [request for lane in self.lanes for request in lane]
+            for lane in self.lanes:
+                lane.clear()
+            self.queued.clear()
+        for request in remaining:
+            request.future.set_exception(OrderSchedulerStopped("Order scheduler stopped"))
+        for t1 in self.threads:
+            t1.join()
+        self.threads = []
+        self.logging_stats = False
+
+    def submit(self, lane: int, call: Callable, key: Optional[Hashable] = None) -> Future:
+        """
+        Queue a call
+        :param key: requests with equal keys queued at the same time are sent once
+        :return: future of the call's result
+        """
+        with self.condition:
+            if key is not None:
+                queued = self.queued.get(key)
+                if queued is not None:
+                    self.coalesced[lane] += 1
+                    return queued.future
+            request = ScheduledRequest(lane, key, call)
+            self.lanes[lane].append(request)
+            if key is not None:
+                self.queued[key] = request
+            self.requests[lane] += 1
+            self.condition.notify()
+        return request.future
+
+    def call(self, lane: int, call: Callable, key: Optional[Hashable] = None):
+        """Queue a call and wait for its result. Called directly when the scheduler is not running"""
+        if not self.carry_on:
+            return call()
+        return self.submit(lane, call, key).result()
+
+    def next_request(self) -> Optional[ScheduledRequest]:
+        """Highest priority request once a token is taken for it. None when stopping"""
+        with self.condition:
+            while self.carry_on:
+                lane = next((lane for lane in self.lanes if lane), None)
+                if lane is None:
+                    self.condition.wait()
+                    continue
+                wait_sec = self.bucket.take()
+                if wait_sec == 0:
+                    request = lane.popleft()
+                    if request.key is not None and self.queued.get(request.key) is request:
+                        del self.queued[request.key]
+                    return request
+                self.throttled += 1
+                # Woken earlier by new requests, which may be in a higher lane
+                self.condition.wait(wait_sec)
+            return None
+
+    def keep_dispatching(self):
+        while True:
+            request = self.next_request()
+            if request is None:
+                break
+            self.dispatch(request)
+
+    def dispatch(self, request: ScheduledRequest):
+        st = time.perf_counter_ns()
+        if request.attempts == 0:
+            with self.metrics_lock:
+                self.queue_time[request.lane].record(st - request.enqueued_ns)
+        try:
+            result = request.call()
+        except Exception as e:
+            if is_rate_limited(e) and request.attempts < self.max_retries:
+                request.attempts += 1
+                self.bucket.drain(self.retry_pause_sec)
+                with self.condition:
+                    self.rate_limited += 1
+                    self.lanes[request.lane].appendleft(request)
+                    self.condition.notify()
+                logger.warning("order_request_rate_limited", lane=LANE_NAMES[request.lane], attempts=request.attempts,
+                               pause_sec=self.retry_pause_sec)
+                return
+            with self.metrics_lock:
+                self.failed[request.lane] += 1
+            request.future.set_exception(e)
+            return
+        with self.metrics_lock:
+            self.call_time[request.lane].record(time.perf_counter_ns() - st)
+        request.future.set_result(result)
+
+    def queue_depths(self):
+        with self.condition:
+            return {name: len(lane) for name, lane in zip(LANE_NAMES, self.lanes)}
+
+    def summary(self, reset=False):
+        """Requests, coalesced requests, failures, queue depth and queue / call time (us) of every lane"""
+        depths = self.queue_depths()
+        with self.metrics_lock:
+            lanes = {name: {"requests": self.requests[i], "coalesced": self.coalesced[i], "failed": self.failed[i],
+                            "queued": depths[name], "queue_time_us": self.queue_time[i].summary_us(),
+                            "call_time_us": self.call_time[i].summary_us()}
+                     for i, name in enumerate(LANE_NAMES)}
+            if reset:
+                for histogram in self.queue_time + self.call_time:
+                    histogram.reset()
+        return {"lanes": lanes, "rate_limited": self.rate_limited, "throttled": self.throttled}
+
+    def keep_logging_stats(self, interval_sec: float):
+        while self.logging_stats:
+            time.sleep(interval_sec)
+            summary = self.summary(reset=True)
+            if any(lane["queue_time_us"]["count"] > 0 for lane in summary["lanes"].values()):
+                logger.info("order_scheduler_stats", **summary)
+
+    def start_periodic_log(self, interval_sec=60):
+        if self.logging_stats:
+            return
+        self.logging_stats = True
+        t1 = Thread(target=self.keep_logging_stats, args=[interval_sec], name="order_scheduler_stats", daemon=True)
+        t1.start()
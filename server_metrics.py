@@ -0,0 +1,110 @@
+import time
+from threading import Lock
+from typing import Callable, Dict, List, Optional
+
+from latency_tracer import LatencyHistogram
+
+
+class RateCounter:
+    """Monotonic counter which also reports its per second rate over the last window_sec seconds"""
+
+    def __init__(self, window_sec=10):
+        self.window_sec = window_sec
+        self.total = 0
+        self.buckets = [0] * window_sec
+        self.bucket_secs = [0] * window_sec
+        self.lock = Lock()
+
+    def add(self, count=1):
+        now_sec = int(time.monotonic())
+        i = now_sec % self.window_sec
+        with self.lock:
+            if self.bucket_secs[i] != now_sec:
+                self.bucket_secs[i] = now_sec
+                self.buckets[i] = 0
+            self.buckets[i] += count
+            self.total += count
+
+    def per_second(self):
+        now_sec = int(time.monotonic())
+        with self.lock:
+            # The running second is incomplete, so the rate is taken over the previous full seconds
+            total = sum(count for count, sec in zip(self.buckets, self.bucket_secs)
+                        if now_sec - self.window_sec < sec < now_sec)
+        return total / (self.window_sec - 1)
+
+
+class PrometheusText:
+    """Builds the prometheus text exposition format"""
+
+    def __init__(self):
+        self.lines: List[str] = []
+
+    def add(self, name: str, metric_type: str, help_text: str, samples: Dict[Optional[str], float]):
+        """
+        :param samples: label string (e.g. 'client_id="1111"') or None mapped to the value
+        """
+        self.lines.append(f"# HELP {name} {help_text}")
+        self.lines.append(f"# TYPE {name} {metric_type}")
+        for labels, value in samples.items():
+            self.lines.append(f"{name}{{{labels}}} {value}" if labels else f"{name} {value}")
+
+    def add_histogram_summary(self, name: str, help_text: str, histogram: LatencyHistogram):
+        """LatencyHistogram (ns) exported as a prometheus summary in seconds"""
+        samples = {f'quantile="{q}"': histogram.value_at_percentile(q * 100) / 1e9 for q in (0.5, 0.9, 0.99)}
+        self.add(name, "summary", help_text, samples)
+        self.lines.append(f"{name}_sum {histogram.total_ns / 1e9}")
+        self.lines.append(f"{name}_count {histogram.total_count}")
+
+    def render(self):
+        return "\n".join(self.lines) + "\n"
+
+
+class FeedMetricsCollector:
+    """Collects the feed server metrics from the storage, stream, detector and websocket server"""
+
+    def __init__(self, storage, stream=None, detector=None, server=None):
+        self.storage = storage
+        self.stream = stream
+        self.detector = detector
+        self.server = server
+        self.extra_collectors: List[Callable[[PrometheusText], None]] = []
+
+    def attach_collector(self, collector: Callable[[PrometheusText], None]):
+        """Extra metrics. The callable adds its samples to the given PrometheusText"""
+        self.extra_collectors.append(collector)
+
+    def render(self):
+        text = PrometheusText()
+        text.add("feed_messages_in_total", "counter", "Polygon messages stored for the websocket clients",
+                 {None: self.storage.messages_in.total})
+        text.add("feed_messages_in_per_second", "gauge", "Polygon messages stored per second",
+                 {None: self.storage.messages_in.per_second()})
+        text.add("feed_messages_out_total", "counter", "Messages sent to the websocket clients",
+                 {None: self.storage.messages_out.total})
+        text.add("feed_messages_out_per_second", "gauge", "Messages sent to the websocket clients per second",
+                 {None: self.storage.messages_out.per_second()})
+        text.add("feed_client_queue_depth", "gauge", "Messages waiting to be read by each websocket client",
+                 {f'client_id="{client_id}"': depth for client_id, depth in self.storage.get_queue_depths().items()})
+        if self.stream is not None:
+            text.add("feed_subscribed_symbols", "gauge", "Symbols subscribed on the polygon stream",
+                     {None: len(self.stream.current_subscribed)})
+            if hasattr(self.stream, "reconnects"):
+                text.add("feed_polygon_reconnects_total", "counter", "Reconnects after a dropped polygon connection",
+                         {None: self.stream.reconnects})
+                text.add("feed_backfilled_bars_total", "counter", "Minute bars missed while disconnected",
+                         {None: self.stream.backfilled_bars})
+        poll_latency = getattr(self.detector, "poll_latency", None)
+        if poll_latency is not None:
+            text.add_histogram_summary("feed_detector_poll_latency_seconds", "Gainers snapshot request latency",
+                                       poll_latency)
+        if self.server is not None:
+            text.add("feed_websocket_clients", "gauge", "Connected websocket clients",
+                     {None: len(self.server.connection_manager.connected_users)})
+            text.add("feed_event_loop_lag_seconds", "gauge", "Latest event loop scheduling delay",
+                     {None: self.server.event_loop_lag_sec})
+            text.add_histogram_summary("feed_event_loop_lag_distribution_seconds", "Event loop scheduling delay",
+                                       self.server.event_loop_lag)
+        for collector in self.extra_collectors:
+            collector(text)
+        return text.render()
@@ -0,0 +1,177 @@
+import mmap
+import os
+import struct
+import tempfile
+import time
+from threading import Lock, Thread
+from typing import Callable, List
+
+from market_codec import RECORD_SIZE, RecordEncodeError, decode_record, encode_record_into
+from structured_logger import get_logger
+
+logger = get_logger("shared_market_bus")
+
+SHARED_BUS_PATH = os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(),
+                               "polygon_market_bus")
+BUS_MAGIC = b"MKTBUS01"
+# magic, record size, capacity, write sequence. Padded to 64 bytes
+HEADER = struct.Struct("<8sIIQ")
+HEADER_SIZE = 64
+WRITE_SEQ_OFFSET = 16
+SEQ = struct.Struct("<Q")
+SLOT_SIZE = SEQ.size + RECORD_SIZE
+
+
+def bus_file_size(capacity: int):
+    return HEADER_SIZE + capacity * SLOT_SIZE
+
+
+class SharedMarketBusWriter:
+    """
+    Writer side of a memory mapped ring buffer of market_codec records. The bus has a single writer: publish
+    holds a lock, as the feed stores records from several threads (stream, minute bar timer, backfill).
+    Every slot starts with a sequence number, odd (2n + 1) while record n is being written and even (2n + 2) once
+    complete, so readers detect records overwritten while they were copying them. The header write sequence is
+    published after the records, readers never read past it
+    """
+
+    def __init__(self, path=SHARED_BUS_PATH, capacity=65536):
+        self.path = path
+        self.capacity = capacity
+        self.write_seq = 0
+        self.dropped = 0
+        self.lock = Lock()
+        size = bus_file_size(capacity)
+        fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+        try:
+            os.ftruncate(fd, size)
+            self.buffer = mmap.mmap(fd, size)
+        finally:
+            os.close(fd)
+        HEADER.pack_into(self.buffer, 0, BUS_MAGIC, RECORD_SIZE, capacity, 0)
+
+    def publish(self, records: List[dict]):
+        """Append decoded polygon messages. Messages without a binary form are counted in dropped. Thread safe"""
+        buffer = self.buffer
+        with self.lock:
+            seq = self.write_seq
+            for data in records:
+                offset = HEADER_SIZE + (seq % self.capacity) * SLOT_SIZE
+                SEQ.pack_into(buffer, offset, 2 * seq + 1)
+                try:
+                    encode_record_into(buffer, offset + SEQ.size, data)
+                except (RecordEncodeError, KeyError, TypeError, ValueError):
+                    self.dropped += 1
+                    continue
+                SEQ.pack_into(buffer, offset, 2 * seq + 2)
+                seq += 1
+            if seq != self.write_seq:
+                self.write_seq = seq
+                SEQ.pack_into(buffer, WRITE_SEQ_OFFSET, seq)
+
+    def close(self):
+        self.buffer.close()
+
+
+class SharedMarketBusReader:
+    """
+    One of many readers of a SharedMarketBusWriter ring buffer. A new reader starts at the current end.
+    A reader lapped by the writer skips to the oldest record still in the buffer and counts the lost records
+    """
+
+    def __init__(self, path=SHARED_BUS_PATH):
+        self.path = path
+        self.buffer = None
+        self.capacity = 0
+        self.next_seq = 0
+        self.lost = 0
+        self.symbol_cache = {}
+        self.carry_on = False
+        self.on_records = self.on_records_default
+
+    def open(self):
+        """Map the bus file. False if the writer has not created it yet"""
+        try:
+            fd = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return False
+        try:
+            size = os.fstat(fd).st_size
+            if size < HEADER_SIZE:
+                return False
+            buffer = mmap.mmap(fd, size, access=mmap.ACCESS_READ)
+        finally:
+            os.close(fd)
+        magic, record_size, capacity, write_seq = HEADER.unpack_from(buffer, 0)
+        if magic != BUS_MAGIC or record_size != RECORD_SIZE or size < bus_file_size(capacity):
+            buffer.close()
+            return False
+        self.buffer = buffer
+        self.capacity = capacity
+        self.next_seq = write_seq
+        return True
+
+    def read_available(self, max_records=4096) -> List[dict]:
+        buffer = self.buffer
+        write_seq = SEQ.unpack_from(buffer, WRITE_SEQ_OFFSET)[0]
+        if write_seq < self.next_seq:
+            # Writer restarted
+            self.next_seq = write_seq
+        if write_seq - self.next_seq > self.capacity:
+            self.lost += write_seq - self.capacity - self.next_seq
+            self.next_seq = write_seq - self.capacity
+        records = []
+        seq = self.next_seq
+        end = min(write_seq, seq + max_records)
+        while seq < end:
+            offset = HEADER_SIZE + (seq % self.capacity) * SLOT_SIZE
+            expected = 2 * seq + 2
+            if SEQ.unpack_from(buffer, offset)[0] != expected:
+                break
+            record = decode_record(buffer, offset + SEQ.size, self.symbol_cache)
+            if SEQ.unpack_from(buffer, offset)[0] != expected:
+                break
+            records.append(record)
+            seq += 1
+        if seq < end:
+            # Overwritten while reading. Continue from the oldest record the writer has not reached yet
+            latest = SEQ.unpack_from(buffer, WRITE_SEQ_OFFSET)[0]
+            resume = max(seq + 1, latest - self.capacity + 1)
+            self.lost += resume - seq
+            seq = resume
+        self.next_seq = seq
+        return records
+
+    def on_records_default(self, records: List[dict]):
+        pass
+
+    def attach_on_records_listener(self, on_records: Callable[[List[dict]], None]):
+        """
+        :param on_records: params(records) polygon shaped messages in publish order
+        """
+        self.on_records = on_records
+
+    def keep_reading(self, idle_sleep_sec: float, spin_count: int):
+        while self.carry_on and not self.open():
+            time.sleep(1)
+        logger.info("shared_bus_attached", path=self.path, capacity=self.capacity)
+        idle = 0
+        while self.carry_on:
+            records = self.read_available()
+            if records:
+                idle = 0
+                self.on_records(records)
+            else:
+                # Spin briefly for bursts, then sleep to stay off the cpu
+                idle += 1
+                if idle > spin_count:
+                    time.sleep(idle_sleep_sec)
+
+    def start_reading(self, idle_sleep_sec=0.0005, spin_count=100):
+        self.carry_on = True
+        t1 = Thread(target=self.keep_reading, args=[idle_sleep_sec, spin_count], name="shared_bus_reader",
+                    daemon=True)
+        t1.start()
+
+    def stop_reading(self):
+        self.carry_on = False
@@ -1,21 +1,28 @@
+import heapq
 import json
+import logging
 import time
 from abc import ABC, abstractmethod
-from threading import Thread
-from typing import Callable, Optional
+from concurrent.futures import ThreadPoolExecutor
+from threading import Condition, Event, Lock, Thread
+from typing import Callable, Dict, Optional
 from creds import PolygonCreds
 import requests
-from data_processor import TimedStorage
-import pandas as pd
+from data_processor import AggregateMaker, TimedStorage
+from latency_tracer import LatencyHistogram
+from server_metrics import RateCounter
+from structured_logger import get_logger, elapsed_ms
+from symbol_table import SymbolRegistry, get_symbol_registry
+
+logger = get_logger("stock_data")
 
 
 class AllowedSymbols:
-    def __init__(self):
-        self.candidate_ticks = {symbol: True for symbol in
-                                list(set(pd.read_csv("non_otc_symbols_2021_08_01.csv")["symbol"]))}
+    def __init__(self, registry: SymbolRegistry = None):
+        self.registry = registry if registry is not None else get_symbol_registry()
 
     def is_allowed_symbol(self, symbol: str):
-        return symbol in self.candidate_ticks
+        return self.registry.is_listed(symbol)
 
 
 class StockDetector(ABC):
@@ -23,6 +30,7 @@ class StockDetector(ABC):
 
     def __init__(self):
         self.storage = []
+        self.timed_storage = TimedStorage()
 
     @abstractmethod
     def start_detecting(self):
@@ -32,6 +40,24 @@ class StockDetector(ABC):
     def stop_detecting(self):
         """Stop detecting stock"""
 
+    def get_detected_symbols(self):
+        return self.timed_storage.get_ids()
+
+    def get_detected_id_data_and_deleted(self):
+        logger.debug("growth_data_passed")
+        return self.timed_storage.get_id_and_data_and_deleted()
+
+    def attach_symbol_change_listeners(self, on_detected_callable: Callable[[str, object], None],
+                                       on_expired_callable: Callable[[str, object], None]):
+        """
+        Push detected and expired symbols to the listeners as soon as they happen
+        :param on_detected_callable: params(symbol, todays_change_perc)
+        :param on_expired_callable: params(symbol, todays_change_perc)
+        :return:
+        """
+        self.timed_storage.attach_on_added_listener(on_detected_callable)
+        self.timed_storage.attach_on_expired_listener(on_expired_callable)
+
 
 class PolygonTop20Detector(StockDetector):
     """Detect top 20 growth and filter it by target_growth in percentage"""
@@ -43,28 +69,31 @@ class PolygonTop20Detector(StockDetector):
         self.polygon_secret_key = polygon_creds.secret_key
         self.search_each_sec = search_each_sec
         self.validity = validity_min
-        self.timed_storage = TimedStorage()
         self.allowed_symbols = AllowedSymbols()
+        self.poll_latency = LatencyHistogram()
         self.t1 = Thread(target=self.start_detecting, name="growth_detector")
         self.t1.start()
 
     def start_detecting(self):
         """keep detecting growth after a specified interval"""
         wait_detection = 30
-        print(f"Growth Detection will start withing {wait_detection}sec")
+        logger.info("growth_detection_scheduled", start_in_sec=wait_detection)
         try:
             time.sleep(wait_detection)  # Giving some time to the client to connect, so that they receive immediate data
         except:
-            print("Sleeping error. Fixed")
+            logger.warning("growth_detection_sleep_interrupted")
         while self.carry_on:
             try:
-                print(f"searching growth : {self.search_each_sec}")
+                logger.sampled(logging.DEBUG, "growth_search", every=100, interval_sec=self.search_each_sec)
                 try:
                     time.sleep(self.search_each_sec)
                 except:
-                    print("Search Growth time error")
+                    logger.warning("growth_search_sleep_interrupted")
+                st = time.perf_counter_ns()
                 res = requests.get(
                     f"https://api.polygon.io/v2/snapshot/locale/us/markets/stocks/gainers?&apiKey={self.polygon_secret_key}")
+                self.poll_latency.record(time.perf_counter_ns() - st)
+                logger.sampled(logging.DEBUG, "gainers_polled", every=100, latency_ms=elapsed_ms(st))
                 data = json.loads(res.text)
 
                 if data['status'] == 'OK':
@@ -73,27 +102,133 @@ class PolygonTop20Detector(StockDetector):
                             if not self.allowed_symbols.is_allowed_symbol(d['ticker']):
                                 # Skip if not allowed
                                 continue
-                            if d['ticker'] not in self.timed_storage.get_ids():
-                                print(f"GROWTH FOUND: {d['ticker']} : {d['todaysChangePerc']}")
+                            if d['ticker'] not in self.timed_storage:
+                                logger.info("growth_found", symbol=d['ticker'], change_perc=d['todaysChangePerc'])
                                 self.timed_storage.push(id=d['ticker'], data=d['todaysChangePerc'],
                                                         delete_after_min=self.validity)
             except:
-                print("Error on fetchin growth data")
                 try:
-                    print(data)
+                    logger.exception("growth_fetch_failed", response=data)
                 except:
-                    pass
-        print(f"GROWTH DETECTION STOPPED: CARRY_ON = {self.carry_on}")
+                    logger.exception("growth_fetch_failed")
+        logger.warning("growth_detection_stopped", carry_on=self.carry_on)
 
     def stop_detecting(self):
         self.carry_on = False
 
-    def get_detected_symbols(self):
-        return self.timed_storage.get_ids()
 
-    def get_detected_id_data_and_deleted(self):
-        print("GROWTH DATA PASSED")
-        return self.timed_storage.get_id_and_data_and_deleted()
+class PolygonLocalGainersDetector(StockDetector):
+    """
+    Compute today's change percentage of every allowed symbol from the full market aggregate stream
+    and filter it by target_growth in percentage. No REST polling after the previous close is loaded.
+    """
+
+    def __init__(self, polygon_creds: PolygonCreds, target_growth, validity_min=24 * 60, channel="AM",
+                 prev_close: Optional[Dict[str, float]] = None, start_stream=True):
+        """
+        :param channel: 'AM' or 'A' aggregates of all symbols ('AM.*') are used to track the last price
+        :param prev_close: previous day close by symbol. Fetched from polygon grouped daily bars when None
+        :param start_stream: False to only feed the detector through replay()
+        """
+        super().__init__()
+        self.target_growth = target_growth
+        self.carry_on = True
+        self.polygon_creds = polygon_creds
+        self.polygon_secret_key = polygon_creds.secret_key
+        self.validity = validity_min
+        self.channel = channel
+        self.allowed_symbols = AllowedSymbols()
+        self.registry = self.allowed_symbols.registry
+        self.universe_size = self.registry.universe_size
+        self.prev_close = self.registry.new_array('d')
+        self.last_price = self.registry.new_array('d')
+        self.change_perc = self.registry.new_array('d')
+        self.set_previous_close(prev_close if prev_close is not None else self.fetch_previous_close())
+        self.market_stream = None
+        if start_stream:
+            self.market_stream = PolygonStream(self.polygon_creds, channel=[self.channel])
+            self.market_stream.create_client(self.on_msg)
+            self.t1 = Thread(target=self.start_detecting, name="growth_detector")
+            self.t1.start()
+
+    def fetch_previous_close(self, max_days_back=7):
+        """Previous trading day close of all symbols using a single grouped daily bars request"""
+        from custom_time import CustomTimeZone
+        market_time = CustomTimeZone(CustomTimeZone.STOCK_MARKET_LOCATION)
+        today = market_time.get_current_iso_date()
+        for n in range(1, max_days_back + 1):
+            date = market_time.reduce_n_day_from_iso_date(n, today)[:10]
+            try:
+                res = requests.get(f"https://api.polygon.io/v2/aggs/grouped/locale/us/market/stocks/{date}"
+                                   f"?adjusted=true&apiKey={self.polygon_secret_key}")
+                data = json.loads(res.text)
+                if data.get('resultsCount', 0) > 0:
+                    logger.info("previous_close_loaded", date=date, symbols=data['resultsCount'])
+                    return {d['T']: d['c'] for d in data['results']}
+            except:
+                logger.exception("previous_close_fetch_failed", date=date)
+        return {}
+
+    def set_previous_close(self, prev_close: Dict[str, float]):
+        for symbol, close in prev_close.items():
+            if self.registry.is_listed(symbol):
+                self.prev_close[self.registry.get_id(symbol)] = close
+
+    def start_detecting(self):
+        """Stream aggregates of all symbols and detect growth on every received bar"""
+        if self.market_stream is None:
+            self.market_stream = PolygonStream(self.polygon_creds, channel=[self.channel])
+        self.market_stream.start_stream(self.on_msg)
+        for attempt in range(10):
+            try:
+                self.market_stream.add_symbols(["*"])
+                logger.info("growth_detection_streaming", channel=self.channel)
+                return
+            except:
+                # Socket is not open yet
+                time.sleep(1)
+        logger.error("growth_detection_stopped", reason="could not subscribe to the full market stream")
+
+    def stop_detecting(self):
+        self.carry_on = False
+        if self.market_stream is not None:
+            self.market_stream.stop_stream()
+
+    def on_msg(self, msg):
+        self.on_aggregates(json.loads(msg))
+
+    def replay(self, messages):
+        """Feed recorded aggregate messages (dicts or raw polygon frames) instead of the live stream"""
+        for msg in messages:
+            if isinstance(msg, str):
+                self.on_msg(msg)
+            else:
+                self.on_aggregates([msg])
+
+    def on_aggregates(self, data: list):
+        if not self.carry_on:
+            return
+        for d in data:
+            if d['ev'] != 'A' and d['ev'] != 'AM':
+                continue
+            i = self.registry.get_id(d['sym'])
+            if i is None or i >= self.universe_size:
+                # Skip if not allowed
+                continue
+            prev = self.prev_close[i]
+            if prev <= 0:
+                continue
+            self.last_price[i] = d['c']
+            change = (d['c'] - prev) * 100 / prev
+            self.change_perc[i] = change
+            if change >= self.target_growth and d['sym'] not in self.timed_storage:
+                logger.info("growth_found", symbol=d['sym'], change_perc=change)
+                self.timed_storage.push(id=d['sym'], data=change, delete_after_min=self.validity)
+
+    def get_gainers(self, top=20):
+        """Top gainers of the whole market as (symbol, todays_change_perc)"""
+        best = heapq.nlargest(top, range(self.universe_size), key=self.change_perc.__getitem__)
+        return [(self.registry.get_symbol(i), self.change_perc[i]) for i in best if self.prev_close[i] > 0]
 
 
 class MarketStream(ABC):
@@ -139,22 +274,29 @@ class PolygonStream(MarketStream):
                 raise Exception(f"Channel '{channel}' is not valid")
         self.channel = [f"{ch}." for ch in channel]
         self.key = polygon_creds.secret_key  # Polygon Key
+        self.my_client = None
+
+    def create_client(self, on_msg_callback: Callable):
+        """
+        The client installs signal handlers, so it must be created on the main thread. Call this before running
+        start_stream on another thread
+        """
+        from polygon import WebSocketClient, STOCKS_CLUSTER
+        if self.my_client is None:
+            self.my_client = WebSocketClient(cluster=STOCKS_CLUSTER, auth_key=self.key,
+                                             process_message=on_msg_callback,
+                                             on_close=self.closed, on_error=self.error)
+        return self.my_client
 
     def start_stream(self, on_msg_callback: Callable, on_close_callback: Optional[Callable] = None,
                      on_error_callback: Optional[Callable] = None):
-        from polygon import WebSocketClient, STOCKS_CLUSTER
-        self.my_client = WebSocketClient(cluster=STOCKS_CLUSTER, auth_key=self.key,
-                                         process_message=on_msg_callback,
-                                         on_close=self.closed, on_error=self.error)
-        self.my_client.run_async()
+        self.create_client(on_msg_callback).run_async()
 
-    def closed(self, msg):
-        print(msg)
-        print("COnnection closed")
+    def closed(self, socket, *close_args):
+        logger.warning("polygon_connection_closed", msg=close_args)
 
-    def error(self, msg):
-        print(msg)
-        print("COnnection error")
+    def error(self, socket, msg=None):
+        logger.error("polygon_connection_error", msg=msg)
 
     def stop_stream(self):
         self.my_client.close_connection()
@@ -179,6 +321,13 @@ class RealTimeDataStorageForWebSocketClients:
     def __init__(self):
         self.client_ids = []
         self.client_data = {}
+        self.messages_in = RateCounter()
+        self.messages_out = RateCounter()
+        self.on_records_listeners = []
+        self.records_enricher = None
+        # Records come from the websocket, the bar closing timer and the backfill threads. The enricher keeps
+        # per symbol state and the clients expect the records in order, so one batch is stored at a time
+        self.lock = Lock()
 
     async def get_data(self, client_id):
         """
@@ -186,73 +335,232 @@ class RealTimeDataStorageForWebSocketClients:
         :param client_id:
         :return:
         """
-        res = json.dumps(self.client_data[client_id])
-        self.client_data[client_id].clear()
-        return res
+        return json.dumps(await self.get_records(client_id))
+
+    async def get_records(self, client_id):
+        """Decoded messages stored for the client since its last read"""
+        with self.lock:
+            data = self.client_data[client_id]
+            self.client_data[client_id] = []
+        self.messages_out.add(len(data))
+        return data
+
+    def get_queue_depths(self):
+        """Number of messages waiting for each client"""
+        return {client_id: len(self.client_data.get(client_id, [])) for client_id in list(self.client_ids)}
 
     def store_data(self, data):
-        data = json.loads(data)
-        for client_id in self.client_ids:
-            for one_data in data:
-                self.client_data[client_id].append(one_data)
+        self.store_records(json.loads(data))
+
+    def store_records(self, data: list):
+        """Store already decoded polygon messages"""
+        self.messages_in.add(len(data))
+        with self.lock:
+            if self.records_enricher is not None:
+                self.records_enricher(data)
+            for on_records in self.on_records_listeners:
+                on_records(data)
+            for client_id in self.client_ids:
+                self.client_data[client_id].extend(data)
+
+    def attach_on_records_listener(self, on_records: Callable[[list], None]):
+        """
+        Receive every stored batch of messages besides the websocket clients (e.g. SharedMarketBusWriter.publish)
+        :param on_records: params(records)
+        """
+        self.on_records_listeners.append(on_records)
+
+    def attach_records_enricher_callable(self, records_enricher: Callable[[list], None]):
+        """
+        Modify the messages in place before they reach the listeners and clients (e.g. MinuteBarEnricher.enrich)
+        :param records_enricher: params(records)
+        """
+        self.records_enricher = records_enricher
 
     def register_new_client(self, client_id: int):
-        self.client_ids.append(client_id)
-        self.client_data[client_id] = []
-        print(f"Client: {client_id} connected")
+        with self.lock:
+            self.client_ids.append(client_id)
+            self.client_data[client_id] = []
+        logger.info("client_connected", client_id=client_id)
 
     def client_disconnected(self, client_id: int):
-        self.client_ids.remove(client_id)
-        del self.client_data[client_id]
-        print(f"Client: {client_id} disconnected")
+        with self.lock:
+            self.client_ids.remove(client_id)
+            del self.client_data[client_id]
+        logger.info("client_disconnected", client_id=client_id)
 
 
 class PolygonDataStreamMultipleClient(PolygonStream):
-    def __init__(self, polygon_creds: PolygonCreds, channel: list):
+    def __init__(self, polygon_creds: PolygonCreds, channel: list, subscription_batch_ms=5, local_minute_bars=False,
+                 max_reconnect_delay_sec=30, auth_timeout_sec=5, backfill=True, max_parallel_backfills=8,
+                 feed_url=None):
+        """
+        :param local_minute_bars: build AM bars from the A channel instead of subscribing to AM. Subscription
+                                  status of A is forwarded to clients as AM as well
+        :param max_reconnect_delay_sec: reconnect attempts after a dropped connection back off exponentially up to it
+        :param auth_timeout_sec: a reconnect attempt fails if polygon does not authenticate within it
+        :param backfill: after a reconnect, fetch the minute bars missed while disconnected from the REST api and
+                         store them before the live bars of the same symbols
+        :param feed_url: websocket url used instead of polygon's (e.g. synthetic_polygon_feed for load tests)
+        """
         super().__init__(polygon_creds, channel)
+        self.aggregate_maker = None
+        if local_minute_bars:
+            if "A" not in channel or "AM" in channel:
+                raise Exception("Local minute bars need channel A without AM")
+            self.aggregate_maker = AggregateMaker(scale="minute")
+            self.aggregate_maker.attach_on_bar_listener(self.on_local_bar)
         self.storage = None
         self.auto_sub_unsub_func = self.auto_sub_unsub
         self.current_subscribed = {}
+        self.subscription_batch_sec = subscription_batch_ms / 1000
+        self.pending_subscribe = {}
+        self.pending_unsubscribe = {}
+        self.subscription_condition = Condition()
+        self.symbol_registry = get_symbol_registry()
+        self.max_reconnect_delay_sec = max_reconnect_delay_sec
+        self.auth_timeout_sec = auth_timeout_sec
+        self.backfill = backfill
+        self.max_parallel_backfills = max_parallel_backfills
+        self.keep_connected = True
+        self.authenticated = Event()
+        self.reconnect_lock = Lock()
+        self.reconnecting = False
+        self.closed_while_reconnecting = False
+        self.reconnects = 0
+        self.disconnected_at_ms = 0
+        self.last_bar_start: Dict[str, int] = {}  # symbol -> start of the last stored minute bar
+        self.backfill_lock = Lock()
+        self.backfilling = False
+        self.held_bars: Dict[str, list] = {}  # symbol -> live minute bars waiting for the symbol's backfill
+        self.backfilled_bars = 0
+        self.feed_url = feed_url
+        self.my_client = None
 
     def attach_client_storage(self, storage: RealTimeDataStorageForWebSocketClients):
         self.storage = storage
 
     def on_msg(self, msg):
-        print(".", end="")
-        self.storage.store_data(msg)
+        logger.sampled(logging.DEBUG, "frame_received", every=1000, size=len(msg))
+        if not self.authenticated.is_set() and "auth_success" in msg:
+            self.authenticated.set()
+        if self.aggregate_maker is None:
+            self.store_stream_records(json.loads(msg))
+            return
+        data = json.loads(msg)
+        records = []
+        for d in data:
+            records.append(d)
+            if d['ev'] == 'status':
+                message = str(d.get('message', ''))
+                if message.startswith("subscribed to: A.") or message.startswith("unsubscribed to: A."):
+                    # Clients expect the AM subscription status to prepare minute data storage
+                    prefix, channeled_symbol = message.split(":", 1)
+                    records.append({**d, "message": f"{prefix}: AM.{channeled_symbol.strip()[2:]}"})
+                    if prefix == "unsubscribed to":
+                        self.aggregate_maker.discard_symbol(channeled_symbol.strip()[2:])
+        self.store_stream_records(records)
+        # Bars completed by this frame are stored after the second data which completed them
+        for d in data:
+            if d['ev'] == 'A':
+                self.aggregate_maker.add_second_data(d)
+
+    def on_local_bar(self, bar: dict):
+        self.store_stream_records([bar])
+
+    def store_stream_records(self, records: list):
+        """
+        Store live messages. Keeps the start of every symbol's last minute bar for backfills, and while a
+        backfill runs, holds back the minute bars of symbols whose missed bars are not stored yet
+        """
+        if self.backfilling:
+            with self.backfill_lock:
+                if self.held_bars:
+                    live = []
+                    for d in records:
+                        if d['ev'] == 'AM' and d['sym'] in self.held_bars:
+                            self.held_bars[d['sym']].append(d)
+                        else:
+                            live.append(d)
+                    records = live
+        last_bar_start = self.last_bar_start
+        for d in records:
+            if d['ev'] == 'AM':
+                last_bar_start[d['sym']] = d['s']
+        self.storage.store_records(records)
+
+    def request_subscribe(self, symbol: str, data=None):
+        """Queue symbol for the next batched subscribe frame. Can be attached as detector's on_detected listener"""
+        symbol = self.symbol_registry.intern(symbol)
+        with self.subscription_condition:
+            self.pending_unsubscribe.pop(symbol, None)
+            if symbol not in self.current_subscribed:
+                self.pending_subscribe[symbol] = True
+                self.subscription_condition.notify()
+
+    def request_unsubscribe(self, symbol: str, data=None):
+        """Queue symbol for the next batched unsubscribe frame. Can be attached as detector's on_expired listener"""
+        with self.subscription_condition:
+            self.pending_subscribe.pop(symbol, None)
+            if symbol in self.current_subscribed:
+                self.pending_unsubscribe[symbol] = True
+                self.subscription_condition.notify()
+
+    def keep_flushing_subscriptions(self):
+        """Send pending subscriptions as one subscribe frame and one unsubscribe frame per batch window"""
+        while True:
+            with self.subscription_condition:
+                while len(self.pending_subscribe) == 0 and len(self.pending_unsubscribe) == 0:
+                    self.subscription_condition.wait()
+            # Let symbols detected in the same burst join this frame
+            time.sleep(self.subscription_batch_sec)
+            with self.subscription_condition:
+                new_subs = list(self.pending_subscribe)
+                expired = list(self.pending_unsubscribe)
+                self.pending_subscribe = {}
+                self.pending_unsubscribe = {}
+                for exp in expired:
+                    del self.current_subscribed[exp]
+                for v in new_subs:
+                    self.current_subscribed[v] = True
+            try:
+                if len(expired) > 0:
+                    logger.info("unsubscribing", symbols=expired)
+                    self.remove_symbols(expired)
+                if len(new_subs) > 0:
+                    logger.info("subscribing", symbols=new_subs)
+                    self.add_symbols(new_subs)
+            except Exception as e:
+                logger.error("subscription_frame_failed", error=e, retry=True)
+                with self.subscription_condition:
+                    for exp in expired:
+                        self.current_subscribed[exp] = True
+                    for v in new_subs:
+                        del self.current_subscribed[v]
+                for exp in expired:
+                    self.request_unsubscribe(exp)
+                for v in new_subs:
+                    self.request_subscribe(v)
+                time.sleep(1)
+
+    def start_subscription_flusher(self):
+        t1 = Thread(target=self.keep_flushing_subscriptions, args=[], name="subscription_flusher")
+        t1.start()
 
     def auto_sub_unsub(self):
         """default callable"""
-        return {}
+        return {"valid": [], "expired": []}
 
     def keep_auto_sub_unsub(self):
+        """Polling fallback for symbol providers which can not push changes"""
         while True:
             time.sleep(3)
-            print("Trying auto sub/unsub")
+            logger.sampled(logging.DEBUG, "auto_sub_unsub", every=100)
             res = self.auto_sub_unsub_func()
-            valid = [tick['id'] for tick in res['valid']]
-            expired = [tick['id'] for tick in res['expired']]
-            if len(expired) > 0:
-                for exp in expired:
-                    try:
-                        del self.current_subscribed[exp]
-                    except:
-                        pass
-
-                print(f"Unsubscribing from : {expired}")
-                self.remove_symbols(expired)
-
-            if len(valid) > 0:
-                new_subs = []
-                for v in valid:
-                    if v in self.current_subscribed:
-                        continue
-                    else:
-                        new_subs.append(v)
-                        self.current_subscribed[v] = True
-                if len(new_subs) > 0:
-                    print(f"Subscribing to : {new_subs}")
-                    self.add_symbols(new_subs)
+            for tick in res['expired']:
+                self.request_unsubscribe(tick['id'])
+            for tick in res['valid']:
+                self.request_subscribe(tick['id'])
 
     def start_auto_sub_unsub(self):
         t1 = Thread(target=self.keep_auto_sub_unsub, args=[])
@@ -261,27 +569,140 @@ class PolygonDataStreamMultipleClient(PolygonStream):
     def attach_auto_sub_unsubscribe_callable(self, symbol_provider: Callable):
         self.auto_sub_unsub_func = symbol_provider
 
-    def start_internal_stream(self, on_close_callback: Optional[Callable] = None,
-                              on_error_callback: Optional[Callable] = None):
+    def connect_internal_client(self):
         from polygon import WebSocketClient, STOCKS_CLUSTER
-        self.my_client = WebSocketClient(cluster=STOCKS_CLUSTER, auth_key=self.key,
-                                         process_message=self.on_msg,
-                                         on_close=self.on_socket_close, on_error=self.on_error_callback_default)
+        self.authenticated.clear()
+        if self.my_client is None:
+            # The client installs signal handlers, so it is created once on the main thread and its socket app
+            # is run again to reconnect. It authenticates again on open
+            self.my_client = WebSocketClient(cluster=STOCKS_CLUSTER, auth_key=self.key,
+                                             process_message=self.on_msg,
+                                             on_close=self.on_socket_close, on_error=self.on_error_callback_default)
+            if self.feed_url is not None:
+                self.my_client.url = self.my_client.ws.url = self.feed_url
         self.my_client.run_async()
-        self.start_auto_sub_unsub()
 
-    def on_error_callback_default(self, msg):
-        print(f"ERROR POLYGON: {msg}")
+    def start_internal_stream(self, on_close_callback: Optional[Callable] = None,
+                              on_error_callback: Optional[Callable] = None):
+        self.keep_connected = True
+        self.connect_internal_client()
+        self.start_subscription_flusher()
+        if self.aggregate_maker is not None:
+            self.aggregate_maker.start_closing_timer()
+        if self.auto_sub_unsub_func != self.auto_sub_unsub:
+            self.start_auto_sub_unsub()
+
+    def on_error_callback_default(self, socket, msg=None):
+        logger.error("polygon_error", msg=msg)
 
-    def on_socket_close(self, socket):
+    def stop_stream(self):
+        self.keep_connected = False
+        super().stop_stream()
+
+    def on_socket_close(self, socket, *close_args):
         """If connection closed, restart"""
-        print(">>>>>>>>>>>>>>>>>>>>>>>>ALERT_ALERT<<<<<<<<<<<<<<<<<<<<<<<<<")
-        print(">>>>>>>>>>>>>>>>>>>>>>>>ALERT_ALERT<<<<<<<<<<<<<<<<<<<<<<<<<")
-        print(">>>>>>>>>>>>>>>>>>POLYGON_CONNECTION_CLOSED<<<<<<<<<<<<<<<<<")
-        print(">>>>>>>>>>>>>>>>>>>>>>>>ALERT_ALERT<<<<<<<<<<<<<<<<<<<<<<<<<")
-        print(">>>>>>>>>>>>>>>>>>>>>>>>ALERT_ALERT<<<<<<<<<<<<<<<<<<<<<<<<<")
-        # self.my_client.run_async()
-        # self.add_symbols(list(self.current_subscribed.keys()))
+        if not self.keep_connected:
+            return
+        with self.reconnect_lock:
+            if self.reconnecting:
+                # Closed while the reconnect loop runs. It retries until a connection stays open
+                self.closed_while_reconnecting = True
+                return
+            self.reconnecting = True
+            self.closed_while_reconnecting = False
+        self.disconnected_at_ms = int(time.time() * 1000)
+        logger.error("polygon_connection_closed", alert=True, subscribed=len(self.current_subscribed))
+        t1 = Thread(target=self.reconnect, name="polygon_reconnect", daemon=True)
+        t1.start()
+
+    def reconnect(self):
+        """Reconnect with exponential backoff, resubscribe every subscribed symbol in one frame and backfill"""
+        st = time.perf_counter_ns()
+        delay = 0.5
+        attempt = 0
+        symbols = []
+        while self.keep_connected:
+            attempt += 1
+            with self.reconnect_lock:
+                self.closed_while_reconnecting = False
+            try:
+                self.connect_internal_client()
+                if self.authenticated.wait(self.auth_timeout_sec):
+                    with self.subscription_condition:
+                        symbols = list(self.current_subscribed)
+                    # Hold live bars before resubscribing so the backfilled bars can be stored first
+                    if self.backfill and symbols:
+                        with self.backfill_lock:
+                            for symbol in symbols:
+                                self.held_bars.setdefault(symbol, [])
+                            self.backfilling = True
+                    if symbols:
+                        self.add_symbols(symbols)
+                    with self.reconnect_lock:
+                        if not self.closed_while_reconnecting:
+                            self.reconnecting = False
+                            break
+                else:
+                    self.my_client.close_connection()
+            except:
+                logger.exception("polygon_reconnect_attempt_failed", attempt=attempt)
+            logger.warning("polygon_reconnect_retry", attempt=attempt, retry_in_sec=delay)
+            time.sleep(delay)
+            delay = min(delay * 2, self.max_reconnect_delay_sec)
+        if not self.keep_connected:
+            return
+        self.reconnects += 1
+        logger.info("polygon_reconnected", attempts=attempt, resubscribed=len(symbols), elapsed_ms=elapsed_ms(st))
+        if self.backfilling:
+            self.backfill_gap(list(self.held_bars))
+
+    def backfill_gap(self, symbols: list):
+        """Store the minute bars closed while disconnected, then release the held live bars of each symbol"""
+        st = time.perf_counter_ns()
+        until_ms = int(time.time() * 1000) // 60000 * 60000
+        stored = 0
+        if symbols:
+            with ThreadPoolExecutor(max_workers=min(self.max_parallel_backfills, len(symbols))) as executor:
+                stored = sum(executor.map(lambda symbol: self.backfill_symbol(symbol, until_ms), symbols))
+        with self.backfill_lock:
+            # Bars held by a reconnect which happened while this backfill ran are not kept back
+            for held in self.held_bars.values():
+                self.storage.store_records(held)
+            self.held_bars = {}
+            self.backfilling = False
+        self.backfilled_bars += stored
+        logger.info("polygon_gap_backfilled", symbols=len(symbols), bars=stored, elapsed_ms=elapsed_ms(st))
+
+    def fetch_minute_bars(self, symbol: str, from_ms: int, to_ms: int):
+        """Minute bars of the symbol starting in [from_ms, to_ms] from the polygon aggregates api, oldest first"""
+        res = requests.get(f"https://api.polygon.io/v2/aggs/ticker/{symbol}/range/1/minute/{from_ms}/{to_ms}"
+                           f"?adjusted=true&sort=asc&limit=50000&apiKey={self.key}", timeout=10)
+        data = json.loads(res.text)
+        return [{"ev": "AM", "sym": symbol, "v": d['v'], "av": None, "op": None, "vw": d.get('vw', d['c']),
+                 "o": d['o'], "c": d['c'], "h": d['h'], "l": d['l'], "a": None, "s": d['t'], "e": d['t'] + 60000}
+                for d in data.get('results', [])]
+
+    def backfill_symbol(self, symbol: str, until_ms: int):
+        last_start = self.last_bar_start.get(symbol)
+        from_ms = last_start + 60000 if last_start is not None else self.disconnected_at_ms // 60000 * 60000
+        bars = []
+        if from_ms < until_ms:
+            try:
+                bars = self.fetch_minute_bars(symbol, from_ms, until_ms - 1)
+            except:
+                logger.exception("polygon_backfill_failed", symbol=symbol, alert=True)
+        with self.backfill_lock:
+            held = self.held_bars.pop(symbol, [])
+            # Bars the live stream delivered anyway (e.g. the bar closed while disconnected) are not duplicated
+            last_start = self.last_bar_start.get(symbol, -1)
+            end = held[0]['s'] if held else until_ms
+            bars = [bar for bar in bars if last_start < bar['s'] < end]
+            records = bars + held
+            if records:
+                for bar in records:
+                    self.last_bar_start[symbol] = bar['s']
+                self.storage.store_records(records)
+        return len(bars)
 
 
 def data_received(msg):
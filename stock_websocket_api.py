@@ -1,21 +1,41 @@
+import argparse
+import asyncio
 import dataclasses
 import time
-from threading import Thread
+from threading import Lock, Thread
 from typing import Callable, List
 from fastapi import WebSocket, WebSocketDisconnect, FastAPI
+from fastapi.responses import PlainTextResponse
 import uvicorn
 from creds import PolygonCreds
+from indicators import MinuteBarEnricher
+from latency_tracer import LatencyHistogram, hot_path_tracer
+from market_codec import WIRE_JSON, decode_frame, encode_frame, negotiate_wire_encoding
+from server_metrics import FeedMetricsCollector
+from shared_market_bus import SharedMarketBusWriter
 from stock_data import RealTimeDataStorageForWebSocketClients, PolygonDataStreamMultipleClient
-from stock_data import PolygonTop20Detector
+from stock_data import PolygonLocalGainersDetector, PolygonTop20Detector
+from structured_logger import get_logger
+from symbol_sharding import SymbolShard
 import websockets
 
+logger = get_logger("stock_websocket_api")
+
 
 class WebSocketClientClone:
     """Personal webscoket client"""
 
-    def __init__(self, uri: str):
+    def __init__(self, uri: str, encoding=WIRE_JSON, deflate=False):
+        """
+        :param encoding: json, struct or msgpack. The server answers in json if it does not support the encoding
+        :param deflate: ask the server to compress binary frames
+        """
         self.uri = uri
+        if encoding != WIRE_JSON:
+            self.uri += f"?encoding={encoding}" + ("&deflate=1" if deflate else "")
         self.on_msg = self.on_msg_func
+        self.on_records = None
+        self.symbol_cache = {}
 
     def run_async(self):
         t1 = Thread(target=self.run, args=[])
@@ -37,12 +57,56 @@ class WebSocketClientClone:
                 await websocket.send(name)
                 # print(f"> {name}")
                 greeting = await websocket.recv()
+                hot_path_tracer.begin()
                 if len(greeting) > 2:
-                    self.on_msg(greeting)
+                    if isinstance(greeting, bytes) and self.on_records is not None:
+                        self.on_records(decode_frame(greeting, self.symbol_cache))
+                    else:
+                        self.on_msg(greeting)
 
     def attach_on_msg_listener(self, on_msg_callable: Callable):
         self.on_msg = on_msg_callable
 
+    def attach_on_records_listener(self, on_records_callable: Callable[[list], None]):
+        """
+        Binary frames are decoded here and passed as a list of polygon shaped dicts. Text frames keep going to
+        the on_msg listener
+        :param on_records_callable: params(records)
+        """
+        self.on_records = on_records_callable
+
+
+class ShardedWebSocketClient:
+    """
+    Connects to every shard of a sharded feed server. Each shard's messages are received on its own thread and
+    dispatched one batch at a time, so listeners never run concurrently. A symbol lives on one shard, so its
+    messages keep their order
+    """
+
+    def __init__(self, uris: List[str], encoding=WIRE_JSON, deflate=False):
+        self.clients = [WebSocketClientClone(uri, encoding=encoding, deflate=deflate) for uri in uris]
+        self.dispatch_lock = Lock()
+
+    def run_async(self):
+        for client in self.clients:
+            client.run_async()
+
+    def attach_on_msg_listener(self, on_msg_callable: Callable):
+        def on_msg(msg):
+            with self.dispatch_lock:
+                on_msg_callable(msg)
+
+        for client in self.clients:
+            client.attach_on_msg_listener(on_msg)
+
+    def attach_on_records_listener(self, on_records_callable: Callable[[list], None]):
+        def on_records(records):
+            with self.dispatch_lock:
+                on_records_callable(records)
+
+        for client in self.clients:
+            client.attach_on_records_listener(on_records)
+
 
 class WebSocketConnectionManager:
     """Connection Manager for multiple websocket client"""
@@ -63,6 +127,9 @@ class WebSocketConnectionManager:
     async def send_personal_message(self, message: str, websocket_client: WebSocket):
         await websocket_client.send_text(message)
 
+    async def send_personal_bytes(self, message: bytes, websocket_client: WebSocket):
+        await websocket_client.send_bytes(message)
+
     async def broadcast(self, message: str):
         for connection in self.active_connections:
             await connection.send_text(message)
@@ -126,7 +193,14 @@ class WebSocketMultipleClientServer(BaseObjectApi):
         self.on_websocket_connect = self.on_websocket_con
         self.on_websocket_disconnect = self.on_websocket_discon
         self.get_client_data = self.get_client_data_async
+        self.get_client_records = self.get_client_records_async
         self.on_growth_request = self.get_new_growth_data
+        self.on_metrics_request = self.get_default_metrics
+        self.event_loop_lag_sec = 0.0
+        self.event_loop_lag = LatencyHistogram()
+        # Scrapers expect /metrics at the root, outside of the api path
+        app.get("/metrics", response_class=PlainTextResponse)(self.get_metrics)
+        app.add_event_handler("startup", self.start_event_loop_lag_monitor)
 
     path = "api"
 
@@ -139,20 +213,45 @@ class WebSocketMultipleClientServer(BaseObjectApi):
         if client_id not in WebSocketUsers.users:
             return
 
+        encoding = negotiate_wire_encoding(websocket_client.query_params.get("encoding"))
+        deflate = websocket_client.query_params.get("deflate") == "1"
         await self.connection_manager.connect(websocket_client, client_id)
         self.on_websocket_connect(client_id)
         try:
             while True:
                 msg_received = await websocket_client.receive_text()  # clients replys when msg received
-                client_data = await self.get_client_data(client_id)
-                await self.connection_manager.send_personal_message(client_data, websocket_client)
+                if encoding == WIRE_JSON:
+                    client_data = await self.get_client_data(client_id)
+                    await self.connection_manager.send_personal_message(client_data, websocket_client)
+                else:
+                    records = await self.get_client_records(client_id)
+                    await self.connection_manager.send_personal_bytes(encode_frame(records, encoding, deflate),
+                                                                      websocket_client)
         except WebSocketDisconnect:
             self.connection_manager.disconnect(websocket_client, client_id)
             self.on_websocket_disconnect(client_id)
 
+    async def get_metrics(self):
+        return self.on_metrics_request()
+
+    async def start_event_loop_lag_monitor(self):
+        asyncio.get_event_loop().create_task(self.keep_measuring_event_loop_lag())
+
+    async def keep_measuring_event_loop_lag(self, interval_sec=0.5):
+        """Delay between the expected and the actual wake up of a sleeping task"""
+        while True:
+            st = time.perf_counter_ns()
+            await asyncio.sleep(interval_sec)
+            lag_ns = max(time.perf_counter_ns() - st - int(interval_sec * 1e9), 0)
+            self.event_loop_lag_sec = lag_ns / 1e9
+            self.event_loop_lag.record(lag_ns)
+
     def get_new_growth_data(self):
         return "GROWTH WORKING"
 
+    def get_default_metrics(self):
+        return f"feed_websocket_clients {len(self.connection_manager.connected_users)}\n"
+
     def on_websocket_discon(self, client_id: int):
         pass
 
@@ -167,9 +266,20 @@ class WebSocketMultipleClientServer(BaseObjectApi):
         """
         return "test data string"
 
+    async def get_client_records_async(self, client_id: int):
+        """Default records provider of binary encoded clients"""
+        return []
+
     def attach_on_growth_request_callable(self, growth_callable):
         self.on_growth_request = growth_callable
 
+    def attach_metrics_provider_callable(self, metrics_provider: Callable):
+        """
+        :param metrics_provider: returns prometheus text exposition. no params
+        :return:
+        """
+        self.on_metrics_request = metrics_provider
+
     def attach_on_websocket_discon_callable(self, discon_callable: Callable):
         """
 
@@ -192,27 +302,72 @@ class WebSocketMultipleClientServer(BaseObjectApi):
         """
         self.get_client_data = client_data_provider
 
-    def start(self):
-        t1 = Thread(target=uvicorn.run, args=[self.app])
+    def attach_client_records_provider_callable(self, client_records_provider: Callable):
+        """
+        Records sent to clients which negotiated a binary encoding
+        :param client_records_provider: return list of decoded messages. params (client_id)
+        :return:
+        """
+        self.get_client_records = client_records_provider
+
+    def start(self, host="127.0.0.1", port=8000):
+        t1 = Thread(target=uvicorn.run, args=[self.app], kwargs={"host": host, "port": port})
         t1.start()
 
 
-def main():
-    stream_data = PolygonDataStreamMultipleClient(PolygonCreds(), channel=["A", "AM"])
+def main(detector_mode="snapshot", shared_bus_path=None, enrich_bars=True, shard_index=0, shard_count=1,
+         host="127.0.0.1", port=8000):
+    """
+    :param detector_mode: "snapshot" polls polygon top 20 gainers, "stream" computes gainers of the whole market
+                          from the AM.* stream
+    :param shared_bus_path: also publish the feed to a shared memory bus for strategies on this host
+    :param enrich_bars: add sma, ema, v_sma, v_ema, cal_t, cal_d and session to the AM bars once for all strategies
+    :param shard_index: symbols of this instance when the feed is split between shard_count instances.
+                        Clients connect to every shard (see symbol_sharding.shard_uris and ShardedWebSocketClient)
+    """
+    shard = SymbolShard(shard_index, shard_count)
+    stream_data = PolygonDataStreamMultipleClient(PolygonCreds(), channel=["A"], local_minute_bars=True)
     storage = RealTimeDataStorageForWebSocketClients()
+    if enrich_bars:
+        storage.attach_records_enricher_callable(MinuteBarEnricher().enrich)
+    if shared_bus_path is not None:
+        storage.attach_on_records_listener(SharedMarketBusWriter(shared_bus_path).publish)
     stream_data.attach_client_storage(storage)
     stream_data.start_internal_stream()
     app = WebSocketMultipleClientServer(app=FastAPI())
-    symbol_detector = PolygonTop20Detector(PolygonCreds(), target_growth=16, search_each_sec=10, validity_min=60)
-    stream_data.attach_auto_sub_unsubscribe_callable(symbol_detector.get_detected_id_data_and_deleted)
-    app.attach_on_growth_request_callable(symbol_detector.get_detected_id_data_and_deleted)
+    if detector_mode == "stream":
+        symbol_detector = PolygonLocalGainersDetector(PolygonCreds(), target_growth=16, validity_min=60)
+    else:
+        symbol_detector = PolygonTop20Detector(PolygonCreds(), target_growth=16, search_each_sec=10,
+                                               validity_min=60)
+    symbol_detector.attach_symbol_change_listeners(shard.filter_symbol_listener(stream_data.request_subscribe),
+                                                   shard.filter_symbol_listener(stream_data.request_unsubscribe))
+    app.attach_on_growth_request_callable(
+        shard.filter_growth_provider(symbol_detector.get_detected_id_data_and_deleted))
     app.attach_on_websocket_con_callable(storage.register_new_client)
     app.attach_on_websocket_discon_callable(storage.client_disconnected)
     app.attach_client_data_provider_callable(storage.get_data)
-    app.start()
+    app.attach_client_records_provider_callable(storage.get_records)
+    metrics = FeedMetricsCollector(storage, stream=stream_data, detector=symbol_detector, server=app)
+    metrics.attach_collector(lambda text: text.add(
+        "feed_shard_info", "gauge", "Shard of the symbols served by this instance",
+        {f'shard_index="{shard.shard_index}",shard_count="{shard.shard_count}"': 1}))
+    app.attach_metrics_provider_callable(metrics.render)
+    logger.info("feed_server_started", shard_index=shard_index, shard_count=shard_count, port=port)
+    app.start(host=host, port=port)
     # time.sleep(20)
     # stream_data.add_symbols(['AAPL'])
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser(description="Polygon feed server for the strategies")
+    parser.add_argument("--detector-mode", default="snapshot", choices=["snapshot", "stream"])
+    parser.add_argument("--shared-bus-path", default=None, help="Must be different for every shard on a host")
+    parser.add_argument("--no-enrich-bars", action="store_true")
+    parser.add_argument("--shard-index", type=int, default=0)
+    parser.add_argument("--shard-count", type=int, default=1)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+    main(detector_mode=args.detector_mode, shared_bus_path=args.shared_bus_path, enrich_bars=not args.no_enrich_bars,
+         shard_index=args.shard_index, shard_count=args.shard_count, host=args.host, port=args.port)
@@ -1,6 +1,8 @@
 import copy
 import dataclasses
 import json
+import logging
+import time
 from abc import ABC, abstractmethod
 from pathlib import Path
 from typing import Callable, Dict, List
@@ -8,16 +10,22 @@ from datetime import datetime
 
 import requests
 
-from stock_websocket_api import WebSocketClientClone
+from stock_websocket_api import ShardedWebSocketClient, WebSocketClientClone
 from custom_time import CustomTimeZone
-from data_processor import TimeRangeCreator
+from data_processor import AFTER_MARKET, NORMAL_MARKET, PRE_MARKET, MarketHoursCalifornia, TimeRangeCreator, \
+    TimeRangeUnion
+from indicators import has_indicators
+from latency_tracer import hot_path_tracer
+from shared_market_bus import SharedMarketBusReader
+from strategy_snapshot import StrategySnapshotter
+from structured_logger import elapsed_ms, get_logger
 from trader import AlpakaTrader, Trader, OrderData
 from creds import AlpakaCreds, PolygonCreds
+from symbol_table import get_symbol_registry
+
+logger = get_logger("strategy")
 
 custom_t = CustomTimeZone(CustomTimeZone.CLIENT_LOCATION)  # Los_Angelos
-NORMAL_MARKET = "NORMAL_MARKET"
-PRE_MARKET = "PRE_MARKET"
-AFTER_MARKET = "AFTER_MARKET"
 
 
 def persistant_buy_sell_data(symbol: str, data, formula_buy_sell_path: str, start_date: str, start_time: str,
@@ -34,75 +42,90 @@ def create_required_folder(path_dir):
     try:
         Path(path_dir).mkdir(parents=True, exist_ok=True)
     except:
-        print("Directory already exists")
+        logger.debug("directory_exists", path=path_dir)
 
 
 BUY_WHEN_DEC = 0
 BUY_WHEN_THIRD_POINT = 0
 
 
-class MarketHoursCalifornia:
-    def __init__(self):
-        pass
-
-    def get_pre_market_time_range_dict(self):
-        return TimeRangeCreator(start_time="01:00:00", end_time="06:29:59", interval_sec=1).get_dict()
-
-    def get_normal_hour_time_range_dict(self):
-        return TimeRangeCreator(start_time="06:30:00", end_time="12:59:59", interval_sec=1).get_dict()
-
-    def get_after_market_time_range_dict(self):
-        return TimeRangeCreator(start_time="13:00:00", end_time="16:59:59", interval_sec=1).get_dict()
+@dataclasses.dataclass
+class PositionState:
+    """Buy/sell state of one symbol handled by BuySellEvents"""
+    symbol: str
+    buy_command: "BuyCommandData" = None
+    trying_to_buy: bool = False
+    trying_to_sell: bool = False
+    sell_on_decrease: bool = False
+    buy_requested: bool = False
+    buy_cancel_requested: bool = False
+    sell_at_price: float = None
+    trying_sell_timestamp: int = None
+    selling_mode: str = None
+    requested_qnty: int = 0
+    buy_order_data: object = None
+    sell_order_data: object = None
+    place_buy_order_at_ts: int = 0
+    allocated_capital: float = 0.0
+
+
+class CapitalAllocator:
+    """
+    Splits the allowed buying power between at most max_positions symbols.
+    A symbol takes a slot when its buy order is placed and frees it when sold or dropped, so symbols only trying to
+    buy do not block each other. The capital of a slot is the allowed balance divided by the slots not funded yet
+    """
 
-    def get_pre_market_time_range(self):
-        # Total 5:30 hr
-        return {"start": {"h": 1, "m": 0, "s": 0}, "end": {"h": 6, "m": 29, "s": 0}}
+    def __init__(self, max_positions=1, minus=25000):
+        """
+        :param max_positions: symbols with a buy order placed at the same time
+        :param minus: buying power kept aside, see Trader.get_allowed_buying_power_balance
+        """
+        self.max_positions = max_positions
+        self.minus = minus
+        self.slots: Dict[str, float] = {}
 
-    def get_normal_hour_time_range(self):
-        # Total 6:30 hr
-        return {"start": {"h": 6, "m": 30, "s": 0}, "end": {"h": 12, "m": 59, "s": 0}}
+    def has_slot(self, symbol: str):
+        return symbol in self.slots or len(self.slots) < self.max_positions
 
-    def get_after_hour_time_range(self):
-        # Total 4 hr
-        return {"start": {"h": 13, "m": 0, "s": 0}, "end": {"h": 16, "m": 59, "s": 0}}
+    def take_slot(self, symbol: str):
+        if not self.has_slot(symbol):
+            return False
+        self.slots.setdefault(symbol, 0.0)
+        return True
 
-    def get_market_start_end_time_range(self):
-        return {"start": {"h": 1, "m": 0, "s": 0}, "end": {"h": 16, "m": 59, "s": 0}}
+    def allocate(self, symbol: str, trader: Trader):
+        """Capital for the symbol's buy order. The symbol must hold a slot"""
+        balance = trader.get_allowed_buying_power_balance(updated=True, minus=self.minus)
+        funded = sum(1 for s, capital in self.slots.items() if capital > 0 and s != symbol)
+        capital = balance / max(self.max_positions - funded, 1)
+        self.slots[symbol] = capital
+        return capital
 
-    def get_market_start_end_time_range_str(self):
-        return {"start": "01:00:00", "end": "16:59:00"}
+    def release(self, symbol: str):
+        self.slots.pop(symbol, None)
 
 
 class BuySellEvents:
-    def __init__(self, ban_mode=True):
+    """
+    Buy/sell state machine of every symbol a formula works on. Each symbol has its own PositionState, so
+    several symbols can be bought and sold concurrently up to max_positions
+    """
+
+    def __init__(self, ban_mode=True, max_positions=1):
         self.ban_mode = ban_mode
-        self.current_bought_symbol = None
-        self.trying_to_buy = False
-        self.trying_to_sell = False
-        self.sell_on_decrease = False
-        self.trader_buy_requested = False
-        self.trader_sell_requested = False
-        self.trader_bought = False
-        self.trader_sold = False
-        self.sell_at_price = None
-        self.trying_sell_timestamp = None
-        self.selling_mode = None
+        self.positions: Dict[str, PositionState] = {}
+        self.capital_allocator = CapitalAllocator(max_positions=max_positions)
         self.trader: AlpakaTrader = None
         self.processed_minute_data = None
-        self.buy_commands: Dict[str, BuyCommandData] = {}
         if self.ban_mode:
             self.lost_money_on: Dict[str, int] = {}
             self.banned_symbols: Dict[str, int] = {}
-        self.last_requested_qnty = 0
-        self.last_buy_order_data = None
-        self.last_sell_order_data = None
         self.polygon_key = PolygonCreds().secret_key
         market_hours = MarketHoursCalifornia()
-        self.pre_market_hours = market_hours.get_pre_market_time_range_dict()
-        self.normal_market_hours = market_hours.get_normal_hour_time_range_dict()
-        self.after_market_hours = market_hours.get_after_market_time_range_dict()
-        self.trader_buy_cancel_req = False
-        self.place_buy_order_at_ts = 0
+        self.pre_market_hours = market_hours.get_pre_market_hours_range()
+        self.normal_market_hours = market_hours.get_normal_market_hours_range()
+        self.after_market_hours = market_hours.get_after_market_hours_range()
 
     def attach_trader(self, trader: Trader):
         self.trader = trader
@@ -111,37 +134,61 @@ class BuySellEvents:
         self.banned_symbols = banned_symbols
 
     def get_buying_symbols(self):
-        return self.buy_commands
+        """Symbols trying to buy or bought"""
+        return self.positions
+
+    def get_position(self, symbol: str) -> PositionState:
+        return self.positions.get(symbol)
 
-    def get_current_bought_symbol(self):
-        return self.current_bought_symbol
+    def get_buy_command(self, symbol: str):
+        return self.positions[symbol].buy_command
 
-    def is_trying_buy(self):
-        return self.trying_to_buy
+    def get_bought_symbols(self):
+        return [symbol for symbol, position in self.positions.items() if position.buy_requested]
 
-    def is_buy_requested(self):
-        return self.trader_buy_requested
+    def discard_position(self, symbol: str):
+        """Forget a symbol which is not bought (e.g. unsubscribed while trying to buy)"""
+        if symbol in self.positions:
+            del self.positions[symbol]
+            self.capital_allocator.release(symbol)
 
-    def is_bought(self):
-        return self.trader_bought
+    def is_trying_buy(self, symbol: str):
+        position = self.positions.get(symbol)
+        return position is not None and position.trying_to_buy
 
-    def is_sold(self):
-        return self.trader_sold
+    def is_buy_requested(self, symbol: str):
+        position = self.positions.get(symbol)
+        return position is not None and position.buy_requested
 
-    def is_sell_requested(self):
-        return self.trader_sell_requested
+    def is_trying_sell(self, symbol: str):
+        position = self.positions.get(symbol)
+        return position is not None and position.trying_to_sell
 
-    def is_trying_sell(self):
-        return self.trying_to_sell
+    def can_request_buy(self, symbol: str):
+        """A slot is free for the symbol's buy order. Other symbols may have filled them since it started trying"""
+        return self.capital_allocator.has_slot(symbol)
+
+    def get_trying_sell_timestamp(self, symbol: str):
+        return self.positions[symbol].trying_sell_timestamp
+
+    def get_place_buy_order_at_ts(self, symbol: str):
+        return self.positions[symbol].place_buy_order_at_ts
 
     def try_to_buy(self, symbol: str, at_price: float, current_timestamp: int):
         """
-        Considered that self.is_trying_sell() == False
+        Considered that self.is_trying_sell(symbol) == False
         """
-        if not self.is_buy_requested():
-            self.buy_commands[symbol] = BuyCommandData(symbol=symbol, buy_at=at_price, timestamp=current_timestamp)
-            self.trying_to_buy = True
-            print(f"Trying to buy {symbol}")
+        position = self.positions.get(symbol)
+        if position is not None and position.buy_requested:
+            return
+        if not self.capital_allocator.has_slot(symbol):
+            logger.sampled(logging.INFO, "buy_skipped", every=60, symbol=symbol, reason="max positions reached")
+            return
+        if position is None:
+            position = self.positions[symbol] = PositionState(symbol=symbol)
+        position.buy_command = BuyCommandData(symbol=symbol, buy_at=at_price, timestamp=current_timestamp)
+        position.trying_to_buy = True
+        logger.info("trying_to_buy", symbol=symbol, buy_at=at_price, positions=len(self.positions))
 
     def set_and_get_total_ema_volume(self, dataset_ema: list):
         """
@@ -220,7 +267,7 @@ class BuySellEvents:
                     return None
 
             except:
-                print("Polygon rest api request failed")
+                logger.exception("volume_ema_request_failed", symbol=symbol)
                 return None
 
     def try_to_sell(self, symbol: str, current_timestamp: int, at_price=None, selling_mode="normal"):
@@ -230,38 +277,35 @@ class BuySellEvents:
         2. if trying to buy not not bought skip buying
         3. if bought try sell
         """
-
-        if not self.buy_commands[symbol].buy_requested:
+        position = self.positions.get(symbol)
+        if position is None:
+            return
+        if not position.buy_requested:
             """
             In very rare case, buy can happen even when we remove the symbol from the dictionary
             Solution: Check if the symbol exists before buying in second data
             """
-            del self.buy_commands[symbol]
+            self.discard_position(symbol)
             return
 
         # Buy requested for this ticker
-        self.trying_to_buy = False
-        if self.is_buy_requested() and (selling_mode == 'normal'):
-            print(f"Trying to sell [{selling_mode}]")
-            self.sell_at_price = at_price
-            self.trying_sell_timestamp = current_timestamp
-            self.selling_mode = selling_mode
-            self.trying_to_sell = True  # Must turn on selling mode after preparing selling creds
-        elif self.is_buy_requested() and (selling_mode == 'forced'):
-            print(f"Trying to sell [{selling_mode}]")
-            self.selling_mode = selling_mode
-            self.request_sell(timestamp=current_timestamp, symbol=self.get_current_bought_symbol(),
+        position.trying_to_buy = False
+        if selling_mode == 'normal':
+            logger.info("trying_to_sell", symbol=symbol, selling_mode=selling_mode)
+            position.sell_at_price = at_price
+            position.trying_sell_timestamp = current_timestamp
+            position.selling_mode = selling_mode
+            position.trying_to_sell = True  # Must turn on selling mode after preparing selling creds
+        elif selling_mode == 'forced' or selling_mode == "blind":
+            logger.info("trying_to_sell", symbol=symbol, selling_mode=selling_mode)
+            position.selling_mode = selling_mode
+            self.request_sell(timestamp=current_timestamp, symbol=symbol,
                               price=self.processed_minute_data[symbol][-1]['l'])
-        elif self.is_buy_requested() and selling_mode == "blind":
-            print(f"Trying to sell [{selling_mode}]")
-            self.selling_mode = selling_mode
-            self.request_sell(timestamp=current_timestamp, symbol=self.get_current_bought_symbol(),
-                              price=self.processed_minute_data[symbol][-1]['l'])
-        elif self.is_buy_requested():
+        else:
             raise Exception("Selling type error")
 
     def which_market(self, cal_t: str):
-        """Considered that cal_t HH:MM:SS and self.market_hours are dictionary with cal_t keys"""
+        """Considered that cal_t HH:MM:SS and self.market_hours are time ranges of cal_t"""
         if cal_t in self.pre_market_hours:
             return PRE_MARKET
         elif cal_t in self.normal_market_hours:
@@ -272,113 +316,117 @@ class BuySellEvents:
 
     def try_cancel_buy(self, symbol: str):
         """Try to cancel an order upon cancel request"""
-        if not self.trader_buy_cancel_req:
-            print("Trying Cancel order")
-            if not self.trader.is_order_filled(order_id=self.last_buy_order_data.id):
-                self.trader.cancel_order(order_id=self.last_buy_order_data.id)
-                self.trader_buy_cancel_req = True
+        position = self.positions[symbol]
+        if not position.buy_cancel_requested:
+            logger.info("trying_cancel_buy", symbol=symbol, order_id=position.buy_order_data.id)
+            if not self.trader.is_order_filled(order_id=position.buy_order_data.id):
+                self.trader.cancel_order(order_id=position.buy_order_data.id)
+                position.buy_cancel_requested = True
             else:
                 # True means dont try cancel anymore
-                self.trader_buy_cancel_req = True
-                print("Order Filled. Couldnt Cancel")
+                position.buy_cancel_requested = True
+                logger.info("buy_cancel_skipped", symbol=symbol, reason="order filled")
 
     def request_buy(self, timestamp: int, symbol: str, price: float):
-        self.trying_to_buy = False
-        self.trader_buy_requested = True
-        self.buy_commands[symbol].buy_requested = True
-        self.buy_commands[symbol].buy_requested_price = price
-        self.trader_sell_requested = False
-        self.current_bought_symbol = symbol
+        hot_path_tracer.mark("request_buy")
+        if not self.capital_allocator.take_slot(symbol):
+            logger.sampled(logging.INFO, "buy_skipped", every=60, symbol=symbol, reason="max positions reached")
+            return None
+        position = self.positions[symbol]
+        position.trying_to_buy = False
+        position.buy_requested = True
+        position.buy_command.buy_requested = True
+        position.buy_command.buy_requested_price = price
         time_, date_ = custom_t.get_tz_time_date_from_timestamp(timestamp)
+        market_name = order_data = None
         if self.trader.alpaka_account_info is not None:
-            print("Placing BUY order in Trader")
-            st = datetime.now().timestamp()
-            t_volume_ema = self.get_total_volume_ema(symbol, last_minutes=30)
-            if t_volume_ema is not None:
-                eq1_qty = int(t_volume_ema / 40)
-            else:
-                eq1_qty = 0
-            print(f"EQ1: qty: {eq1_qty}")
-            balance = self.trader.get_allowed_buying_power_balance(updated=True, minus=25000)
-            eq2_qty = int((balance / price) * 0.95)
-            print(f"EQ2: qty: {eq2_qty}")
-            if eq1_qty == 0:
-                self.last_requested_qnty = eq2_qty
-            else:
-                self.last_requested_qnty = eq1_qty if eq1_qty < eq2_qty else eq2_qty
-            market_name = self.which_market(cal_t=self.processed_minute_data[symbol][-1]['cal_t'])
-            order_data = None
-            if market_name is None:
-                raise Exception(f"MARKET NAME: {market_name}: cal_t: {self.processed_minute_data[symbol][-1]['cal_t']}")
-            elif (market_name == PRE_MARKET) or (market_name == AFTER_MARKET):
-                order_data = OrderData(quantity=self.last_requested_qnty, limit_price=round(price + 0.02, 2))
-                self.last_buy_order_data = self.trader.buy_limit_order(symbol=symbol, order_data=order_data)
-                print(
-                    f"[{market_name}] Placed BUY order (limit_price = {order_data.limit_price}) in Trader: Time: {int(datetime.now().timestamp() - st)} sec")
-            elif market_name == NORMAL_MARKET:
-                order_data = OrderData(quantity=self.last_requested_qnty, stop_price=round(price + 0.01, 2),
-                                       limit_price=round(price + 0.03, 2))
-                self.last_buy_order_data = self.trader.buy_stop_limit_order(symbol=symbol, order_data=order_data)
-                print(
-                    f"[{market_name}] Placed BUY order (stop_price = {order_data.stop_price}, limit_price = {order_data.limit_price}) in Trader: Time: {int(datetime.now().timestamp() - st)} sec")
-        print(f"Buy Request [{market_name}]".center(50, "_"))
-        print(f"{symbol}".center(50, " "))
-        print("".center(50, "_"))
-        print(f"Time: {time_}".center(25, " "), end="")
-        print(f"Date: {date_}".center(25, " "))
-        if market_name == NORMAL_MARKET:
-            print(f"Price: stop={order_data.stop_price},limit={order_data.limit_price}".center(25, " "), end="")
+            try:
+                st = time.perf_counter_ns()
+                t_volume_ema = self.get_total_volume_ema(symbol, last_minutes=30)
+                if t_volume_ema is not None:
+                    eq1_qty = int(t_volume_ema / 40)
+                else:
+                    eq1_qty = 0
+                position.allocated_capital = self.capital_allocator.allocate(symbol, self.trader)
+                eq2_qty = int((position.allocated_capital / price) * 0.95)
+                if eq1_qty == 0:
+                    position.requested_qnty = eq2_qty
+                else:
+                    position.requested_qnty = eq1_qty if eq1_qty < eq2_qty else eq2_qty
+                last_minute_data = self.processed_minute_data[symbol][-1]
+                if 'session' in last_minute_data:
+                    market_name = last_minute_data['session']
+                else:
+                    market_name = self.which_market(cal_t=last_minute_data['cal_t'])
+                if market_name is None:
+                    raise Exception(f"MARKET NAME: {market_name}: cal_t: {last_minute_data['cal_t']}")
+                elif (market_name == PRE_MARKET) or (market_name == AFTER_MARKET):
+                    order_data = OrderData(quantity=position.requested_qnty, limit_price=round(price + 0.02, 2))
+                    position.buy_order_data = self.trader.buy_limit_order(symbol=symbol, order_data=order_data)
+                    logger.info("buy_order_placed", symbol=symbol, market=market_name,
+                                limit_price=order_data.limit_price, eq1_qty=eq1_qty, eq2_qty=eq2_qty,
+                                elapsed_ms=elapsed_ms(st))
+                elif market_name == NORMAL_MARKET:
+                    order_data = OrderData(quantity=position.requested_qnty, stop_price=round(price + 0.01, 2),
+                                           limit_price=round(price + 0.03, 2))
+                    position.buy_order_data = self.trader.buy_stop_limit_order(symbol=symbol, order_data=order_data)
+                    logger.info("buy_order_placed", symbol=symbol, market=market_name, stop_price=order_data.stop_price,
+                                limit_price=order_data.limit_price, eq1_qty=eq1_qty, eq2_qty=eq2_qty,
+                                elapsed_ms=elapsed_ms(st))
+            except:
+                # No order was placed, the symbol goes back to trying to buy and frees its slot
+                self.capital_allocator.release(symbol)
+                position.trying_to_buy = True
+                position.buy_requested = False
+                position.buy_command.buy_requested = False
+                position.allocated_capital = 0.0
+                raise
+        if order_data is None:
+            logger.info("buy_requested", symbol=symbol, time=time_, date=date_, price=price, order_placed=False,
+                        positions=len(self.get_bought_symbols()))
         else:
-            print(f"Price: limit={order_data.limit_price}".center(25, " "), end="")
-        print(f"Req_Qty: {order_data.quantity}".center(25, " "))
-        print("Done".center(50, "#"))
-        self.place_buy_order_at_ts = int(datetime.now().timestamp() * 1000)
-        return self.place_buy_order_at_ts
+            logger.info("buy_requested", symbol=symbol, market=market_name, time=time_, date=date_, price=price,
+                        stop_price=order_data.stop_price, limit_price=order_data.limit_price,
+                        quantity=order_data.quantity, capital=position.allocated_capital,
+                        positions=len(self.get_bought_symbols()))
+        position.place_buy_order_at_ts = int(datetime.now().timestamp() * 1000)
+        return position.place_buy_order_at_ts
 
     def request_sell(self, timestamp: int, symbol: str, price: float):
-        self.trying_to_sell = False
-        self.trying_sell_timestamp = None
-        self.sell_at_price = None
-        self.selling_mode = None
-        self.current_bought_symbol = None
-        self.trader_buy_requested = False
-        self.trader_sell_requested = True
+        position = self.positions[symbol]
+        position.trying_to_sell = False
+        position.trying_sell_timestamp = None
+        position.sell_at_price = None
+        position.selling_mode = None
 
         time_, date_ = custom_t.get_tz_time_date_from_timestamp(timestamp)
         if self.trader.alpaka_account_info is not None:
-            print("Placing SELL order in Trader")
-            st = datetime.now().timestamp()
-            order_id = self.last_buy_order_data.id
+            st = time.perf_counter_ns()
+            order_id = position.buy_order_data.id
             single_bought_data = self.trader.get_order_data(order_id=order_id)
             if single_bought_data is not None:
                 if self.trader.is_order_filled(order_id=order_id, order_data=single_bought_data):
-                    sell_order_data = self.trader.sell_limit_order(symbol=symbol,
-                                                                   order_data=OrderData(
-                                                                       quantity=self.trader.get_filled_quantity(
-                                                                           order_id=order_id,
-                                                                           order_data=single_bought_data),
-                                                                       limit_price=0.01))
-                    print(sell_order_data)
-                    print(f"Placed SELL order in Trader: Time: {int(datetime.now().timestamp() - st)} sec")
-                    print("Sell Request".center(50, "_"))
-                    print(f"{symbol}".center(50, " "))
-                    print("".center(50, "_"))
-                    print(f"Time: {time_}".center(25, " "), end="")
-                    print(f"Date: {date_}".center(25, " "))
-                    print(f"Current Price: {price}".center(25, " "), end="")
-                    print(f"Possible Profit: {price - self.buy_commands[symbol].buy_requested_price}".center(25, " "))
-                    print("Done".center(50, "#"))
+                    position.sell_order_data = self.trader.sell_limit_order(symbol=symbol,
+                                                                            order_data=OrderData(
+                                                                                quantity=self.trader.get_filled_quantity(
+                                                                                    order_id=order_id,
+                                                                                    order_data=single_bought_data),
+                                                                                limit_price=0.01))
+                    logger.info("sell_requested", symbol=symbol, time=time_, date=date_, price=price,
+                                possible_profit=price - position.buy_command.buy_requested_price,
+                                order_id=getattr(position.sell_order_data, "id", None), elapsed_ms=elapsed_ms(st))
                 else:
-                    print("BUY WAS NOT FILLED. Canceling if not canceled")
-                    if not self.trader_buy_cancel_req:
+                    logger.warning("buy_not_filled", symbol=symbol, order_id=order_id,
+                                   cancel=not position.buy_cancel_requested)
+                    if not position.buy_cancel_requested:
                         self.trader.cancel_order(order_id=order_id)
             else:
-                print("Order data not found to sell")
-        self.trader_buy_cancel_req = False
+                logger.error("sell_order_data_missing", symbol=symbol, order_id=order_id)
+        # The symbol starts over. Other symbols keep their state
+        self.discard_position(symbol)
         # If lost money 1 times
-        if self.buy_commands[symbol].buy_requested_price > price:
+        if position.buy_command.buy_requested_price > price:
             # Lost money detected
-            self.buy_commands = {}
             if self.ban_mode:
                 if symbol not in self.lost_money_on:
                     self.lost_money_on[symbol] = 1
@@ -389,20 +437,22 @@ class BuySellEvents:
             else:
                 return LOST
         else:
-            self.buy_commands = {}
             return PROFIT
 
     def attach_processed_data(self, processed_minute_data: dict):
         self.processed_minute_data = processed_minute_data
 
-    def is_trying_sell_on_decrease(self):
-        return self.sell_on_decrease
+    def is_trying_sell_on_decrease(self, symbol: str):
+        position = self.positions.get(symbol)
+        return position is not None and position.sell_on_decrease
 
-    def set_try_sell_timestamp(self, timestamp: int):
-        self.trying_sell_timestamp = timestamp
+    def set_try_sell_timestamp(self, symbol: str, timestamp: int):
+        self.positions[symbol].trying_sell_timestamp = timestamp
 
-    def try_sell_on_decrease(self, status: bool):
-        self.sell_on_decrease = status
+    def try_sell_on_decrease(self, symbol: str, status: bool):
+        position = self.positions.get(symbol)
+        if position is not None:
+            position.sell_on_decrease = status
 
 
 BAN_IT = 0
@@ -433,6 +483,17 @@ class BuyCommandData:
 
 
 class Formula(ABC):
+    def enable_snapshots(self, interval_sec=5, warm_start=True):
+        """
+        Snapshot the formula state periodically (see strategy_snapshot). Call before start()
+        :param warm_start: restore the last snapshot and its journal first
+        """
+        self.snapshotter = StrategySnapshotter(self, interval_sec=interval_sec)
+        if warm_start:
+            self.snapshotter.warm_start()
+        self.snapshotter.attach()
+        self.snapshotter.start()
+
     @abstractmethod
     def get_banned_symbols(self):
         """Gets the banned symbol dictionary with expiration timestamp(ms) as value"""
@@ -470,10 +531,16 @@ class Formula1(Formula):
     """Sell at third intersection"""
 
     def __init__(self, trader: AlpakaTrader, socket_key: str, socket_uri: str, ban_mode=True, with_cancel=False,
-                 cancel_price=0.03):
+                 cancel_price=0.03, max_positions=1, shared_bus_path=None, wire_encoding="json"):
+        """
+        :param max_positions: symbols bought or trying to buy at the same time. Buying power is split between them
+        :param shared_bus_path: receive the feed over the shared memory bus instead of the websocket
+        :param wire_encoding: json, struct or msgpack websocket frames
+        """
         self.with_cancel = with_cancel
         self.cancel_price = cancel_price
-        self.market_data = WebSocketAggProvider(key=socket_key, uri=socket_uri)
+        self.market_data = WebSocketAggProvider(key=socket_key, uri=socket_uri, shared_bus_path=shared_bus_path,
+                                                wire_encoding=wire_encoding)
         self.market_data.attach_on_minute_data_received_listener(self.on_minute_data_received)
         self.market_data.attach_on_second_data_received_listener(self.on_second_data_received)
         self.market_data.attach_new_subscribed_listener(self.new_subscribed)
@@ -483,7 +550,7 @@ class Formula1(Formula):
         self.trader: AlpakaTrader = trader
         self.processed_minute_data: Dict[str, List[dict]] = {}
         self.processed_minute_intersections: Dict[str, IntersectionPoints] = {}
-        self.buy_sell_events = BuySellEvents(ban_mode=ban_mode)
+        self.buy_sell_events = BuySellEvents(ban_mode=ban_mode, max_positions=max_positions)
         self.formula_name = "formula_1_ban_" + ("yes" if ban_mode else "no")
         self.buy_sell_formula_path = f"buy_sell_data/{self.formula_name}"
         self.banned_symbols_path = f"{self.buy_sell_formula_path}/ban_list.json"
@@ -493,16 +560,16 @@ class Formula1(Formula):
             self.banned_symbols = self.get_banned_symbols()
             self.buy_sell_events.attach_banned_symbols(self.banned_symbols)
         self.current_minute_timestamp = int(datetime.now().timestamp()) * 1000
-        time_dict_16_59pm_to_04_02am = TimeRangeCreator(start_time="16:59:00", end_time="04:02:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_05_59am_to_06_02am = TimeRangeCreator(start_time="05:59:00", end_time="06:02:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_06_27am_to_06_33am = TimeRangeCreator(start_time="06:27:00", end_time="06:33:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_12_59pm_to_13_03pm = TimeRangeCreator(start_time="12:59:00", end_time="13:03:00",
-                                                        interval_sec=1).get_dict()
-        self.all_excluded_times_dict = {**time_dict_16_59pm_to_04_02am, **time_dict_05_59am_to_06_02am,
-                                        **time_dict_06_27am_to_06_33am, **time_dict_12_59pm_to_13_03pm}
+        time_16_59pm_to_04_02am = TimeRangeCreator(start_time="16:59:00", end_time="04:02:00",
+                                                   interval_sec=1).get_range()
+        time_05_59am_to_06_02am = TimeRangeCreator(start_time="05:59:00", end_time="06:02:00",
+                                                   interval_sec=1).get_range()
+        time_06_27am_to_06_33am = TimeRangeCreator(start_time="06:27:00", end_time="06:33:00",
+                                                   interval_sec=1).get_range()
+        time_12_59pm_to_13_03pm = TimeRangeCreator(start_time="12:59:00", end_time="13:03:00",
+                                                   interval_sec=1).get_range()
+        self.all_excluded_times = TimeRangeUnion(time_16_59pm_to_04_02am, time_05_59am_to_06_02am,
+                                                 time_06_27am_to_06_33am, time_12_59pm_to_13_03pm)
         self.first_min_excluded_times_dict = {"16:59:00": True, "05:59:00": True, "06:27:00": True,
                                               "12:59:00": True}
 
@@ -513,7 +580,7 @@ class Formula1(Formula):
         try:
             with open(self.banned_symbols_path, 'r') as file:
                 data = json.load(file)
-                print(data)
+                logger.info("banned_symbols_loaded", count=len(data))
                 return data
         except:
             return {}
@@ -523,12 +590,12 @@ class Formula1(Formula):
 
     def on_second_data_received(self, second_data, symbol):
         if symbol in self.buy_sell_events.get_buying_symbols():
-            if self.buy_sell_events.is_trying_buy():
-                print(f"[{symbol}] Buy Trying")
+            if self.buy_sell_events.is_trying_buy(symbol):
+                logger.sampled(logging.INFO, "buy_trying", every=60, symbol=symbol)
                 # Buy based on characteristics
                 # Intersections events are handled in minute data. here all of the prices are valid to buy
-                if second_data['s'] > self.buy_sell_events.buy_commands[symbol].timestamp:
-                    if second_data['h'] >= self.buy_sell_events.buy_commands[symbol].buy_at - 0.01 and \
+                if second_data['s'] > self.buy_sell_events.get_buy_command(symbol).timestamp:
+                    if second_data['h'] >= self.buy_sell_events.get_buy_command(symbol).buy_at - 0.01 and \
                             self.processed_minute_data[symbol][-1]['sma'] != self.processed_minute_data[symbol][-1][
                         'ema']:
                         if (self.processed_minute_data[symbol][-1]['sma'] >
@@ -539,8 +606,8 @@ class Formula1(Formula):
                                 # Trend Increasing, high price is higher than buy at
                                 # Request Buy NOW
                                 ti, dat = custom_t.get_tz_time_date_from_timestamp(second_data['e'])
-                                if ti not in self.all_excluded_times_dict:
-                                    bought_at = self.buy_sell_events.buy_commands[symbol].buy_at
+                                if ti not in self.all_excluded_times and self.buy_sell_events.can_request_buy(symbol):
+                                    bought_at = self.buy_sell_events.get_buy_command(symbol).buy_at
                                     self.buy_sell_events.request_buy(timestamp=second_data['s'], symbol=symbol,
                                                                      price=bought_at)
                                     try:
@@ -554,17 +621,17 @@ class Formula1(Formula):
                                                                  start_time=self.processed_minute_data[symbol][0][
                                                                      'cal_t'].replace(":", "_"))
                                     except:
-                                        print(f"Issue on persisting {symbol} Buy Sell Update")
+                                        logger.exception("buy_sell_persist_failed", symbol=symbol)
                                 else:
-                                    print("Excludend time buy skipped")
+                                    logger.sampled(logging.INFO, "excluded_time_buy_skipped", every=60, symbol=symbol, time=ti)
                             else:
-                                print(f"{symbol} tiny data detected")
-            elif self.buy_sell_events.is_trying_sell():
-                if symbol == self.buy_sell_events.get_current_bought_symbol():
+                                logger.sampled(logging.INFO, "tiny_data", every=60, symbol=symbol)
+            elif self.buy_sell_events.is_trying_sell(symbol):
+                if self.buy_sell_events.is_buy_requested(symbol):
                     # Sell based on characteristics
                     # Intersection handled in minute data. Here all of the prices are valid to sell
-                    print(f"[{symbol}] Sell Trying")
-                    if second_data['s'] > self.buy_sell_events.trying_sell_timestamp:
+                    logger.sampled(logging.INFO, "sell_trying", every=60, symbol=symbol)
+                    if second_data['s'] > self.buy_sell_events.get_trying_sell_timestamp(symbol):
                         # Selling at opening price
                         status = self.buy_sell_events.request_sell(timestamp=second_data['s'], symbol=symbol,
                                                                    price=second_data['o'])
@@ -578,22 +645,21 @@ class Formula1(Formula):
                                                      start_time=self.processed_minute_data[symbol][0][
                                                          'cal_t'].replace(":", "_"))
                         except:
-                            print(f"Issue on persisting {symbol} Buy Sell Update")
+                            logger.exception("buy_sell_persist_failed", symbol=symbol)
                         if status == BAN_IT:
                             # Symbol already in the banned symbols. Now dumping
                             with open(self.banned_symbols_path, 'w') as file:
                                 json.dump(self.banned_symbols, file)
                             del self.processed_minute_data[symbol]
                             del self.processed_minute_intersections[symbol]
-                            print(f"[Banned] {symbol} until {self.banned_symbols[symbol]}")
+                            logger.warning("symbol_banned", symbol=symbol, until=self.banned_symbols[symbol])
             if self.with_cancel:
-                if self.buy_sell_events.trader_buy_requested:
-                    if self.buy_sell_events.current_bought_symbol == symbol:
-                        if second_data['s'] > self.buy_sell_events.place_buy_order_at_ts:
-                            if second_data['h'] >= self.buy_sell_events.buy_commands[
-                                symbol].buy_requested_price + self.cancel_price:
-                                # cancel order if not filled
-                                self.buy_sell_events.try_cancel_buy(symbol)
+                if self.buy_sell_events.is_buy_requested(symbol):
+                    if second_data['s'] > self.buy_sell_events.get_place_buy_order_at_ts(symbol):
+                        if second_data['h'] >= self.buy_sell_events.get_buy_command(
+                                symbol).buy_requested_price + self.cancel_price:
+                            # cancel order if not filled
+                            self.buy_sell_events.try_cancel_buy(symbol)
 
     def on_minute_data_received(self, minute_data: dict, symbol):
         """
@@ -606,19 +672,21 @@ class Formula1(Formula):
         if symbol not in self.processed_minute_data:
             return
         self.processed_minute_data[symbol].append(minute_data)
-        time_, date_ = custom_t.get_tz_time_date_from_timestamp(minute_data['s'])
-        minute_data['cal_d'] = date_
-        minute_data['cal_t'] = time_
-        self.set_sma(symbol, self.processed_minute_data[symbol], target_field='c')
-        self.set_ema(symbol, self.processed_minute_data[symbol], target_field='c', target_sma_field='sma')
-        self.set_sma(symbol, self.processed_minute_data[symbol], target_field='v')
-        self.set_ema(symbol, self.processed_minute_data[symbol], target_field='v', target_sma_field='v_sma')
+        if not has_indicators(minute_data):
+            # Not enriched by the feed server (see indicators.MinuteBarEnricher)
+            time_, date_ = custom_t.get_tz_time_date_from_timestamp(minute_data['s'])
+            minute_data['cal_d'] = date_
+            minute_data['cal_t'] = time_
+            self.set_sma(symbol, self.processed_minute_data[symbol], target_field='c')
+            self.set_ema(symbol, self.processed_minute_data[symbol], target_field='c', target_sma_field='sma')
+            self.set_sma(symbol, self.processed_minute_data[symbol], target_field='v')
+            self.set_ema(symbol, self.processed_minute_data[symbol], target_field='v', target_sma_field='v_sma')
         current_index = len(self.processed_minute_data[symbol]) - 1
 
         if self.processed_minute_intersections[symbol].first_intersection_found:
             if self.processed_minute_intersections[symbol].second_intersection_found:
                 if minute_data['sma'] > minute_data['ema']:
-                    print(f"[{symbol}] : Third Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="third", cal_t=minute_data['cal_t'])
                     # Third intersection found
                     minute_data['intersection'] = "first"
                     self.processed_minute_intersections[symbol].first_intersection_index = current_index
@@ -630,27 +698,27 @@ class Formula1(Formula):
                         self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=minute_data['e'],
                                                          selling_mode="normal")
                 elif symbol in self.buy_sell_events.get_buying_symbols():
-                    if minute_data['cal_t'] in self.all_excluded_times_dict:
-                        print(f"Excluded time detected. Selling immediately [{minute_data['cal_t']}]")
+                    if minute_data['cal_t'] in self.all_excluded_times:
+                        logger.info("excluded_time_forced_sell", symbol=symbol, cal_t=minute_data['cal_t'])
                         self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=minute_data['e'],
                                                          selling_mode="forced")
             else:
                 if minute_data['ema'] > minute_data['sma']:
-                    print(f"[{symbol}] : Second Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="second", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "second"
                     self.processed_minute_intersections[symbol].second_intersection_found = True
                     self.processed_minute_intersections[symbol].second_intersection_index = current_index
                     self.processed_minute_intersections[symbol].second_intersection_cal_t = minute_data['cal_t']
                     if self.processed_minute_intersections[
-                        symbol].second_intersection_cal_t not in self.all_excluded_times_dict:
+                        symbol].second_intersection_cal_t not in self.all_excluded_times:
                         buy_at = round(
                             self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter + 0.01, 2)
                         if 370.5 > buy_at > 0.7:
                             if minute_data['cal_t'] in self.trader.alpaka_cal_trading_hours:
                                 self.buy_sell_events.try_to_buy(symbol, buy_at, current_timestamp=minute_data['e'])
                     else:
-                        print(
-                            f"Excluded time detected. Skipping Buy {self.processed_minute_intersections[symbol].second_intersection_cal_t}")
+                        logger.info("excluded_time_buy_skipped", symbol=symbol,
+                                    cal_t=self.processed_minute_intersections[symbol].second_intersection_cal_t)
                 elif self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter < minute_data['h']:
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
         else:
@@ -658,14 +726,14 @@ class Formula1(Formula):
             if self.processed_minute_intersections[symbol].pre_point_found:
                 # Find first intersection
                 if minute_data['sma'] > minute_data['ema']:
-                    print(f"**[{symbol}]** : Very First Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="first", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "first"
                     self.processed_minute_intersections[symbol].first_intersection_index = current_index
                     self.processed_minute_intersections[symbol].first_intersection_found = True
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
             else:
                 if minute_data['ema'] > minute_data['sma']:
-                    print(f"*****[{symbol}] : Pre Point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="pre", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "pre"
                     self.processed_minute_intersections[symbol].pre_point_found = True
 
@@ -720,7 +788,7 @@ class Formula1(Formula):
         Prepare data storage to store processed minute data
         """
         if symbol in self.processed_minute_data:
-            print("Server issue. When server closes without unsubscription")
+            logger.warning("duplicate_subscription", symbol=symbol, channel=channel)
             return
         if self.buy_sell_events.ban_mode:
             if symbol in self.banned_symbols:
@@ -730,12 +798,12 @@ class Formula1(Formula):
                     del self.banned_symbols[symbol]
                     with open(self.banned_symbols_path, 'w') as file:
                         json.dump(self.banned_symbols, file)
-                    print(f"[UNBANNED]{symbol}")
+                    logger.info("symbol_unbanned", symbol=symbol)
                 else:
-                    print(f"[Kicked] [{symbol}] Banned Symbol Tried to get in")
+                    logger.info("banned_symbol_kicked", symbol=symbol)
                     return
 
-        print(f"Subscription Success : {symbol} on {channel}")
+        logger.info("subscribed", symbol=symbol, channel=channel)
         if channel == self.minute__agg_channel:
             self.processed_minute_data[symbol] = []
             self.processed_minute_intersections[symbol] = IntersectionPoints(symbol=symbol)
@@ -747,10 +815,10 @@ class Formula1(Formula):
             or Client in the ban list
             """
             return
-        print(f"Unsubscription Success : {symbol} on {channel}")
+        logger.info("unsubscribed", symbol=symbol, channel=channel)
         if channel == self.minute__agg_channel:
             # Do what ever you want to do before deleting the stored data
-            if self.buy_sell_events.is_buy_requested() and self.buy_sell_events.get_current_bought_symbol() == symbol:
+            if self.buy_sell_events.is_buy_requested(symbol):
                 # Sell pending sell stock immediately
                 current_stamp = self.processed_minute_data[symbol][-1]['e']
                 self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=current_stamp, selling_mode="blind")
@@ -765,15 +833,13 @@ class Formula1(Formula):
                                          end_time=self.processed_minute_data[symbol][-1]['cal_t'].replace(":", "_"),
                                          )
             except:
-                print(f"Issue on persisting {symbol} buy sell data")
+                logger.exception("buy_sell_persist_failed", symbol=symbol, final=True)
             if self.buy_sell_events.ban_mode:
                 if symbol in self.buy_sell_events.lost_money_on:
-                    print(
-                        f"[Lost Money Count Reset] {symbol} lost: [{self.buy_sell_events.lost_money_on[symbol]}] times")
+                    logger.info("lost_money_count_reset", symbol=symbol, lost=self.buy_sell_events.lost_money_on[symbol])
                     del self.buy_sell_events.lost_money_on[symbol]
-            if symbol in self.buy_sell_events.buy_commands:
-                # Stop buying if trying
-                del self.buy_sell_events.buy_commands[symbol]
+            # Stop buying if trying
+            self.buy_sell_events.discard_position(symbol)
             del self.processed_minute_data[symbol]
             del self.processed_minute_intersections[symbol]
 
@@ -811,10 +877,16 @@ class Formula3(Formula):
     """
 
     def __init__(self, trader: AlpakaTrader, socket_key: str, socket_uri: str, ban_mode=True, with_cancel=False,
-                 cancel_price=0.03):
+                 cancel_price=0.03, max_positions=1, shared_bus_path=None, wire_encoding="json"):
+        """
+        :param max_positions: symbols bought or trying to buy at the same time. Buying power is split between them
+        :param shared_bus_path: receive the feed over the shared memory bus instead of the websocket
+        :param wire_encoding: json, struct or msgpack websocket frames
+        """
         self.with_cancel = with_cancel
         self.cancel_price = cancel_price
-        self.market_data = WebSocketAggProvider(key=socket_key, uri=socket_uri)
+        self.market_data = WebSocketAggProvider(key=socket_key, uri=socket_uri, shared_bus_path=shared_bus_path,
+                                                wire_encoding=wire_encoding)
         self.market_data.attach_on_minute_data_received_listener(self.on_minute_data_received)
         self.market_data.attach_on_second_data_received_listener(self.on_second_data_received)
         self.market_data.attach_new_subscribed_listener(self.new_subscribed)
@@ -824,7 +896,7 @@ class Formula3(Formula):
         self.trader = trader
         self.processed_minute_data: Dict[str, List[dict]] = {}
         self.processed_minute_intersections: Dict[str, IntersectionPoints] = {}
-        self.buy_sell_events = BuySellEvents(ban_mode=ban_mode)
+        self.buy_sell_events = BuySellEvents(ban_mode=ban_mode, max_positions=max_positions)
         self.formula_name = "formula_3_ban_" + ("yes" if ban_mode else "no")
         self.buy_sell_formula_path = f"buy_sell_data/{self.formula_name}"
         self.banned_symbols_path = f"{self.buy_sell_formula_path}/ban_list.json"
@@ -834,16 +906,16 @@ class Formula3(Formula):
             self.banned_symbols = self.get_banned_symbols()
             self.buy_sell_events.attach_banned_symbols(self.banned_symbols)
         self.current_minute_timestamp = int(datetime.now().timestamp()) * 1000
-        time_dict_16_59pm_to_04_02am = TimeRangeCreator(start_time="16:59:00", end_time="04:02:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_05_59am_to_06_02am = TimeRangeCreator(start_time="05:59:00", end_time="06:02:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_06_27am_to_06_33am = TimeRangeCreator(start_time="06:27:00", end_time="06:33:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_12_59pm_to_13_03pm = TimeRangeCreator(start_time="12:59:00", end_time="13:03:00",
-                                                        interval_sec=1).get_dict()
-        self.all_excluded_times_dict = {**time_dict_16_59pm_to_04_02am, **time_dict_05_59am_to_06_02am,
-                                        **time_dict_06_27am_to_06_33am, **time_dict_12_59pm_to_13_03pm}
+        time_16_59pm_to_04_02am = TimeRangeCreator(start_time="16:59:00", end_time="04:02:00",
+                                                   interval_sec=1).get_range()
+        time_05_59am_to_06_02am = TimeRangeCreator(start_time="05:59:00", end_time="06:02:00",
+                                                   interval_sec=1).get_range()
+        time_06_27am_to_06_33am = TimeRangeCreator(start_time="06:27:00", end_time="06:33:00",
+                                                   interval_sec=1).get_range()
+        time_12_59pm_to_13_03pm = TimeRangeCreator(start_time="12:59:00", end_time="13:03:00",
+                                                   interval_sec=1).get_range()
+        self.all_excluded_times = TimeRangeUnion(time_16_59pm_to_04_02am, time_05_59am_to_06_02am,
+                                                 time_06_27am_to_06_33am, time_12_59pm_to_13_03pm)
         self.first_min_excluded_times_dict = {"16:59:00": True, "05:59:00": True, "06:27:00": True,
                                               "12:59:00": True}
 
@@ -863,12 +935,12 @@ class Formula3(Formula):
 
     def on_second_data_received(self, second_data, symbol):
         if symbol in self.buy_sell_events.get_buying_symbols():
-            if self.buy_sell_events.is_trying_buy():
-                print(f"[{symbol}] Buy Trying")
+            if self.buy_sell_events.is_trying_buy(symbol):
+                logger.sampled(logging.INFO, "buy_trying", every=60, symbol=symbol)
                 # Buy based on characteristics
                 # Intersections events are handled in minute data. here all of the prices are valid to buy
-                if second_data['s'] > self.buy_sell_events.buy_commands[symbol].timestamp:
-                    if second_data['h'] >= self.buy_sell_events.buy_commands[symbol].buy_at - 0.01 and \
+                if second_data['s'] > self.buy_sell_events.get_buy_command(symbol).timestamp:
+                    if second_data['h'] >= self.buy_sell_events.get_buy_command(symbol).buy_at - 0.01 and \
                             self.processed_minute_data[symbol][-1]['sma'] != self.processed_minute_data[symbol][-1][
                         'ema']:
                         if (self.processed_minute_data[symbol][-1]['sma'] >
@@ -879,13 +951,13 @@ class Formula3(Formula):
                                 # Trend Increasing, high price is higher than buy at
                                 # Request Buy NOW
                                 ti, dat = custom_t.get_tz_time_date_from_timestamp(second_data['e'])
-                                if ti not in self.all_excluded_times_dict:
-                                    bought_at = self.buy_sell_events.buy_commands[symbol].buy_at
+                                if ti not in self.all_excluded_times and self.buy_sell_events.can_request_buy(symbol):
+                                    bought_at = self.buy_sell_events.get_buy_command(symbol).buy_at
                                     self.buy_sell_events.request_buy(timestamp=second_data['s'], symbol=symbol,
                                                                      price=bought_at)
-                                    self.buy_sell_events.set_try_sell_timestamp(second_data['s'])
+                                    self.buy_sell_events.set_try_sell_timestamp(symbol, second_data['s'])
 
-                                    self.buy_sell_events.try_sell_on_decrease(True)
+                                    self.buy_sell_events.try_sell_on_decrease(symbol, True)
                                     try:
                                         # print(self.processed_minute_data[symbol])
                                         self.processed_minute_data[symbol][-1]["bought_at_timestamp"] = second_data['s']
@@ -897,19 +969,19 @@ class Formula3(Formula):
                                                                  start_time=self.processed_minute_data[symbol][0][
                                                                      'cal_t'].replace(":", "_"))
                                     except:
-                                        print(f"Issue on persisting {symbol} Buy Sell Update")
+                                        logger.exception("buy_sell_persist_failed", symbol=symbol)
                             else:
-                                print(f"{symbol} tiny data detected")
-            elif self.buy_sell_events.is_trying_sell_on_decrease():
-                if symbol == self.buy_sell_events.get_current_bought_symbol():
-                    if second_data['s'] > self.buy_sell_events.trying_sell_timestamp:
-                        print(f"[{symbol}] Sell Trying to find decrease")
+                                logger.sampled(logging.INFO, "tiny_data", every=60, symbol=symbol)
+            elif self.buy_sell_events.is_trying_sell_on_decrease(symbol):
+                if self.buy_sell_events.is_buy_requested(symbol):
+                    if second_data['s'] > self.buy_sell_events.get_trying_sell_timestamp(symbol):
+                        logger.sampled(logging.INFO, "sell_trying", every=60, symbol=symbol, mode="find_decrease")
                         if self.processed_minute_data[symbol][-1]['l'] > second_data['l']:  # Decrease detected:
                             # Selling at opening price
                             status = self.buy_sell_events.request_sell(timestamp=second_data['s'], symbol=symbol,
                                                                        price=self.processed_minute_data[symbol][-1][
                                                                                  'l'] - 0.01)
-                            self.buy_sell_events.try_sell_on_decrease(False)
+                            self.buy_sell_events.try_sell_on_decrease(symbol, False)
                             try:
                                 self.processed_minute_data[symbol][-1]["sold_at_timestamp"] = second_data['s']
                                 self.processed_minute_data[symbol][-1]["sold_at_price"] = second_data['l'] - 0.01
@@ -920,20 +992,20 @@ class Formula3(Formula):
                                                          start_time=self.processed_minute_data[symbol][0][
                                                              'cal_t'].replace(":", "_"))
                             except:
-                                print(f"Issue on persisting {symbol} Buy Sell Update")
+                                logger.exception("buy_sell_persist_failed", symbol=symbol)
                             if status == BAN_IT:
                                 # Symbol already in the banned symbols. Now dumping
                                 with open(self.banned_symbols_path, 'w') as file:
                                     json.dump(self.banned_symbols, file)
                                 del self.processed_minute_data[symbol]
                                 del self.processed_minute_intersections[symbol]
-                                print(f"[Banned] {symbol}")
-            elif self.buy_sell_events.is_trying_sell():
-                if symbol == self.buy_sell_events.get_current_bought_symbol():
+                                logger.warning("symbol_banned", symbol=symbol)
+            elif self.buy_sell_events.is_trying_sell(symbol):
+                if self.buy_sell_events.is_buy_requested(symbol):
                     # Sell based on characteristics
                     # Intersection handled in minute data. Here all of the prices are valid to sell
-                    print(f"[{symbol}] Sell Trying on Third Intersection")
-                    if second_data['s'] > self.buy_sell_events.trying_sell_timestamp:
+                    logger.sampled(logging.INFO, "sell_trying", every=60, symbol=symbol, mode="third_intersection")
+                    if second_data['s'] > self.buy_sell_events.get_trying_sell_timestamp(symbol):
                         # Selling at opening price
                         status = self.buy_sell_events.request_sell(timestamp=second_data['s'], symbol=symbol,
                                                                    price=second_data['o'])
@@ -947,22 +1019,21 @@ class Formula3(Formula):
                                                      start_time=self.processed_minute_data[symbol][0][
                                                          'cal_t'].replace(":", "_"))
                         except:
-                            print(f"Issue on persisting {symbol} Buy Sell Update")
+                            logger.exception("buy_sell_persist_failed", symbol=symbol)
                         if status == BAN_IT:
                             # Symbol already in the banned symbols. Now dumping
                             with open(self.banned_symbols_path, 'w') as file:
                                 json.dump(self.banned_symbols, file)
                             del self.processed_minute_data[symbol]
                             del self.processed_minute_intersections[symbol]
-                            print(f"[Banned] {symbol}")
+                            logger.warning("symbol_banned", symbol=symbol)
             if self.with_cancel:
-                if self.buy_sell_events.trader_buy_requested:
-                    if self.buy_sell_events.current_bought_symbol == symbol:
-                        if second_data['s'] > self.buy_sell_events.place_buy_order_at_ts:
-                            if second_data['h'] >= self.buy_sell_events.buy_commands[
-                                symbol].buy_requested_price + self.cancel_price:
-                                # cancel order if not filled
-                                self.buy_sell_events.try_cancel_buy(symbol)
+                if self.buy_sell_events.is_buy_requested(symbol):
+                    if second_data['s'] > self.buy_sell_events.get_place_buy_order_at_ts(symbol):
+                        if second_data['h'] >= self.buy_sell_events.get_buy_command(
+                                symbol).buy_requested_price + self.cancel_price:
+                            # cancel order if not filled
+                            self.buy_sell_events.try_cancel_buy(symbol)
 
     def on_minute_data_received(self, minute_data: dict, symbol):
         """
@@ -975,19 +1046,21 @@ class Formula3(Formula):
         if symbol not in self.processed_minute_data:
             return
         self.processed_minute_data[symbol].append(minute_data)
-        time_, date_ = custom_t.get_tz_time_date_from_timestamp(minute_data['s'])
-        minute_data['cal_d'] = date_
-        minute_data['cal_t'] = time_
-        self.set_sma(symbol, self.processed_minute_data[symbol], target_field='c')
-        self.set_ema(symbol, self.processed_minute_data[symbol], target_field='c', target_sma_field='sma')
-        self.set_sma(symbol, self.processed_minute_data[symbol], target_field='v')
-        self.set_ema(symbol, self.processed_minute_data[symbol], target_field='v', target_sma_field='v_sma')
+        if not has_indicators(minute_data):
+            # Not enriched by the feed server (see indicators.MinuteBarEnricher)
+            time_, date_ = custom_t.get_tz_time_date_from_timestamp(minute_data['s'])
+            minute_data['cal_d'] = date_
+            minute_data['cal_t'] = time_
+            self.set_sma(symbol, self.processed_minute_data[symbol], target_field='c')
+            self.set_ema(symbol, self.processed_minute_data[symbol], target_field='c', target_sma_field='sma')
+            self.set_sma(symbol, self.processed_minute_data[symbol], target_field='v')
+            self.set_ema(symbol, self.processed_minute_data[symbol], target_field='v', target_sma_field='v_sma')
         current_index = len(self.processed_minute_data[symbol]) - 1
 
         if self.processed_minute_intersections[symbol].first_intersection_found:
             if self.processed_minute_intersections[symbol].second_intersection_found:
                 if minute_data['sma'] > minute_data['ema']:
-                    print(f"[{symbol}] : Third Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="third", cal_t=minute_data['cal_t'])
                     # Third intersection found
                     minute_data['intersection'] = "first"
                     self.processed_minute_intersections[symbol].first_intersection_index = current_index
@@ -996,32 +1069,32 @@ class Formula3(Formula):
                     self.processed_minute_intersections[symbol].second_intersection_cal_t = None
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
                     if symbol in self.buy_sell_events.get_buying_symbols():
-                        self.buy_sell_events.try_sell_on_decrease(False)
+                        self.buy_sell_events.try_sell_on_decrease(symbol, False)
                         self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=minute_data['e'],
                                                          selling_mode="normal")
                 elif symbol in self.buy_sell_events.get_buying_symbols():
-                    if minute_data['cal_t'] in self.all_excluded_times_dict:
-                        print(f"Excluded time detected. Selling immediately [{minute_data['cal_t']}]")
-                        self.buy_sell_events.try_sell_on_decrease(False)
+                    if minute_data['cal_t'] in self.all_excluded_times:
+                        logger.info("excluded_time_forced_sell", symbol=symbol, cal_t=minute_data['cal_t'])
+                        self.buy_sell_events.try_sell_on_decrease(symbol, False)
                         self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=minute_data['e'],
                                                          selling_mode="forced")
             else:
                 if minute_data['ema'] > minute_data['sma']:
-                    print(f"[{symbol}] : Second Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="second", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "second"
                     self.processed_minute_intersections[symbol].second_intersection_found = True
                     self.processed_minute_intersections[symbol].second_intersection_index = current_index
                     self.processed_minute_intersections[symbol].second_intersection_cal_t = minute_data['cal_t']
                     if self.processed_minute_intersections[
-                        symbol].second_intersection_cal_t not in self.all_excluded_times_dict:
+                        symbol].second_intersection_cal_t not in self.all_excluded_times:
                         buy_at = round(
                             self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter + 0.01, 2)
                         if 370.5 > buy_at > 0.7:
                             if minute_data['cal_t'] in self.trader.alpaka_cal_trading_hours:
                                 self.buy_sell_events.try_to_buy(symbol, buy_at, current_timestamp=minute_data['e'])
                     else:
-                        print(
-                            f"Excluded time detected. Skipping Buy {self.processed_minute_intersections[symbol].second_intersection_cal_t}")
+                        logger.info("excluded_time_buy_skipped", symbol=symbol,
+                                    cal_t=self.processed_minute_intersections[symbol].second_intersection_cal_t)
                 elif self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter < minute_data['h']:
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
         else:
@@ -1029,14 +1102,14 @@ class Formula3(Formula):
             if self.processed_minute_intersections[symbol].pre_point_found:
                 # Find first intersection
                 if minute_data['sma'] > minute_data['ema']:
-                    print(f"**[{symbol}]** : Very First Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="first", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "first"
                     self.processed_minute_intersections[symbol].first_intersection_index = current_index
                     self.processed_minute_intersections[symbol].first_intersection_found = True
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
             else:
                 if minute_data['ema'] > minute_data['sma']:
-                    print(f"*****[{symbol}] : Pre Point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="pre", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "pre"
                     self.processed_minute_intersections[symbol].pre_point_found = True
 
@@ -1091,7 +1164,7 @@ class Formula3(Formula):
         Prepare data storage to store processed minute data
         """
         if symbol in self.processed_minute_data:
-            print("Server issue. When server closes without unsubscription")
+            logger.warning("duplicate_subscription", symbol=symbol, channel=channel)
             return
         if self.buy_sell_events.ban_mode:
             if symbol in self.banned_symbols:
@@ -1101,12 +1174,12 @@ class Formula3(Formula):
                     del self.banned_symbols[symbol]
                     with open(self.banned_symbols_path, 'w') as file:
                         json.dump(self.banned_symbols, file)
-                    print(f"[UNBANNED]{symbol}")
+                    logger.info("symbol_unbanned", symbol=symbol)
                 else:
-                    print(f"[Kicked] [{symbol}] Banned Symbol Tried to get in")
+                    logger.info("banned_symbol_kicked", symbol=symbol)
                     return
 
-        print(f"Subscription Success : {symbol} on {channel}")
+        logger.info("subscribed", symbol=symbol, channel=channel)
         if channel == self.minute__agg_channel:
             self.processed_minute_data[symbol] = []
             self.processed_minute_intersections[symbol] = IntersectionPoints(symbol=symbol)
@@ -1118,10 +1191,10 @@ class Formula3(Formula):
             or Client in the ban list
             """
             return
-        print(f"Unsubscription Success : {symbol} on {channel}")
+        logger.info("unsubscribed", symbol=symbol, channel=channel)
         if channel == self.minute__agg_channel:
             # Do what ever you want to do before deleting the stored data
-            if self.buy_sell_events.is_buy_requested() and self.buy_sell_events.get_current_bought_symbol() == symbol:
+            if self.buy_sell_events.is_buy_requested(symbol):
                 # Sell pending sell stock immediately
                 current_stamp = self.processed_minute_data[symbol][-1]['e']
                 self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=current_stamp, selling_mode="blind")
@@ -1136,15 +1209,13 @@ class Formula3(Formula):
                                          end_time=self.processed_minute_data[symbol][-1]['cal_t'].replace(":", "_"),
                                          )
             except:
-                print(f"Issue on persisting {symbol} buy sell data")
+                logger.exception("buy_sell_persist_failed", symbol=symbol, final=True)
             if self.buy_sell_events.ban_mode:
                 if symbol in self.buy_sell_events.lost_money_on:
-                    print(
-                        f"[Lost Money Count Reset] {symbol} lost: [{self.buy_sell_events.lost_money_on[symbol]}] times")
+                    logger.info("lost_money_count_reset", symbol=symbol, lost=self.buy_sell_events.lost_money_on[symbol])
                     del self.buy_sell_events.lost_money_on[symbol]
-            if symbol in self.buy_sell_events.buy_commands:
-                # Stop buying if trying
-                del self.buy_sell_events.buy_commands[symbol]
+            # Stop buying if trying
+            self.buy_sell_events.discard_position(symbol)
             del self.processed_minute_data[symbol]
             del self.processed_minute_intersections[symbol]
 
@@ -1182,10 +1253,16 @@ class Formula4(Formula):
     """
 
     def __init__(self, trader: AlpakaTrader, socket_key: str, socket_uri: str, ban_mode=True, with_cancel=False,
-                 cancel_price=0.03):
+                 cancel_price=0.03, max_positions=1, shared_bus_path=None, wire_encoding="json"):
+        """
+        :param max_positions: symbols bought or trying to buy at the same time. Buying power is split between them
+        :param shared_bus_path: receive the feed over the shared memory bus instead of the websocket
+        :param wire_encoding: json, struct or msgpack websocket frames
+        """
         self.with_cancel = with_cancel
         self.cancel_price = cancel_price
-        self.market_data = WebSocketAggProvider(key=socket_key, uri=socket_uri)
+        self.market_data = WebSocketAggProvider(key=socket_key, uri=socket_uri, shared_bus_path=shared_bus_path,
+                                                wire_encoding=wire_encoding)
         self.market_data.attach_on_minute_data_received_listener(self.on_minute_data_received)
         self.market_data.attach_on_second_data_received_listener(self.on_second_data_received)
         self.market_data.attach_new_subscribed_listener(self.new_subscribed)
@@ -1195,7 +1272,7 @@ class Formula4(Formula):
         self.trader = trader
         self.processed_minute_data: Dict[str, List[dict]] = {}
         self.processed_minute_intersections: Dict[str, IntersectionPoints] = {}
-        self.buy_sell_events = BuySellEvents(ban_mode=ban_mode)
+        self.buy_sell_events = BuySellEvents(ban_mode=ban_mode, max_positions=max_positions)
         self.formula_name = "formula_4_ban_" + ("yes" if ban_mode else "no")
         self.buy_sell_formula_path = f"buy_sell_data/{self.formula_name}"
         self.banned_symbols_path = f"{self.buy_sell_formula_path}/ban_list.json"
@@ -1205,16 +1282,16 @@ class Formula4(Formula):
             self.banned_symbols = self.get_banned_symbols()
             self.buy_sell_events.attach_banned_symbols(self.banned_symbols)
         self.current_minute_timestamp = int(datetime.now().timestamp()) * 1000
-        time_dict_16_59pm_to_04_02am = TimeRangeCreator(start_time="16:59:00", end_time="04:02:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_05_59am_to_06_02am = TimeRangeCreator(start_time="05:59:00", end_time="06:02:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_06_27am_to_06_33am = TimeRangeCreator(start_time="06:27:00", end_time="06:33:00",
-                                                        interval_sec=1).get_dict()
-        time_dict_12_59pm_to_13_03pm = TimeRangeCreator(start_time="12:59:00", end_time="13:03:00",
-                                                        interval_sec=1).get_dict()
-        self.all_excluded_times_dict = {**time_dict_16_59pm_to_04_02am, **time_dict_05_59am_to_06_02am,
-                                        **time_dict_06_27am_to_06_33am, **time_dict_12_59pm_to_13_03pm}
+        time_16_59pm_to_04_02am = TimeRangeCreator(start_time="16:59:00", end_time="04:02:00",
+                                                   interval_sec=1).get_range()
+        time_05_59am_to_06_02am = TimeRangeCreator(start_time="05:59:00", end_time="06:02:00",
+                                                   interval_sec=1).get_range()
+        time_06_27am_to_06_33am = TimeRangeCreator(start_time="06:27:00", end_time="06:33:00",
+                                                   interval_sec=1).get_range()
+        time_12_59pm_to_13_03pm = TimeRangeCreator(start_time="12:59:00", end_time="13:03:00",
+                                                   interval_sec=1).get_range()
+        self.all_excluded_times = TimeRangeUnion(time_16_59pm_to_04_02am, time_05_59am_to_06_02am,
+                                                 time_06_27am_to_06_33am, time_12_59pm_to_13_03pm)
         self.first_min_excluded_times_dict = {"16:59:00": True, "05:59:00": True, "06:27:00": True,
                                               "12:59:00": True}
 
@@ -1225,8 +1302,7 @@ class Formula4(Formula):
         try:
             with open(self.banned_symbols_path, 'r') as file:
                 data = json.load(file)
-                print(data)
-                print(type(data))
+                logger.info("banned_symbols_loaded", count=len(data))
                 return data
         except:
             return {}
@@ -1236,12 +1312,12 @@ class Formula4(Formula):
 
     def on_second_data_received(self, second_data, symbol):
         if symbol in self.buy_sell_events.get_buying_symbols():
-            if self.buy_sell_events.is_trying_buy():
-                print(f"[{symbol}] Buy Trying")
+            if self.buy_sell_events.is_trying_buy(symbol):
+                logger.sampled(logging.INFO, "buy_trying", every=60, symbol=symbol)
                 # Buy based on characteristics
                 # Intersections events are handled in minute data. here all of the prices are valid to buy
-                if second_data['s'] > self.buy_sell_events.buy_commands[symbol].timestamp:
-                    if second_data['h'] >= self.buy_sell_events.buy_commands[symbol].buy_at - 0.01 and \
+                if second_data['s'] > self.buy_sell_events.get_buy_command(symbol).timestamp:
+                    if second_data['h'] >= self.buy_sell_events.get_buy_command(symbol).buy_at - 0.01 and \
                             self.processed_minute_data[symbol][-1]['sma'] != self.processed_minute_data[symbol][-1][
                         'ema']:
                         if (self.processed_minute_data[symbol][-1]['sma'] >
@@ -1252,8 +1328,8 @@ class Formula4(Formula):
                                 # Trend Increasing, high price is higher than buy at
                                 # Request Buy NOW
                                 ti, dat = custom_t.get_tz_time_date_from_timestamp(second_data['e'])
-                                if ti not in self.all_excluded_times_dict:
-                                    bought_at = self.buy_sell_events.buy_commands[symbol].buy_at
+                                if ti not in self.all_excluded_times and self.buy_sell_events.can_request_buy(symbol):
+                                    bought_at = self.buy_sell_events.get_buy_command(symbol).buy_at
                                     self.buy_sell_events.request_buy(timestamp=second_data['s'], symbol=symbol,
                                                                      price=bought_at)
                                     try:
@@ -1267,15 +1343,15 @@ class Formula4(Formula):
                                                                  start_time=self.processed_minute_data[symbol][0][
                                                                      'cal_t'].replace(":", "_"))
                                     except:
-                                        print(f"Issue on persisting {symbol} Buy Sell Update")
+                                        logger.exception("buy_sell_persist_failed", symbol=symbol)
                             else:
-                                print(f"{symbol} tiny data detected")
-            elif self.buy_sell_events.is_trying_sell():
-                if symbol == self.buy_sell_events.get_current_bought_symbol():
+                                logger.sampled(logging.INFO, "tiny_data", every=60, symbol=symbol)
+            elif self.buy_sell_events.is_trying_sell(symbol):
+                if self.buy_sell_events.is_buy_requested(symbol):
                     # Sell based on characteristics
                     # Intersection handled in minute data. Here all of the prices are valid to sell
-                    print(f"[{symbol}] Sell Trying when decreasing")
-                    if second_data['s'] > self.buy_sell_events.trying_sell_timestamp:
+                    logger.sampled(logging.INFO, "sell_trying", every=60, symbol=symbol, mode="decreasing")
+                    if second_data['s'] > self.buy_sell_events.get_trying_sell_timestamp(symbol):
                         # Selling at opening price
                         if self.processed_minute_data[symbol][-1]['l'] > second_data['l']:
                             status = self.buy_sell_events.request_sell(timestamp=second_data['s'], symbol=symbol,
@@ -1291,22 +1367,21 @@ class Formula4(Formula):
                                                          start_time=self.processed_minute_data[symbol][0][
                                                              'cal_t'].replace(":", "_"))
                             except:
-                                print(f"Issue on persisting {symbol} Buy Sell Update")
+                                logger.exception("buy_sell_persist_failed", symbol=symbol)
                             if status == BAN_IT:
                                 # Symbol already in the banned symbols. Now dumping
                                 with open(self.banned_symbols_path, 'w') as file:
                                     json.dump(self.banned_symbols, file)
                                 del self.processed_minute_data[symbol]
                                 del self.processed_minute_intersections[symbol]
-                                print(f"[Banned] {symbol}")
+                                logger.warning("symbol_banned", symbol=symbol)
             if self.with_cancel:
-                if self.buy_sell_events.trader_buy_requested:
-                    if self.buy_sell_events.current_bought_symbol == symbol:
-                        if second_data['s'] > self.buy_sell_events.place_buy_order_at_ts:
-                            if second_data['h'] >= self.buy_sell_events.buy_commands[
-                                symbol].buy_requested_price + self.cancel_price:
-                                # cancel order if not filled
-                                self.buy_sell_events.try_cancel_buy(symbol)
+                if self.buy_sell_events.is_buy_requested(symbol):
+                    if second_data['s'] > self.buy_sell_events.get_place_buy_order_at_ts(symbol):
+                        if second_data['h'] >= self.buy_sell_events.get_buy_command(
+                                symbol).buy_requested_price + self.cancel_price:
+                            # cancel order if not filled
+                            self.buy_sell_events.try_cancel_buy(symbol)
 
     def on_minute_data_received(self, minute_data: dict, symbol):
         """
@@ -1319,19 +1394,21 @@ class Formula4(Formula):
         if symbol not in self.processed_minute_data:
             return
         self.processed_minute_data[symbol].append(minute_data)
-        time_, date_ = custom_t.get_tz_time_date_from_timestamp(minute_data['s'])
-        minute_data['cal_d'] = date_
-        minute_data['cal_t'] = time_
-        self.set_sma(symbol, self.processed_minute_data[symbol], target_field='c')
-        self.set_ema(symbol, self.processed_minute_data[symbol], target_field='c', target_sma_field='sma')
-        self.set_sma(symbol, self.processed_minute_data[symbol], target_field='v')
-        self.set_ema(symbol, self.processed_minute_data[symbol], target_field='v', target_sma_field='v_sma')
+        if not has_indicators(minute_data):
+            # Not enriched by the feed server (see indicators.MinuteBarEnricher)
+            time_, date_ = custom_t.get_tz_time_date_from_timestamp(minute_data['s'])
+            minute_data['cal_d'] = date_
+            minute_data['cal_t'] = time_
+            self.set_sma(symbol, self.processed_minute_data[symbol], target_field='c')
+            self.set_ema(symbol, self.processed_minute_data[symbol], target_field='c', target_sma_field='sma')
+            self.set_sma(symbol, self.processed_minute_data[symbol], target_field='v')
+            self.set_ema(symbol, self.processed_minute_data[symbol], target_field='v', target_sma_field='v_sma')
         current_index = len(self.processed_minute_data[symbol]) - 1
 
         if self.processed_minute_intersections[symbol].first_intersection_found:
             if self.processed_minute_intersections[symbol].second_intersection_found:
                 if minute_data['sma'] > minute_data['ema']:
-                    print(f"[{symbol}] : Third Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="third", cal_t=minute_data['cal_t'])
                     # Third intersection found
                     minute_data['intersection'] = "first"
                     self.processed_minute_intersections[symbol].first_intersection_index = current_index
@@ -1343,27 +1420,27 @@ class Formula4(Formula):
                         self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=minute_data['e'],
                                                          selling_mode="normal")
                 elif symbol in self.buy_sell_events.get_buying_symbols():
-                    if minute_data['cal_t'] in self.all_excluded_times_dict:
-                        print(f"Excluded time detected. Selling immediately [{minute_data['cal_t']}]")
+                    if minute_data['cal_t'] in self.all_excluded_times:
+                        logger.info("excluded_time_forced_sell", symbol=symbol, cal_t=minute_data['cal_t'])
                         self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=minute_data['e'],
                                                          selling_mode="forced")
             else:
                 if minute_data['ema'] > minute_data['sma']:
-                    print(f"[{symbol}] : Second Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="second", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "second"
                     self.processed_minute_intersections[symbol].second_intersection_found = True
                     self.processed_minute_intersections[symbol].second_intersection_index = current_index
                     self.processed_minute_intersections[symbol].second_intersection_cal_t = minute_data['cal_t']
                     if self.processed_minute_intersections[
-                        symbol].second_intersection_cal_t not in self.all_excluded_times_dict:
+                        symbol].second_intersection_cal_t not in self.all_excluded_times:
                         buy_at = round(
                             self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter + 0.01, 2)
                         if 370.5 > buy_at > 0.7:
                             if minute_data['cal_t'] in self.trader.alpaka_cal_trading_hours:
                                 self.buy_sell_events.try_to_buy(symbol, buy_at, current_timestamp=minute_data['e'])
                     else:
-                        print(
-                            f"Excluded time detected. Skipping Buy {self.processed_minute_intersections[symbol].second_intersection_cal_t}")
+                        logger.info("excluded_time_buy_skipped", symbol=symbol,
+                                    cal_t=self.processed_minute_intersections[symbol].second_intersection_cal_t)
                 elif self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter < minute_data['h']:
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
         else:
@@ -1371,14 +1448,14 @@ class Formula4(Formula):
             if self.processed_minute_intersections[symbol].pre_point_found:
                 # Find first intersection
                 if minute_data['sma'] > minute_data['ema']:
-                    print(f"**[{symbol}]** : Very First Intersection point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="first", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "first"
                     self.processed_minute_intersections[symbol].first_intersection_index = current_index
                     self.processed_minute_intersections[symbol].first_intersection_found = True
                     self.processed_minute_intersections[symbol].highest_price_in_f_and_s_inter = minute_data['h']
             else:
                 if minute_data['ema'] > minute_data['sma']:
-                    print(f"*****[{symbol}] : Pre Point : Time [{minute_data['cal_t']}]")
+                    logger.info("intersection", symbol=symbol, point="pre", cal_t=minute_data['cal_t'])
                     minute_data['intersection'] = "pre"
                     self.processed_minute_intersections[symbol].pre_point_found = True
 
@@ -1433,7 +1510,7 @@ class Formula4(Formula):
         Prepare data storage to store processed minute data
         """
         if symbol in self.processed_minute_data:
-            print("Server issue. When server closes without unsubscription")
+            logger.warning("duplicate_subscription", symbol=symbol, channel=channel)
             return
         if self.buy_sell_events.ban_mode:
             if symbol in self.banned_symbols:
@@ -1443,12 +1520,12 @@ class Formula4(Formula):
                     del self.banned_symbols[symbol]
                     with open(self.banned_symbols_path, 'w') as file:
                         json.dump(self.banned_symbols, file)
-                    print(f"[UNBANNED]{symbol}")
+                    logger.info("symbol_unbanned", symbol=symbol)
                 else:
-                    print(f"[Kicked] [{symbol}] Banned Symbol Tried to get in")
+                    logger.info("banned_symbol_kicked", symbol=symbol)
                     return
 
-        print(f"Subscription Success : {symbol} on {channel}")
+        logger.info("subscribed", symbol=symbol, channel=channel)
         if channel == self.minute__agg_channel:
             self.processed_minute_data[symbol] = []
             self.processed_minute_intersections[symbol] = IntersectionPoints(symbol=symbol)
@@ -1460,10 +1537,10 @@ class Formula4(Formula):
             or Client in the ban list
             """
             return
-        print(f"Unsubscription Success : {symbol} on {channel}")
+        logger.info("unsubscribed", symbol=symbol, channel=channel)
         if channel == self.minute__agg_channel:
             # Do what ever you want to do before deleting the stored data
-            if self.buy_sell_events.is_buy_requested() and self.buy_sell_events.get_current_bought_symbol() == symbol:
+            if self.buy_sell_events.is_buy_requested(symbol):
                 # Sell pending sell stock immediately
                 current_stamp = self.processed_minute_data[symbol][-1]['e']
                 self.buy_sell_events.try_to_sell(symbol=symbol, current_timestamp=current_stamp, selling_mode="blind")
@@ -1478,15 +1555,13 @@ class Formula4(Formula):
                                          end_time=self.processed_minute_data[symbol][-1]['cal_t'].replace(":", "_"),
                                          )
             except:
-                print(f"Issue on persisting {symbol} buy sell data")
+                logger.exception("buy_sell_persist_failed", symbol=symbol, final=True)
             if self.buy_sell_events.ban_mode:
                 if symbol in self.buy_sell_events.lost_money_on:
-                    print(
-                        f"[Lost Money Count Reset] {symbol} lost: [{self.buy_sell_events.lost_money_on[symbol]}] times")
+                    logger.info("lost_money_count_reset", symbol=symbol, lost=self.buy_sell_events.lost_money_on[symbol])
                     del self.buy_sell_events.lost_money_on[symbol]
-            if symbol in self.buy_sell_events.buy_commands:
-                # Stop buying if trying
-                del self.buy_sell_events.buy_commands[symbol]
+            # Stop buying if trying
+            self.buy_sell_events.discard_position(symbol)
             del self.processed_minute_data[symbol]
             del self.processed_minute_intersections[symbol]
 
@@ -1518,8 +1593,25 @@ class Formula4(Formula):
 
 
 class WebSocketAggProvider:
-    def __init__(self, key: str, uri: str):
-        self.websocket_client = WebSocketClientClone(uri=f"{uri}{key}")
+    def __init__(self, key: str, uri, shared_bus_path: str = None, wire_encoding="json", deflate=False):
+        """
+        :param uri: feed server websocket uri, or a list with the uri of every shard of a sharded feed server
+        :param shared_bus_path: read the feed from the shared memory bus of a feed server on this host
+                                (see shared_market_bus) instead of the websocket. A bus carries a single shard,
+                                so it can not be combined with a list of shard uris
+        :param wire_encoding: json, struct or msgpack frames on the websocket (see market_codec)
+        :param deflate: compressed binary frames
+        """
+        if shared_bus_path is not None and not isinstance(uri, str):
+            raise ValueError("shared_bus_path only carries the feed of one shard, give a single uri with it")
+        if isinstance(uri, str):
+            self.websocket_client = WebSocketClientClone(uri=f"{uri}{key}", encoding=wire_encoding, deflate=deflate)
+        else:
+            self.websocket_client = ShardedWebSocketClient([f"{shard_uri}{key}" for shard_uri in uri],
+                                                           encoding=wire_encoding, deflate=deflate)
+        self.shared_bus_reader = None
+        if shared_bus_path is not None:
+            self.shared_bus_reader = SharedMarketBusReader(shared_bus_path)
         self.check = True
         self.minute__agg_channel = "AM"
         self.second_agg_channel = "A"
@@ -1527,13 +1619,14 @@ class WebSocketAggProvider:
         self.on_second_data_received = self.on_second_data_received_default_call
         self.new_subscribed = self.new_subscribed_default_call
         self.new_unsubscribed = self.new_unsubscribed_default_call
+        self.symbol_registry = get_symbol_registry()
 
     def on_second_data_received_default_call(self, second_data, symbol):
         # print(f"DEFAULT: SECOND DATA RECEIVED: {symbol} : {second_data}")
         pass
 
     def on_minute_data_received_default_call(self, minute_data, symbol):
-        print(f"DEFAULT: MINUTE DATA RECEIVED: {symbol} : {minute_data}")
+        logger.sampled(logging.DEBUG, "minute_data_received", every=100, symbol=symbol)
 
     def extract_symbol_and_channel(self, channeled_symbol: str):
         """
@@ -1544,16 +1637,32 @@ class WebSocketAggProvider:
         """
         channeled_symbol = channeled_symbol.strip()
         dot_index = channeled_symbol.index(".")
-        return channeled_symbol[dot_index + 1:], channeled_symbol[:dot_index]
+        return self.symbol_registry.intern(channeled_symbol[dot_index + 1:]), channeled_symbol[:dot_index]
 
     def on_data_received(self, msg):
         # print(msg)
         msg = json.loads(msg)
+        hot_path_tracer.mark("decoded")
+        self.on_records_received(msg)
+
+    def on_frame_records_received(self, records: List[dict]):
+        hot_path_tracer.mark("decoded")
+        self.on_records_received(records)
+
+    def on_bus_records_received(self, records: List[dict]):
+        hot_path_tracer.begin()
+        self.on_records_received(records)
+
+    def on_records_received(self, msg: List[dict]):
+        """Dispatch decoded polygon messages to the listeners"""
+        intern = self.symbol_registry.intern
         for data in msg:
             if data['ev'] == self.second_agg_channel:
-                self.on_second_data_received(data, data['sym'])
+                hot_path_tracer.mark("on_second_data_received")
+                self.on_second_data_received(data, intern(data['sym']))
             elif data['ev'] == self.minute__agg_channel:
-                self.on_minute_data_received(data, data['sym'])
+                hot_path_tracer.mark("on_minute_data_received")
+                self.on_minute_data_received(data, intern(data['sym']))
             elif data['ev'] == "status":
                 if str(data['message']).startswith("subscribed to"):
                     symbol, channel = self.extract_symbol_and_channel(data['message'].split(":")[1])
@@ -1563,7 +1672,7 @@ class WebSocketAggProvider:
                     self.new_unsubscribed(symbol, channel)
 
     def new_subscribed_default_call(self, symbol: str, channel: str):
-        print(f"DEFAULT: Subscription Success : {symbol} on {channel}")
+        logger.info("subscribed", symbol=symbol, channel=channel, listener="default")
 
     def attach_new_subscribed_listener(self, new_subscribed_callable: Callable[[str, str], None]):
         """
@@ -1581,7 +1690,7 @@ class WebSocketAggProvider:
         self.new_subscribed = self.new_subscribed_default_call
 
     def new_unsubscribed_default_call(self, symbol: str, channel: str):
-        print(f"DEFAULT: Unsubscription Success : {symbol} on {channel}")
+        logger.info("unsubscribed", symbol=symbol, channel=channel, listener="default")
 
     def attach_new_unsubscribed_listener(self, new_unsubscribed_callable: Callable[[str, str], None]):
         """
@@ -1628,9 +1737,15 @@ class WebSocketAggProvider:
         """
         self.on_second_data_received = self.on_second_data_received_default_call
 
-    def start_fetching(self):
-        self.websocket_client.attach_on_msg_listener(self.on_data_received)
-        self.websocket_client.run_async()
+    def start_fetching(self, latency_dump_sec=60):
+        if self.shared_bus_reader is not None:
+            self.shared_bus_reader.attach_on_records_listener(self.on_bus_records_received)
+            self.shared_bus_reader.start_reading()
+        else:
+            self.websocket_client.attach_on_msg_listener(self.on_data_received)
+            self.websocket_client.attach_on_records_listener(self.on_frame_records_received)
+            self.websocket_client.run_async()
+        hot_path_tracer.start_periodic_dump(interval_sec=latency_dump_sec)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,284 @@
+import copy
+import dataclasses
+import logging
+import os
+import pickle
+import queue
+import struct
+import time
+from threading import Thread
+from typing import Dict, List, Optional
+
+from structured_logger import elapsed_ms, get_logger
+
+logger = get_logger("strategy_snapshot")
+
+SNAPSHOT_VERSION = 1
+JOURNAL_LENGTH = struct.Struct("<I")
+STOP = object()
+
+
+@dataclasses.dataclass
+class OrderRef:
+    """Order of a snapshotted position. Positions only need the id to keep following the order on the broker"""
+    id: str
+
+
+@dataclasses.dataclass
+class StrategyState:
+    version: int
+    formula_name: str
+    taken_at: float
+    current_minute_timestamp: int
+    processed_minute_data: Dict[str, List[dict]]
+    processed_minute_intersections: Dict[str, object]
+    positions: Dict[str, object]
+    capital_slots: Dict[str, float]
+    lost_money_on: Optional[Dict[str, int]]
+    banned_symbols: Optional[Dict[str, int]]
+
+
+def order_ref(order):
+    return None if order is None else OrderRef(id=order.id)
+
+
+def copy_position(position):
+    """Copy of a PositionState safe to pickle on another thread"""
+    position = copy.copy(position)
+    position.buy_command = copy.copy(position.buy_command)
+    position.buy_order_data = order_ref(position.buy_order_data)
+    position.sell_order_data = order_ref(position.sell_order_data)
+    return position
+
+
+class StrategySnapshotter:
+    """
+    Periodic snapshots of a formula's state plus a journal of the minute bars and symbol changes since the last
+    snapshot. The state is copied on the data thread (bars are shared, only the last bar of a symbol is mutated
+    afterwards so it is copied); pickling and writing happen on a writer thread. A snapshot replaces the previous
+    one atomically and starts a new journal.
+    warm_start() restores the snapshot and replays the journal tail so a restarted formula keeps its averages,
+    intersections and positions. Pending orders of restored positions are followed by their id
+    """
+
+    def __init__(self, formula, interval_sec=5, max_age_sec=6 * 3600):
+        """
+        :param formula: Formula1, Formula3 or Formula4
+        :param interval_sec: minimum time between snapshots. Bars between snapshots are journaled
+        :param max_age_sec: older snapshots (e.g. of the previous session) are ignored by warm_start
+        """
+        self.formula = formula
+        self.interval_sec = interval_sec
+        self.max_age_sec = max_age_sec
+        state_path = f"{formula.buy_sell_formula_path}/state"
+        os.makedirs(state_path, exist_ok=True)
+        self.snapshot_path = f"{state_path}/snapshot.pickle"
+        self.journal_path = f"{state_path}/journal.bin"
+        self.write_queue = queue.Queue()
+        self.journal_file = None
+        self.last_snapshot = 0.0
+        self.snapshots_written = 0
+        self.writer = None
+
+    def capture(self) -> StrategyState:
+        formula = self.formula
+        events = formula.buy_sell_events
+        processed = {}
+        for symbol, bars in formula.processed_minute_data.items():
+            bars = list(bars)
+            if bars:
+                bars[-1] = dict(bars[-1])
+            processed[symbol] = bars
+        return StrategyState(
+            version=SNAPSHOT_VERSION, formula_name=formula.formula_name, taken_at=time.time(),
+            current_minute_timestamp=formula.current_minute_timestamp, processed_minute_data=processed,
+            processed_minute_intersections={symbol: copy.copy(points) for symbol, points in
+                                            formula.processed_minute_intersections.items()},
+            positions={symbol: copy_position(position) for symbol, position in events.positions.items()},
+            capital_slots=dict(events.capital_allocator.slots),
+            lost_money_on=dict(events.lost_money_on) if events.ban_mode else None,
+            banned_symbols=dict(formula.banned_symbols) if events.ban_mode else None)
+
+    def snapshot(self):
+        self.last_snapshot = time.monotonic()
+        self.write_queue.put(("snapshot", self.capture()))
+
+    def maybe_snapshot(self):
+        if time.monotonic() - self.last_snapshot >= self.interval_sec:
+            self.snapshot()
+
+    def journal(self, entry: tuple):
+        self.write_queue.put(("journal", entry))
+
+    def attach(self):
+        """Route the formula's market data listeners through the snapshotter"""
+        market_data = self.formula.market_data
+        market_data.attach_on_minute_data_received_listener(self.on_minute_data_received)
+        market_data.attach_on_second_data_received_listener(self.on_second_data_received)
+        market_data.attach_new_subscribed_listener(self.new_subscribed)
+        market_data.attach_new_unsubscribed_listener(self.new_unsubscribed)
+
+    def on_minute_data_received(self, minute_data: dict, symbol):
+        formula = self.formula
+        formula.on_minute_data_received(minute_data, symbol)
+        bars = formula.processed_minute_data.get(symbol)
+        if bars and bars[-1] is minute_data:
+            self.journal(("bar", symbol, dict(minute_data), copy.copy(formula.processed_minute_intersections[symbol])))
+        self.maybe_snapshot()
+
+    def on_second_data_received(self, second_data, symbol):
+        processed = self.formula.processed_minute_data
+        had_symbol = symbol in processed
+        self.formula.on_second_data_received(second_data, symbol)
+        if had_symbol and symbol not in processed:
+            # Banned after a loss
+            self.journal(("removed", symbol))
+        self.maybe_snapshot()
+
+    def new_subscribed(self, symbol: str, channel: str):
+        formula = self.formula
+        had_symbol = symbol in formula.processed_minute_data
+        formula.new_subscribed(symbol, channel)
+        if not had_symbol and symbol in formula.processed_minute_data:
+            self.journal(("added", symbol, copy.copy(formula.processed_minute_intersections[symbol])))
+
+    def new_unsubscribed(self, symbol: str, channel: str):
+        had_symbol = symbol in self.formula.processed_minute_data
+        self.formula.new_unsubscribed(symbol, channel)
+        if had_symbol and symbol not in self.formula.processed_minute_data:
+            self.journal(("removed", symbol))
+
+    def write_snapshot(self, state: StrategyState):
+        st = time.perf_counter_ns()
+        data = pickle.dumps(state, protocol=pickle.HIGHEST_PROTOCOL)
+        temp_path = self.snapshot_path + ".tmp"
+        with open(temp_path, "wb") as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_path, self.snapshot_path)
+        # Everything journaled so far is in the snapshot
+        self.journal_file.close()
+        self.journal_file = open(self.journal_path, "wb")
+        self.snapshots_written += 1
+        logger.sampled(logging.DEBUG, "snapshot_written", every=100, size=len(data),
+                       symbols=len(state.processed_minute_data), elapsed_ms=elapsed_ms(st))
+
+    def write_journal(self, entry: tuple):
+        data = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        self.journal_file.write(JOURNAL_LENGTH.pack(len(data)) + data)
+        self.journal_file.flush()
+
+    def keep_writing(self):
+        while True:
+            item = self.write_queue.get()
+            if item is STOP:
+                break
+            kind, payload = item
+            try:
+                if kind == "snapshot":
+                    self.write_snapshot(payload)
+                else:
+                    self.write_journal(payload)
+            except:
+                logger.exception("state_write_failed", kind=kind)
+        self.journal_file.close()
+
+    def start(self):
+        """Start the writer thread and take a first snapshot of the current (e.g. warm started) state"""
+        self.journal_file = open(self.journal_path, "ab")
+        self.writer = Thread(target=self.keep_writing, name="strategy_snapshot_writer", daemon=True)
+        self.writer.start()
+        self.snapshot()
+
+    def stop(self):
+        """Write the queued snapshots and journal entries"""
+        self.write_queue.put(STOP)
+        if self.writer is not None:
+            self.writer.join()
+
+    def load_snapshot(self) -> Optional[StrategyState]:
+        try:
+            with open(self.snapshot_path, "rb") as file:
+                state = pickle.load(file)
+        except FileNotFoundError:
+            return None
+        except:
+            logger.exception("snapshot_load_failed", path=self.snapshot_path)
+            return None
+        if state.version != SNAPSHOT_VERSION or state.formula_name != self.formula.formula_name:
+            logger.warning("snapshot_ignored", reason="other version or formula", path=self.snapshot_path)
+            return None
+        if time.time() - state.taken_at > self.max_age_sec:
+            logger.warning("snapshot_ignored", reason="too old", taken_at=state.taken_at)
+            return None
+        return state
+
+    def load_journal(self) -> List[tuple]:
+        """Journal entries. A record cut by a crash ends the journal"""
+        entries = []
+        try:
+            with open(self.journal_path, "rb") as file:
+                data = file.read()
+        except FileNotFoundError:
+            return entries
+        offset = 0
+        while offset + JOURNAL_LENGTH.size <= len(data):
+            (length,) = JOURNAL_LENGTH.unpack_from(data, offset)
+            offset += JOURNAL_LENGTH.size
+            if offset + length > len(data):
+                break
+            try:
+                entries.append(pickle.loads(data[offset:offset + length]))
+            except:
+                break
+            offset += length
+        return entries
+
+    def warm_start(self):
+        """
+        Restore the last snapshot and replay the journal into the formula. Must run before the formula starts
+        :return: True if a state was restored
+        """
+        st = time.perf_counter_ns()
+        state = self.load_snapshot()
+        if state is None:
+            # A journal without its snapshot can not be applied
+            return False
+        formula = self.formula
+        events = formula.buy_sell_events
+        # Containers are shared between the formula and its BuySellEvents, so they are updated in place
+        formula.processed_minute_data.clear()
+        formula.processed_minute_data.update(state.processed_minute_data)
+        formula.processed_minute_intersections.clear()
+        formula.processed_minute_intersections.update(state.processed_minute_intersections)
+        events.positions.clear()
+        events.positions.update(state.positions)
+        events.capital_allocator.slots.clear()
+        events.capital_allocator.slots.update(state.capital_slots)
+        if events.ban_mode and state.banned_symbols is not None:
+            events.lost_money_on.clear()
+            events.lost_money_on.update(state.lost_money_on)
+            formula.banned_symbols.update(state.banned_symbols)
+        formula.current_minute_timestamp = max(formula.current_minute_timestamp, state.current_minute_timestamp)
+        entries = self.load_journal()
+        for entry in entries:
+            if entry[0] == "bar":
+                _, symbol, minute_data, points = entry
+                if symbol in formula.processed_minute_data:
+                    formula.processed_minute_data[symbol].append(minute_data)
+                    formula.processed_minute_intersections[symbol] = points
+                formula.current_minute_timestamp = max(formula.current_minute_timestamp, minute_data['s'])
+            elif entry[0] == "added":
+                _, symbol, points = entry
+                formula.processed_minute_data.setdefault(symbol, [])
+                formula.processed_minute_intersections.setdefault(symbol, points)
+            elif entry[0] == "removed":
+                formula.processed_minute_data.pop(entry[1], None)
+                formula.processed_minute_intersections.pop(entry[1], None)
+                events.discard_position(entry[1])
+        logger.info("warm_started", symbols=len(formula.processed_minute_data),
+                    bars=sum(len(bars) for bars in formula.processed_minute_data.values()),
+                    positions=len(events.positions), journal_entries=len(entries),
+                    snapshot_age_sec=round(time.time() - state.taken_at, 1), elapsed_ms=elapsed_ms(st))
+        return True
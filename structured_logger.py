@@ -0,0 +1,168 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import time
+from threading import Lock
+from typing import Dict, Optional
+
+LOG_ROOT = "trading"
+LOG_QUEUE_SIZE = 100000
+
+
+class JsonLinesFormatter(logging.Formatter):
+    """One json object per record: ts, level, logger, event and the structured fields"""
+
+    def format(self, record: logging.LogRecord):
+        data = {"ts": round(record.created, 6), "level": record.levelname, "logger": record.name,
+                "event": record.msg}
+        fields = getattr(record, "fields", None)
+        if fields:
+            data.update(fields)
+        if record.exc_info:
+            data["exc"] = self.formatException(record.exc_info)
+        return json.dumps(data, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands the record over to the listener thread untouched. Formatting and the stdout write happen on the
+    listener thread. When the queue is full the record is dropped and counted instead of blocking the caller
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord):
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class StructuredLogger:
+    """
+    logger.info("order_placed", symbol="AAPL", qty=10) writes
+    {"ts": ..., "level": "INFO", "logger": "trading.trader", "event": "order_placed", "symbol": "AAPL", "qty": 10}
+    Field values must not be mutated after the call since they are serialized later on the listener thread
+    """
+
+    def __init__(self, name: str):
+        self.logger = logging.getLogger(f"{LOG_ROOT}.{name}")
+        self.sample_counts: Dict[str, int] = {}
+        self.sample_lock = Lock()
+
+    def is_enabled_for(self, level: int):
+        return self.logger.isEnabledFor(level)
+
+    def _emit(self, level: int, event: str, fields: dict, exc_info=None):
+        # makeRecord directly skips the caller lookup (a stack walk) done by Logger._log
+        if exc_info is True:
+            exc_info = sys.exc_info()
+        record = self.logger.makeRecord(self.logger.name, level, "", 0, event, (), exc_info,
+                                        extra={"fields": fields})
+        self.logger.handle(record)
+
+    def log(self, level: int, event: str, exc_info=None, **fields):
+        if self.logger.isEnabledFor(level):
+            self._emit(level, event, fields, exc_info)
+
+    def debug(self, event: str, **fields):
+        self.log(logging.DEBUG, event, **fields)
+
+    def info(self, event: str, **fields):
+        self.log(logging.INFO, event, **fields)
+
+    def warning(self, event: str, **fields):
+        self.log(logging.WARNING, event, **fields)
+
+    def error(self, event: str, **fields):
+        self.log(logging.ERROR, event, **fields)
+
+    def exception(self, event: str, **fields):
+        """Error with the traceback of the exception being handled"""
+        self.log(logging.ERROR, event, exc_info=True, **fields)
+
+    def sampled(self, level: int, event: str, every: int, **fields):
+        """
+        Per tick messages. Only every n-th call of the event is logged, with sampled=n so readers can scale
+        the counts back
+        :param every: log 1 of every n calls
+        """
+        if not self.logger.isEnabledFor(level):
+            return
+        # Events are sampled from several threads (stream, timers, backfill, order scheduler)
+        with self.sample_lock:
+            count = self.sample_counts.get(event, 0) + 1
+            self.sample_counts[event] = count
+        if count % every == 1 or every == 1:
+            fields["sampled"] = every
+            self._emit(level, event, fields)
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue_handler: Optional[DroppingQueueHandler] = None
+_configure_lock = Lock()
+
+
+def configure_logging(level=logging.INFO, stream=None, file_path: str = None, queue_size=LOG_QUEUE_SIZE):
+    """
+    Route every structured logger through a bounded queue to a single listener thread writing json lines.
+    Calling it again replaces the previous configuration
+    :param level: minimum level of the trading loggers
+    :param stream: defaults to stdout
+    :param file_path: json lines are written to the file instead of the stream
+    :param queue_size: records beyond it are dropped (see dropped_log_records)
+    """
+    global _listener, _queue_handler
+    with _configure_lock:
+        root = logging.getLogger(LOG_ROOT)
+        if _listener is not None:
+            _listener.stop()
+            root.removeHandler(_queue_handler)
+        if file_path is not None:
+            handler = logging.FileHandler(file_path)
+        else:
+            handler = logging.StreamHandler(sys.stdout if stream is None else stream)
+        handler.setFormatter(JsonLinesFormatter())
+        log_queue = queue.Queue(maxsize=queue_size)
+        _queue_handler = DroppingQueueHandler(log_queue)
+        _listener = logging.handlers.QueueListener(log_queue, handler, respect_handler_level=False)
+        root.addHandler(_queue_handler)
+        root.setLevel(level)
+        root.propagate = False
+        _listener.start()
+
+
+def shutdown_logging():
+    """Flush the queued records and stop the listener thread"""
+    global _listener
+    with _configure_lock:
+        if _listener is not None:
+            _listener.stop()
+            _listener = None
+
+
+def dropped_log_records():
+    return _queue_handler.dropped if _queue_handler is not None else 0
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """Structured logger of a module. Logging is configured with the defaults on first use"""
+    if _queue_handler is None:
+        configure_logging()
+    return StructuredLogger(name)
+
+
+def elapsed_ms(start_ns: int):
+    """Milliseconds since a perf_counter_ns() start, rounded for logs"""
+    return round((time.perf_counter_ns() - start_ns) / 1000000, 2)
+
+
+atexit.register(shutdown_logging)
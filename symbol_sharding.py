@@ -0,0 +1,53 @@
+import zlib
+from typing import Callable
+
+
+def shard_of(symbol: str, shard_count: int):
+    """Shard owning the symbol. crc32 is stable across processes and machines, unlike hash()"""
+    return zlib.crc32(symbol.encode()) % shard_count
+
+
+def shard_uris(host="localhost", base_port=8000, shard_count=1, path="/api/ws/"):
+    """Websocket uris of shard_count feed servers listening on consecutive ports"""
+    return [f"ws://{host}:{base_port + i}{path}" for i in range(shard_count)]
+
+
+class SymbolShard:
+    """
+    Hash partition of the symbols owned by one feed server instance. Every instance runs the same detector and
+    subscribes only to its own symbols, so ingestion and client fan-out are split between the instances
+    """
+
+    def __init__(self, shard_index=0, shard_count=1):
+        if not 0 <= shard_index < shard_count:
+            raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+        self.shard_index = shard_index
+        self.shard_count = shard_count
+
+    def owns(self, symbol: str):
+        return self.shard_count == 1 or shard_of(symbol, self.shard_count) == self.shard_index
+
+    def filter_symbol_listener(self, listener: Callable[[str, object], None]):
+        """
+        Listener only called for the symbols of this shard. Wraps the detector's on_detected/on_expired listeners
+        :param listener: params(symbol, data)
+        """
+
+        def on_symbol(symbol: str, data=None):
+            if self.owns(symbol):
+                listener(symbol, data)
+
+        return on_symbol
+
+    def filter_growth_provider(self, growth_callable: Callable[[], dict]):
+        """
+        Growth provider only returning the symbols of this shard. Wraps the detector's
+        get_detected_id_data_and_deleted, so a client merging the /growth of every shard sees each symbol once
+        :param growth_callable: returns {"valid": [{"id", "data"}], "expired": [{"id", "data"}]}
+        """
+
+        def get_growth():
+            growth = growth_callable()
+            return {name: [item for item in items if self.owns(item['id'])] for name, items in growth.items()}
+
+        return get_growth
@@ -0,0 +1,125 @@
+import csv
+import os
+import pickle
+import sys
+from array import array
+from pathlib import Path
+from threading import Lock
+from typing import Dict, Iterable, List, Optional
+
+SYMBOLS_CSV_PATH = str(Path(__file__).resolve().parent / "non_otc_symbols_2021_08_01.csv")
+SYMBOLS_CACHE_SUFFIX = ".cache.pickle"
+
+
+class SymbolRegistry:
+    """
+    Interned symbol table assigning dense integer ids to symbols.
+    Ids below universe_size belong to the loaded symbol universe, symbols interned later get the following ids.
+    Per symbol state can be kept in arrays indexed by symbol id.
+    """
+
+    def __init__(self, symbols: Iterable[str] = ()):
+        self.symbols: List[str] = []
+        self.ids: Dict[str, int] = {}
+        self.lock = Lock()
+        for symbol in symbols:
+            self.get_or_add_id(symbol)
+        self.universe_size = len(self.symbols)
+
+    def __len__(self):
+        return len(self.symbols)
+
+    def __contains__(self, symbol: str):
+        return symbol in self.ids
+
+    def get_id(self, symbol: str) -> Optional[int]:
+        """Id of the symbol or None if never interned"""
+        return self.ids.get(symbol)
+
+    def get_or_add_id(self, symbol: str) -> int:
+        symbol_id = self.ids.get(symbol)
+        if symbol_id is not None:
+            return symbol_id
+        with self.lock:
+            symbol_id = self.ids.get(symbol)
+            if symbol_id is None:
+                symbol = sys.intern(symbol)
+                symbol_id = len(self.symbols)
+                self.symbols.append(symbol)
+                self.ids[symbol] = symbol_id
+            return symbol_id
+
+    def get_symbol(self, symbol_id: int) -> str:
+        return self.symbols[symbol_id]
+
+    def intern(self, symbol: str) -> str:
+        """
+        Canonical string object of the symbol. Every dict keyed by interned symbols then hits the
+        identity fast path with the hash already cached
+        """
+        return self.symbols[self.get_or_add_id(symbol)]
+
+    def is_listed(self, symbol: str) -> bool:
+        """True if the symbol belongs to the loaded symbol universe"""
+        symbol_id = self.ids.get(symbol)
+        return symbol_id is not None and symbol_id < self.universe_size
+
+    def new_array(self, typecode="d", size=None) -> array:
+        """Zero filled array with one slot per symbol id of the universe"""
+        if size is None:
+            size = self.universe_size
+        return array(typecode, bytes(array(typecode).itemsize * size))
+
+    def new_flags(self, size=None) -> bytearray:
+        """Zero filled flags with one byte per symbol id of the universe"""
+        return bytearray(self.universe_size if size is None else size)
+
+
+def read_symbols_csv(path=SYMBOLS_CSV_PATH) -> List[str]:
+    """Unique symbols of the csv in a stable order, so every process assigns the same ids"""
+    with open(path, newline="") as file:
+        reader = csv.reader(file)
+        symbol_column = next(reader).index("symbol")
+        return sorted({row[symbol_column] for row in reader if len(row) > symbol_column})
+
+
+def load_symbol_universe(path=SYMBOLS_CSV_PATH, use_cache=True) -> List[str]:
+    """
+    Symbols of the csv. A pickled copy is cached beside the csv and reused while the csv mtime and size
+    are unchanged
+    """
+    if not use_cache:
+        return read_symbols_csv(path)
+    stat = os.stat(path)
+    cache_key = (stat.st_mtime_ns, stat.st_size)
+    cache_path = f"{path}{SYMBOLS_CACHE_SUFFIX}"
+    try:
+        with open(cache_path, "rb") as file:
+            cached_key, symbols = pickle.load(file)
+        if cached_key == cache_key:
+            return symbols
+    except Exception:
+        pass
+    symbols = read_symbols_csv(path)
+    try:
+        temp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            pickle.dump((cache_key, symbols), file, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(temp_path, cache_path)
+    except OSError:
+        print("Symbol cache could not be written")
+    return symbols
+
+
+_registry: Optional[SymbolRegistry] = None
+_registry_lock = Lock()
+
+
+def get_symbol_registry() -> SymbolRegistry:
+    """Process wide registry built once from the symbol csv"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                _registry = SymbolRegistry(load_symbol_universe())
+    return _registry
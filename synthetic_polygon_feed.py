@@ -0,0 +1,214 @@
+"""
+Local stand-in for the polygon stocks websocket, for offline load tests.
+Speaks the same protocol: connected / auth_success / subscribed to / unsubscribed to status messages and
+json arrays of A (second) and AM (minute) aggregates for the subscribed symbols.
+Every aggregate carries sent_ns (wall clock when the frame was built) to measure end to end latency.
+Run: python synthetic_polygon_feed.py --rate 5000 --profile burst --feed-port 8765
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from threading import Thread
+
+import websockets
+
+from structured_logger import get_logger
+
+logger = get_logger("synthetic_polygon_feed")
+
+PROFILES = ("steady", "burst", "open")
+
+
+class RateProfile:
+    """
+    Message rate multiplier over time.
+    steady: constant. burst: burst_factor times the rate for burst_sec every burst_every_sec.
+    open: starts at burst_factor times the rate and decays linearly to the base rate over ramp_sec, like the open
+    """
+
+    def __init__(self, profile="steady", burst_factor=10.0, burst_every_sec=10.0, burst_sec=1.0, ramp_sec=60.0):
+        if profile not in PROFILES:
+            raise ValueError(f"Profile must be one of {PROFILES}")
+        self.profile = profile
+        self.burst_factor = burst_factor
+        self.burst_every_sec = burst_every_sec
+        self.burst_sec = burst_sec
+        self.ramp_sec = ramp_sec
+
+    def multiplier(self, elapsed_sec: float):
+        if self.profile == "burst":
+            return self.burst_factor if elapsed_sec % self.burst_every_sec < self.burst_sec else 1.0
+        if self.profile == "open":
+            return max(self.burst_factor - (self.burst_factor - 1) * elapsed_sec / self.ramp_sec, 1.0)
+        return 1.0
+
+
+class SymbolWalk:
+    """Random walk price and volume of one symbol, aggregated into the running minute bar"""
+    __slots__ = ("price", "day_volume", "minute")
+
+    def __init__(self, price: float):
+        self.price = price
+        self.day_volume = 0
+        self.minute = None  # [o, h, l, c, v, s]
+
+    def next_second(self, symbol: str, start_ms: int, sent_ns: int):
+        o = self.price
+        c = max(round(o * (1 + random.gauss(0, 0.002)), 2), 0.01)
+        h = round(max(o, c) * (1 + random.random() * 0.001), 2)
+        l = round(min(o, c) * (1 - random.random() * 0.001), 2)
+        v = random.randint(1, 5000)
+        self.price = c
+        self.day_volume += v
+        if self.minute is None:
+            self.minute = [o, h, l, c, v, start_ms - start_ms % 60000]
+        else:
+            minute = self.minute
+            minute[1] = max(minute[1], h)
+            minute[2] = min(minute[2], l)
+            minute[3] = c
+            minute[4] += v
+        return {"ev": "A", "sym": symbol, "v": v, "av": self.day_volume, "op": o, "vw": round((o + c) / 2, 4),
+                "o": o, "c": c, "h": h, "l": l, "a": c, "z": 100, "s": start_ms, "e": start_ms + 1000,
+                "sent_ns": sent_ns}
+
+    def close_minute(self, symbol: str, sent_ns: int):
+        if self.minute is None:
+            return None
+        o, h, l, c, v, start = self.minute
+        self.minute = None
+        return {"ev": "AM", "sym": symbol, "v": v, "av": self.day_volume, "op": o, "vw": round((o + c) / 2, 4),
+                "o": o, "c": c, "h": h, "l": l, "a": c, "z": 100, "s": start, "e": start + 60000,
+                "sent_ns": sent_ns}
+
+
+class SyntheticPolygonFeed:
+    def __init__(self, rate=1000.0, profile: RateProfile = None, tick_ms=10, minute_sec=60.0, host="127.0.0.1",
+                 port=8765):
+        """
+        :param rate: A messages per second over all subscribed symbols of a connection (before the profile)
+        :param tick_ms: frame interval. Each frame carries the messages due since the previous one
+        :param minute_sec: seconds between AM bars. Lower than 60 to compress time
+        """
+        self.rate = rate
+        self.profile = profile if profile is not None else RateProfile()
+        self.tick_sec = tick_ms / 1000
+        self.minute_sec = minute_sec
+        self.host = host
+        self.port = port
+        self.messages_sent = 0
+        self.frames_sent = 0
+        self.connections = 0
+
+    @staticmethod
+    def status(status: str, message: str):
+        return json.dumps([{"ev": "status", "status": status, "message": message}])
+
+    async def handle_connection(self, websocket, path=None):
+        self.connections += 1
+        subscribed = {"A": {}, "AM": {}}
+        walks = {}
+        await websocket.send(self.status("connected", "Connected Successfully"))
+        sender = asyncio.ensure_future(self.keep_sending(websocket, subscribed, walks))
+        try:
+            async for message in websocket:
+                request = json.loads(message)
+                action = request.get("action")
+                if action == "auth":
+                    await websocket.send(self.status("auth_success", "authenticated"))
+                elif action == "subscribe" or action == "unsubscribe":
+                    statuses = []
+                    for param in str(request.get("params", "")).split(","):
+                        channel, _, symbol = param.strip().partition(".")
+                        if channel not in subscribed or not symbol:
+                            continue
+                        if action == "subscribe":
+                            subscribed[channel][symbol] = True
+                            if symbol not in walks:
+                                walks[symbol] = SymbolWalk(round(random.uniform(1, 50), 2))
+                            statuses.append({"ev": "status", "status": "success",
+                                             "message": f"subscribed to: {channel}.{symbol}"})
+                        else:
+                            subscribed[channel].pop(symbol, None)
+                            statuses.append({"ev": "status", "status": "success",
+                                             "message": f"unsubscribed to: {channel}.{symbol}"})
+                    if statuses:
+                        await websocket.send(json.dumps(statuses))
+        except websockets.ConnectionClosed:
+            pass
+        finally:
+            sender.cancel()
+            self.connections -= 1
+
+    async def keep_sending(self, websocket, subscribed: dict, walks: dict):
+        started = time.monotonic()
+        next_minute = started + self.minute_sec
+        due = 0.0
+        cursor = 0
+        while True:
+            await asyncio.sleep(self.tick_sec)
+            now = time.monotonic()
+            sent_ns = time.time_ns()
+            start_ms = sent_ns // 1000000000 * 1000
+            frame = []
+            symbols = list(subscribed["A"])
+            if symbols:
+                due += self.rate * self.profile.multiplier(now - started) * self.tick_sec
+                count = int(due)
+                due -= count
+                for _ in range(count):
+                    symbol = symbols[cursor % len(symbols)]
+                    cursor += 1
+                    frame.append(walks[symbol].next_second(symbol, start_ms, sent_ns))
+            if now >= next_minute:
+                next_minute += self.minute_sec
+                for symbol in list(subscribed["AM"]):
+                    bar = walks[symbol].close_minute(symbol, sent_ns)
+                    if bar is not None:
+                        frame.append(bar)
+            if frame:
+                await websocket.send(json.dumps(frame))
+                self.messages_sent += len(frame)
+                self.frames_sent += 1
+
+    async def serve(self):
+        async with websockets.serve(self.handle_connection, self.host, self.port, max_size=None):
+            logger.info("synthetic_feed_listening", host=self.host, port=self.port, rate=self.rate,
+                        profile=self.profile.profile)
+            await asyncio.Future()
+
+    def run(self):
+        asyncio.run(self.serve())
+
+    def run_async(self):
+        t1 = Thread(target=self.run, name="synthetic_polygon_feed", daemon=True)
+        t1.start()
+
+    def get_url(self):
+        return f"ws://{self.host}:{self.port}/stocks"
+
+
+def build_arg_parser(parser: argparse.ArgumentParser = None):
+    parser = parser if parser is not None else argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rate", type=float, default=1000, help="A messages per second per connection")
+    parser.add_argument("--profile", default="steady", choices=PROFILES)
+    parser.add_argument("--burst-factor", type=float, default=10)
+    parser.add_argument("--burst-every-sec", type=float, default=10)
+    parser.add_argument("--burst-sec", type=float, default=1)
+    parser.add_argument("--tick-ms", type=int, default=10)
+    parser.add_argument("--minute-sec", type=float, default=60)
+    parser.add_argument("--feed-port", type=int, default=8765)
+    return parser
+
+
+def feed_from_args(args) -> SyntheticPolygonFeed:
+    profile = RateProfile(args.profile, burst_factor=args.burst_factor, burst_every_sec=args.burst_every_sec,
+                          burst_sec=args.burst_sec)
+    return SyntheticPolygonFeed(rate=args.rate, profile=profile, tick_ms=args.tick_ms, minute_sec=args.minute_sec,
+                                port=args.feed_port)
+
+
+if __name__ == "__main__":
+    feed_from_args(build_arg_parser().parse_args()).run()
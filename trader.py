@@ -1,13 +1,21 @@
 import dataclasses
 import datetime
 from abc import abstractmethod, ABC
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from typing import Callable, Dict, List
 
 import alpaca_trade_api.rest
 from alpaca_trade_api.rest import APIError
 
 from creds import AlpakaCreds
+from latency_tracer import hot_path_tracer
+from order_scheduler import LANE_BUY, LANE_CANCEL, LANE_QUERY, LANE_SELL, OrderScheduler
+from structured_logger import get_logger
 import alpaca_trade_api as tradeapi
 
+logger = get_logger("trader")
 
 
 @dataclasses.dataclass
@@ -17,6 +25,24 @@ class OrderData:
     stop_price: float = None
 
 
+@dataclasses.dataclass
+class OrderRequest:
+    """One order of a batch. side: buy/sell, order_type: market/limit/stop_limit"""
+    symbol: str
+    side: str
+    order_type: str
+    order_data: OrderData
+
+
+@dataclasses.dataclass
+class BatchItemResult:
+    """Outcome of one item of a batch call. key is the symbol or the order id of the item"""
+    key: str
+    ok: bool
+    result: object = None
+    error: str = None
+
+
 class OrderType:
     market_order = "market",
     stop_loss = "stop_loss",
@@ -88,18 +114,95 @@ class Trader(ABC):
 
 class AlpakaTrader(Trader):
 
-    def __init__(self):
+    def __init__(self, max_parallel_requests=8):
+        """
+        :param max_parallel_requests: upper bound of concurrent REST calls made by the batch methods
+        """
         from data_processor import TimeRangeCreator
         self.authorized_alpaka_api: alpaca_trade_api.rest.REST = None
         self.alpaka_account_info = None
         self.alpaka_cal_trading_hours = TimeRangeCreator(start_time="06:03:00", end_time="14:55:00",
-                                                         interval_sec=60).get_dict()
+                                                         interval_sec=60).get_range()
+        self.max_parallel_requests = max_parallel_requests
+        self.batch_executor = None
+        self.batch_executor_lock = Lock()
 
     def set_credentials(self, alpaka_creds: AlpakaCreds):
         self.authorized_alpaka_api = self._authorize_alpaka_api(alpaka_creds)
+        self._mount_pooled_session()
         self.alpaka_account_info = self._get_alpaka_account()
         return self
 
+    def _mount_pooled_session(self):
+        """Let the REST session keep one connection alive per concurrent batch call"""
+        session = getattr(self.authorized_alpaka_api, "_session", None)
+        if session is None:
+            return
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=max(self.max_parallel_requests, 10))
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+
+    def _get_batch_executor(self):
+        """Pool created on the first batch. Batches can start on several threads at once"""
+        with self.batch_executor_lock:
+            if self.batch_executor is None:
+                self.batch_executor = ThreadPoolExecutor(max_workers=self.max_parallel_requests,
+                                                         thread_name_prefix="alpaka_batch")
+            return self.batch_executor
+
+    def _run_batch(self, call: Callable, items: list, key_of: Callable) -> List[BatchItemResult]:
+        """
+        Run call(item) for every item with bounded parallelism. A failing item never fails the batch
+        :return: one BatchItemResult per item in the order of items
+        """
+        def run(item):
+            try:
+                return BatchItemResult(key=key_of(item), ok=True, result=call(item))
+            except Exception as e:
+                return BatchItemResult(key=key_of(item), ok=False, error=str(e))
+
+        if len(items) <= 1:
+            return [run(item) for item in items]
+        return list(self._get_batch_executor().map(run, items))
+
+    def submit_orders(self, order_requests: List[OrderRequest]) -> List[BatchItemResult]:
+        """Submit many orders concurrently. result holds the alpaka order of each submitted item"""
+        order_methods = {
+            ("buy", "market"): self.buy_market_order,
+            ("buy", "limit"): self.buy_limit_order,
+            ("buy", "stop_limit"): self.buy_stop_limit_order,
+            ("sell", "market"): self.sell_market_order,
+            ("sell", "limit"): self.sell_limit_order,
+            ("sell", "stop_limit"): self.sell_stop_limit_order,
+        }
+
+        def submit(order_request: OrderRequest):
+            method = order_methods.get((order_request.side, order_request.order_type))
+            if method is None:
+                raise ValueError(f"Unknown order: {order_request.side} {order_request.order_type}")
+            return method(symbol=order_request.symbol, order_data=order_request.order_data)
+
+        results = self._run_batch(submit, order_requests, key_of=lambda order_request: order_request.symbol)
+        logger.info("batch_submitted", orders=len(results), failed=sum(not r.ok for r in results))
+        return results
+
+    def cancel_orders(self, order_ids: List[str]) -> List[BatchItemResult]:
+        """Cancel many orders concurrently. ok is False when the order was not found or already filled"""
+        results = self._run_batch(self._cancel_order, order_ids, key_of=lambda order_id: order_id)
+        logger.info("batch_canceled", orders=len(results), failed=sum(not r.ok for r in results))
+        return results
+
+    def get_orders_data(self, order_ids: List[str]) -> List[BatchItemResult]:
+        """Fetch many orders concurrently. result holds the alpaka order of each fetched item"""
+        return self._run_batch(self._get_order, order_ids, key_of=lambda order_id: order_id)
+
+    def shutdown_batch_executor(self):
+        with self.batch_executor_lock:
+            batch_executor, self.batch_executor = self.batch_executor, None
+        if batch_executor is not None:
+            batch_executor.shutdown(wait=True)
+
     def _authorize_alpaka_api(self, alpaka_creds: AlpakaCreds):
         """
         creates an authorized alpaka.market api with (API_KEY, SECRET_KEY, BASE_URL)
@@ -121,6 +224,25 @@ class AlpakaTrader(Trader):
         """
         return self.authorized_alpaka_api.get_account()
 
+    def _submit_order(self, **order_params):
+        """Submit order to alpaka and trace the round trip on the hot path of the calling thread"""
+        hot_path_tracer.mark("submit_order_sent")
+        resp = self._send_order(**order_params)
+        hot_path_tracer.mark("submit_order_returned")
+        return resp
+
+    def _send_order(self, **order_params):
+        resp = self.authorized_alpaka_api.submit_order(**order_params)
+        logger.info("order_submitted", order_id=getattr(resp, "id", None), status=getattr(resp, "status", None),
+                    **order_params)
+        return resp
+
+    def _cancel_order(self, order_id: str):
+        return self.authorized_alpaka_api.cancel_order(order_id=order_id)
+
+    def _get_order(self, order_id: str):
+        return self.authorized_alpaka_api.get_order(order_id=order_id)
+
     def get_allowed_buying_power_balance(self, updated=True, minus=25000):
         power = self.get_buying_power_balance(updated=updated)
         allowed = power - minus
@@ -132,25 +254,24 @@ class AlpakaTrader(Trader):
     def get_buying_power_balance(self, updated=True) -> float:
         if updated:
             self.alpaka_account_info = self._get_alpaka_account()
-            print(self.alpaka_account_info)
+            logger.debug("account_updated", buying_power=self.alpaka_account_info.buying_power)
         return float(self.alpaka_account_info.buying_power)
 
     def buy_market_order(self, symbol: str, order_data: OrderData) -> BuyData:
         """Buy at any price immediately"""
-        resp = self.authorized_alpaka_api.submit_order(
+        resp = self._submit_order(
             symbol=symbol,
             qty=order_data.quantity,
             side='buy',
             type="market",
             time_in_force='gtc'
         )
-        print(resp)
         return resp
 
     def buy_limit_order(self, symbol: str, order_data: OrderData) -> BuyData:
         """buy at a limit"""
         limit_price = str(order_data.limit_price)
-        resp = self.authorized_alpaka_api.submit_order(
+        resp = self._submit_order(
             symbol=symbol,
             qty=order_data.quantity,
             side='buy',
@@ -164,7 +285,7 @@ class AlpakaTrader(Trader):
         """Buy stop limit"""
         limit_price = str(order_data.limit_price)
         stop_price = str(order_data.stop_price)
-        resp = self.authorized_alpaka_api.submit_order(
+        resp = self._submit_order(
             symbol=symbol,
             qty=order_data.quantity,
             side='buy',
@@ -176,20 +297,19 @@ class AlpakaTrader(Trader):
         return resp
 
     def sell_market_order(self, symbol: str, order_data: OrderData) -> SellData:
-        resp = self.authorized_alpaka_api.submit_order(
+        resp = self._submit_order(
             symbol=symbol,
             qty=order_data.quantity,
             side='sell',
             type="market",
             time_in_force='gtc'
         )
-        print(resp)
         return resp
 
     def sell_limit_order(self, symbol: str, order_data: OrderData) -> SellData:
         """Sell Limit order"""
         limit_price = str(order_data.limit_price)
-        resp = self.authorized_alpaka_api.submit_order(
+        resp = self._submit_order(
             symbol=symbol,
             qty=order_data.quantity,
             side='sell',
@@ -202,7 +322,7 @@ class AlpakaTrader(Trader):
     def sell_stop_limit_order(self, symbol: str, order_data: OrderData) -> SellData:
         limit_price = str(order_data.limit_price)
         stop_price = str(order_data.stop_price)
-        resp = self.authorized_alpaka_api.submit_order(
+        resp = self._submit_order(
             symbol=symbol,
             qty=order_data.quantity,
             side='sell',
@@ -211,8 +331,7 @@ class AlpakaTrader(Trader):
             limit_price=limit_price,
             stop_price=stop_price
         )
-        print(resp)
-        return SellData()
+        return resp
 
     def sell_status(self, sell_data: SellData) -> bool:
         pass
@@ -222,24 +341,22 @@ class AlpakaTrader(Trader):
 
     def get_order_data(self, order_id: str):
         try:
-            resp = self.authorized_alpaka_api.get_order(order_id=order_id)
-            print(resp)
+            resp = self._get_order(order_id)
+            logger.debug("order_fetched", order_id=order_id, status=resp.status, filled_qty=resp.filled_qty)
             return resp
         except Exception as e:
-            print(e)
-            print("ORDER DATA FETCHING FAILED")
+            logger.error("order_fetch_failed", order_id=order_id, error=e)
             return None
         # return res
 
     def cancel_order(self, order_id: str):
         """Use order id to cancel the order"""
         try:
-            self.authorized_alpaka_api.cancel_order(order_id=order_id)
-            print("CANCEL ORDER: SUCCESS")
+            self._cancel_order(order_id)
+            logger.info("order_canceled", order_id=order_id)
             return True
         except Exception as e:
-            print(e)
-            print("CANCEL ORDER: ORDER NOT FOUND")
+            logger.warning("order_cancel_failed", order_id=order_id, error=e, reason="order not found")
             return False
 
     def get_order_status(self, order_id: str, order_data: alpaca_trade_api.rest.Order = None):
@@ -289,6 +406,324 @@ class AlpakaTrader(Trader):
         print(self.authorized_alpaka_api.list_orders(status=status))
 
 
+class SchedulingTrader(AlpakaTrader):
+    """
+    AlpakaTrader sending its REST calls through an OrderScheduler, so bursts of orders stay within the account's
+    rate limit and cancels and sells go before new buys. Calls still block until answered, so the strategies keep
+    using the returned orders
+    """
+
+    def __init__(self, max_parallel_requests=8, scheduler: OrderScheduler = None, stats_log_sec=60):
+        """
+        :param scheduler: defaults to the whole alpaca limit. Give each process trading on an account its share
+        :param stats_log_sec: interval of the queue time stats logs
+        """
+        super().__init__(max_parallel_requests=max_parallel_requests)
+        self.scheduler = scheduler if scheduler is not None else OrderScheduler()
+        self.scheduler.start()
+        self.scheduler.start_periodic_log(interval_sec=stats_log_sec)
+
+    def _get_alpaka_account(self):
+        return self.scheduler.call(LANE_QUERY, super()._get_alpaka_account, key=("account",))
+
+    def _send_order(self, **order_params):
+        lane = LANE_SELL if order_params.get('side') == 'sell' else LANE_BUY
+        # Two equal orders are two orders, unless the caller gave them the same client_order_id
+        client_order_id = order_params.get('client_order_id')
+        key = ("submit", client_order_id) if client_order_id is not None else None
+        return self.scheduler.call(lane, lambda: super(SchedulingTrader, self)._send_order(**order_params), key=key)
+
+    def _cancel_order(self, order_id: str):
+        return self.scheduler.call(LANE_CANCEL, lambda: super(SchedulingTrader, self)._cancel_order(order_id),
+                                   key=("cancel", order_id))
+
+    def _get_order(self, order_id: str):
+        return self.scheduler.call(LANE_QUERY, lambda: super(SchedulingTrader, self)._get_order(order_id),
+                                   key=("order", order_id))
+
+
+class SimulatedOrder:
+    """Order with the attributes of an alpaka order which the strategies read"""
+    __slots__ = ("id", "symbol", "side", "type", "qty", "limit_price", "stop_price", "status", "filled_qty",
+                 "filled_avg_price", "submitted_at", "active_at", "cancel_at", "stop_triggered", "reserved")
+
+    def __init__(self, order_id: str, symbol: str, side: str, order_type: str, qty: int, limit_price: float,
+                 stop_price: float, submitted_at: int, active_at: int):
+        self.id = order_id
+        self.symbol = symbol
+        self.side = side
+        self.type = order_type
+        self.qty = qty
+        self.limit_price = limit_price
+        self.stop_price = stop_price
+        self.status = "new"
+        self.filled_qty = 0
+        self.filled_avg_price = None
+        self.submitted_at = submitted_at
+        self.active_at = active_at
+        self.cancel_at = None
+        self.stop_triggered = False
+        self.reserved = 0.0
+
+
+@dataclasses.dataclass
+class SimulatedAccount:
+    buying_power: float
+    cash: float
+
+
+class SimulatedTrader(Trader):
+    """
+    In process trader filling orders against the bars it is fed (polygon aggregate dicts, see on_bar).
+    Orders and cancels take effect latency_ms after the simulated time they were sent at, so a bar starting
+    before that can not fill them. Market and triggered stop orders pay the slippage, limit prices are never
+    crossed. Buying power is the cash minus what open buy orders reserve.
+    """
+
+    def __init__(self, initial_cash=100000.0, latency_ms=100, slippage_per_share=0.0, slippage_bps=0.0,
+                 max_volume_participation=None, trading_hours_start="06:03:00", trading_hours_end="14:55:00"):
+        """
+        :param latency_ms: delay between sending an order or cancel and the exchange acting on it
+        :param slippage_per_share: price added to buys and removed from sells of market and triggered stop orders
+        :param slippage_bps: slippage proportional to the price, in basis points. Added to slippage_per_share
+        :param max_volume_participation: fraction of a bar volume an order can fill. None fills it completely
+        """
+        from data_processor import TimeRangeCreator
+        self.cash = initial_cash
+        self.latency_ms = latency_ms
+        self.slippage_per_share = slippage_per_share
+        self.slippage_bps = slippage_bps
+        self.max_volume_participation = max_volume_participation
+        self.alpaka_cal_trading_hours = TimeRangeCreator(start_time=trading_hours_start, end_time=trading_hours_end,
+                                                         interval_sec=60).get_range()
+        self.alpaka_account_info = SimulatedAccount(buying_power=initial_cash, cash=initial_cash)
+        self.now_ms = 0
+        self.last_price: Dict[str, float] = {}
+        self.orders: Dict[str, SimulatedOrder] = {}
+        self.open_orders: Dict[str, List[SimulatedOrder]] = {}
+        self.positions: Dict[str, int] = {}
+        self.reserved_cash = 0.0
+        self.order_ids = itertools.count(1)
+
+    # Market data
+
+    def set_time(self, timestamp_ms: int):
+        self.now_ms = timestamp_ms
+
+    def on_bar(self, bar: dict, symbol: str):
+        """
+        Match the open orders of the symbol against a bar. Same params as the aggregate listeners.
+        The clock moves to the end of the bar: the strategy sees the bar once it is closed, so the orders it sends
+        then can only fill in later bars
+        :param bar: polygon aggregate with o, h, l, c, v, s (start ms), e (end ms)
+        """
+        end_ms = bar.get('e', bar['s'])
+        if end_ms > self.now_ms:
+            self.now_ms = end_ms
+        self.last_price[symbol] = bar['c']
+        open_orders = self.open_orders.get(symbol)
+        if not open_orders:
+            return
+        still_open = []
+        for order in open_orders:
+            self._match(order, bar)
+            if order.status == "new" or order.status == "partially_filled":
+                still_open.append(order)
+        if still_open:
+            self.open_orders[symbol] = still_open
+        else:
+            del self.open_orders[symbol]
+
+    def on_quote(self, symbol: str, price: float, timestamp_ms: int):
+        """Trade or quote price as a bar with a single price"""
+        self.on_bar({'o': price, 'h': price, 'l': price, 'c': price, 'v': None, 's': timestamp_ms, 'e': timestamp_ms},
+                    symbol)
+
+    def _slippage(self, price: float):
+        return self.slippage_per_share + price * self.slippage_bps / 10000
+
+    def _match(self, order: SimulatedOrder, bar: dict):
+        if order.cancel_at is not None and order.cancel_at <= bar['s']:
+            self._close(order, "canceled")
+            return
+        if order.active_at > bar['s']:
+            return
+        buy = order.side == 'buy'
+        if order.type == "market":
+            price = bar['o'] + self._slippage(bar['o']) if buy else bar['o'] - self._slippage(bar['o'])
+        else:
+            price = None
+            if order.type == "stop_limit" and not order.stop_triggered:
+                if buy and bar['h'] >= order.stop_price:
+                    trigger = max(bar['o'], order.stop_price)
+                elif not buy and bar['l'] <= order.stop_price:
+                    trigger = min(bar['o'], order.stop_price)
+                else:
+                    return
+                order.stop_triggered = True
+                if buy:
+                    trigger += self._slippage(trigger)
+                    if trigger <= order.limit_price:
+                        price = trigger
+                    elif bar['l'] <= order.limit_price:
+                        # Triggered above the limit, the price came back to it later in the bar
+                        price = order.limit_price
+                else:
+                    trigger -= self._slippage(trigger)
+                    if trigger >= order.limit_price:
+                        price = trigger
+                    elif bar['h'] >= order.limit_price:
+                        price = order.limit_price
+                if price is None:
+                    return
+            if price is None:
+                # Resting limit order
+                if buy and bar['l'] <= order.limit_price:
+                    price = min(bar['o'], order.limit_price)
+                elif not buy and bar['h'] >= order.limit_price:
+                    price = max(bar['o'], order.limit_price)
+                else:
+                    return
+        qty = order.qty - order.filled_qty
+        if self.max_volume_participation is not None and bar['v'] is not None:
+            qty = min(qty, int(bar['v'] * self.max_volume_participation))
+            if qty <= 0:
+                return
+        self._fill(order, qty, round(price, 4))
+
+    def _fill(self, order: SimulatedOrder, qty: int, price: float):
+        filled_before = order.filled_qty
+        order.filled_qty += qty
+        order.filled_avg_price = price if filled_before == 0 else \
+            (order.filled_avg_price * filled_before + price * qty) / order.filled_qty
+        if order.side == 'buy':
+            self.cash -= price * qty
+            self.positions[order.symbol] = self.positions.get(order.symbol, 0) + qty
+        else:
+            self.cash += price * qty
+            self.positions[order.symbol] = self.positions.get(order.symbol, 0) - qty
+        if order.filled_qty >= order.qty:
+            self._close(order, "filled")
+        else:
+            order.status = "partially_filled"
+            self._reserve(order, order.limit_price if order.limit_price is not None else price)
+
+    def _reserve(self, order: SimulatedOrder, price: float):
+        """Cash held by an open buy order for its unfilled quantity"""
+        if order.side != 'buy':
+            return
+        self.reserved_cash -= order.reserved
+        order.reserved = (order.qty - order.filled_qty) * price
+        self.reserved_cash += order.reserved
+
+    def _close(self, order: SimulatedOrder, status: str):
+        order.status = status
+        self.reserved_cash -= order.reserved
+        order.reserved = 0.0
+
+    # Orders
+
+    def _submit(self, symbol: str, side: str, order_type: str, order_data: OrderData) -> SimulatedOrder:
+        order = SimulatedOrder(order_id=str(next(self.order_ids)), symbol=symbol, side=side, order_type=order_type,
+                               qty=int(order_data.quantity), limit_price=order_data.limit_price,
+                               stop_price=order_data.stop_price, submitted_at=self.now_ms,
+                               active_at=self.now_ms + self.latency_ms)
+        self.orders[order.id] = order
+        if order.qty <= 0:
+            order.status = "rejected"
+            return order
+        if side == 'buy':
+            price = order.limit_price if order.limit_price is not None else self.last_price.get(symbol)
+            if price is None:
+                # A market buy before any bar of the symbol: nothing to check the buying power against
+                order.status = "rejected"
+                logger.debug("simulated_order_rejected", symbol=symbol, qty=order.qty, reason="no price")
+                return order
+            if price * order.qty > self.cash - self.reserved_cash:
+                order.status = "rejected"
+                logger.debug("simulated_order_rejected", symbol=symbol, qty=order.qty, reason="buying power")
+                return order
+            self._reserve(order, price)
+        self.open_orders.setdefault(symbol, []).append(order)
+        return order
+
+    def buy_market_order(self, symbol: str, order_data: OrderData):
+        return self._submit(symbol, 'buy', "market", order_data)
+
+    def buy_limit_order(self, symbol: str, order_data: OrderData):
+        return self._submit(symbol, 'buy', "limit", order_data)
+
+    def buy_stop_limit_order(self, symbol: str, order_data: OrderData):
+        return self._submit(symbol, 'buy', "stop_limit", order_data)
+
+    def sell_market_order(self, symbol: str, order_data: OrderData):
+        return self._submit(symbol, 'sell', "market", order_data)
+
+    def sell_limit_order(self, symbol: str, order_data: OrderData):
+        return self._submit(symbol, 'sell', "limit", order_data)
+
+    def sell_stop_limit_order(self, symbol: str, order_data: OrderData):
+        return self._submit(symbol, 'sell', "stop_limit", order_data)
+
+    def cancel_order(self, order_id: str):
+        """Request the cancel. It takes effect after latency_ms unless the order fills first"""
+        order = self.orders.get(order_id)
+        if order is None or order.status not in ("new", "partially_filled"):
+            return False
+        if order.cancel_at is None:
+            order.cancel_at = self.now_ms + self.latency_ms
+        return True
+
+    def sell_status(self, sell_data: SimulatedOrder) -> bool:
+        return sell_data.status == "filled"
+
+    def buy_status(self, buy_data: SimulatedOrder) -> bool:
+        return buy_data.status == "filled"
+
+    def get_order_data(self, order_id: str):
+        return self.orders.get(order_id)
+
+    def get_order_status(self, order_id: str, order_data: SimulatedOrder = None):
+        order = self.orders.get(order_id) if order_data is None else order_data
+        return order.status if order is not None else None
+
+    def is_order_filled(self, order_id: str, order_data: SimulatedOrder = None):
+        status = self.get_order_status(order_id=order_id, order_data=order_data)
+        return status == "filled" or status == "partially_filled"
+
+    def get_filled_quantity(self, order_id: str, order_data: SimulatedOrder = None):
+        order = self.orders.get(order_id) if order_data is None else order_data
+        return order.filled_qty if order is not None else None
+
+    def get_requested_quantity(self, order_id: str, order_data: SimulatedOrder = None):
+        order = self.orders.get(order_id) if order_data is None else order_data
+        return order.qty if order is not None else None
+
+    def list_orders(self, status=None):
+        if status is None or status == "all":
+            return list(self.orders.values())
+        if status == "open":
+            return [order for orders in self.open_orders.values() for order in orders]
+        return [order for order in self.orders.values() if order.status == status]
+
+    # Account
+
+    def get_buying_power_balance(self, updated=True) -> float:
+        buying_power = self.cash - self.reserved_cash
+        if updated:
+            self.alpaka_account_info.buying_power = buying_power
+            self.alpaka_account_info.cash = self.cash
+        return buying_power
+
+    def get_allowed_buying_power_balance(self, updated=True, minus=25000):
+        allowed = self.get_buying_power_balance(updated=updated) - minus
+        return allowed if allowed > 0 else 0
+
+    def get_equity(self):
+        """Cash plus the positions valued at their last price"""
+        return self.cash + sum(qty * self.last_price.get(symbol, 0.0) for symbol, qty in self.positions.items())
+
+
 if __name__ == "__main__":
     # alpaka_trader = AlpakaTrader().set_credentials(AlpakaCreds())
     # alpaka_trader.cancel_order(order_id="8dc87e64-eba8-4f80-bd0d-d5a76680bac7")